@@ -1,14 +1,33 @@
+from __future__ import annotations
+
+import asyncio
 import logging
+import threading
+import time
 import numpy as np
 from PIL import Image
-from ultralytics import YOLO
-import supervision as sv
-from openai import AzureOpenAI
 import os
-from typing import Dict, Tuple, Optional
-import base64
-import io
-import httpx 
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Tuple, Optional
+
+from catalog import Catalog, CatalogSnapshot
+from utils import IMAGE_DECODE_MAX_SIZE
+from inference import (
+    BatchScheduler, InferencePool, InferenceWorker, is_inference_worker, start_inference_workers,
+    INFERENCE_PROCESSES, INFERENCE_WORKERS
+)
+from backends import get_class_names, load_model
+from metrics import AZURE_TOKENS, PROMPT_TOKENS, STAGE_SECONDS, time_stage
+from prompts import QA_PROMPT_VERSION, render_qa_prompt
+from tiling import TILED_INFERENCE, image_tiles, merge_tile_detections, tiling_version
+from llm_input import (
+    build_context, choose_detail, encode_vision_image, estimate_request_tokens, image_tokens, text_tokens, vision_size
+)
+
+# torch, ultralytics, supervision and openai take seconds to import; they are
+# imported where first used so the API process starts serving immediately
+if TYPE_CHECKING:
+    import supervision as sv
+    from ultralytics import YOLO
 
 # Clear proxy environment variables that might interfere with Azure client
 if 'HTTP_PROXY' in os.environ:
@@ -18,205 +37,415 @@ if 'HTTPS_PROXY' in os.environ:
 
 logger = logging.getLogger(__name__)
 
-#Uncomment this part
-# Azure OpenAI Configuration - Direct API Key
-# AZURE_API_KEY = ""
-# AZURE_ENDPOINT = ""
-# AZURE_DEPLOYMENT = ""
+# Azure OpenAI Configuration
+AZURE_API_KEY = os.getenv("AZURE_API_KEY", "")
+AZURE_ENDPOINT = os.getenv("AZURE_ENDPOINT", "")
+AZURE_DEPLOYMENT = os.getenv("AZURE_DEPLOYMENT", "")
+
+YOLO_MODEL_PATH = os.getenv("YOLO_MODEL_PATH", "yolov8n.pt")
+YOLO_CONFIDENCE = float(os.getenv("YOLO_CONFIDENCE", "0.25"))
+YOLO_IOU = float(os.getenv("YOLO_IOU", "0.7"))
+
+# Azure OpenAI request and connection pool settings
+GPT_MAX_COMPLETION_TOKENS = 8000
+GPT_PROMPT_VERSION = QA_PROMPT_VERSION  # Bump QA_PROMPT_VERSION whenever the Q&A prompt changes so cached answers are not reused
+AZURE_MAX_CONNECTIONS = int(os.getenv("AZURE_MAX_CONNECTIONS", "100"))
+AZURE_MAX_KEEPALIVE = int(os.getenv("AZURE_MAX_KEEPALIVE", "20"))
+AZURE_TIMEOUT = float(os.getenv("AZURE_TIMEOUT", "120"))
+
+# Import time of this module, the reference point for the reported cold-start time
+STARTED_AT = time.perf_counter()
+
+def record_usage(usage):
+    """
+    Record the prompt, cached prompt and completion tokens Azure reports for a call
+    """
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", None) or 0) if details else 0
+    AZURE_TOKENS.labels(kind="prompt").inc(usage.prompt_tokens)
+    AZURE_TOKENS.labels(kind="cached_prompt").inc(cached)
+    AZURE_TOKENS.labels(kind="completion").inc(usage.completion_tokens)
+    logger.info(f"Azure usage: {usage.prompt_tokens} prompt tokens ({cached} cached), {usage.completion_tokens} completion tokens")
 
 class AIServices:
     def __init__(self):
         self.model = None
+        self.backend = None
         self.box_annotator = None
+        self.inference_pool = None
+        self.batch_scheduler = None
         self.azure_client = None
-        self.construction_items = []
+        self.async_azure_client = None
+        self.catalog = None
+        self._allowlist_version = None
+        self.class_names = []
+        self.allowed_class_mask = np.zeros(0, dtype=bool)
+        self.allowed_class_ids = []
+        self.readiness = "warming"
+        self.cold_start_seconds = None
+        self._ready = threading.Event()
+        self._warmup_thread = None
+        self._warmup_lock = threading.Lock()
+    
+    def start_warmup(self):
+        """Load the models and clients in a background thread (only the first call starts it)"""
+        # Worker processes re-import the main module when started; they load their own model
+        if is_inference_worker():
+            return
         
-        self._initialize_services()
+        with self._warmup_lock:
+            if self._warmup_thread is None:
+                self._warmup_thread = threading.Thread(target=self._warm_up, name="warmup", daemon=True)
+                self._warmup_thread.start()
+    
+    def _warm_up(self):
+        """Initialize all services and run a first inference on every replica"""
+        warmup_started = time.perf_counter()
+        failed = False
+        try:
+            self._initialize_services()
+        except Exception as e:
+            logger.error(f"Warm-up failed: {e}")
+            failed = True
+        finally:
+            now = time.perf_counter()
+            self.cold_start_seconds = round(now - STARTED_AT, 3)
+            # A process without a model cannot detect anything; report it rather than "ready"
+            self.readiness = "failed" if failed or not self.is_model_loaded() else "ready"
+            # Waiting requests are released either way
+            self._ready.set()
+            log = logger.info if self.readiness == "ready" else logger.error
+            log(
+                f"Cold start: {self.readiness} {self.cold_start_seconds:.2f}s after import "
+                f"(warm-up {now - warmup_started:.2f}s, model loaded: {self.is_model_loaded()})"
+            )
+    
+    async def wait_until_ready(self):
+        """Start the warm-up if needed and wait for it to finish"""
+        self.start_warmup()
+        if not self._ready.is_set():
+            await asyncio.get_running_loop().run_in_executor(None, self._ready.wait)
+    
+    def is_ready(self) -> bool:
+        """Check if warm-up has finished"""
+        return self._ready.is_set()
     
     def _initialize_services(self):
         """Initialize AI services"""
         self._initialize_yolo()
         self._initialize_azure_openai()
-        self._initialize_construction_items()
+        self._initialize_catalog()
     
     def _initialize_yolo(self):
         """Initialize YOLOv8 - 11 model"""
         try:
-            self.model = YOLO('yolov8n.pt') #input the model path
+            if INFERENCE_PROCESSES > 0:
+                # The model lives in worker processes; the first one stands in for it here
+                self.model = InferenceWorker(YOLO_MODEL_PATH, self._worker_threads())
+                self.model.wait_ready()
+                self.backend = self.model.backend
+            else:
+                self.model, self.backend = load_model(YOLO_MODEL_PATH) #input the model path
+            import supervision as sv
             self.box_annotator = sv.BoxAnnotator(thickness=3) #input the thickness of the box
-            logger.info("YOLOv8 model loaded successfully")
+            logger.info(f"YOLOv8 model loaded successfully ({self.backend} backend) in {time.perf_counter() - STARTED_AT:.2f}s")
         except Exception as e:
             logger.error(f"Failed to load YOLOv8 model: {e}")
             self.model = None
+        
+        self._initialize_inference_pool()
+    
+    def _initialize_inference_pool(self):
+        """Initialize the pool of YOLO replicas used for inference"""
+        replicas = [self.model]
+        if isinstance(self.model, InferenceWorker):
+            # Started after the first worker so a model export only happens once
+            replicas.extend(start_inference_workers(INFERENCE_PROCESSES - 1, YOLO_MODEL_PATH, self._worker_threads()))
+        elif self.model is not None:
+            try:
+                for _ in range(INFERENCE_WORKERS - 1):
+                    replicas.append(load_model(YOLO_MODEL_PATH)[0])
+            except Exception as e:
+                logger.error(f"Failed to load YOLO replica: {e}")
+            
+            # Split the cores between replicas so they don't oversubscribe the CPU
+            import torch
+            torch.set_num_threads(max(1, (os.cpu_count() or 1) // len(replicas)))
+        
+        if self.model is not None:
+            # The first inference of each replica pays one-off setup costs; pay them before serving
+            warmup_started = time.perf_counter()
+            dummy = np.zeros((IMAGE_DECODE_MAX_SIZE * 3 // 4, IMAGE_DECODE_MAX_SIZE, 3), dtype=np.uint8)
+            for replica in replicas:
+                self._predict_batch(replica, [dummy])
+            logger.info(f"Warm-up inference on {len(replicas)} replica(s) took {time.perf_counter() - warmup_started:.2f}s")
+        
+        self.inference_pool = InferencePool(replicas)
+        self.batch_scheduler = BatchScheduler(self.inference_pool, self._predict_batch)
+        logger.info(f"Inference pool initialized with {len(replicas)} replica(s)")
+    
+    def _worker_threads(self) -> int:
+        """Split the cores between worker processes so they don't oversubscribe the CPU"""
+        return max(1, (os.cpu_count() or 1) // INFERENCE_PROCESSES)
+    
+    def _initialize_catalog(self):
+        """Initialize the construction items catalog"""
+        self.catalog = Catalog()
+        self.get_catalog()
     
     def _initialize_azure_openai(self):
         """Initialize Azure OpenAI client"""
         try:
             if AZURE_API_KEY and AZURE_ENDPOINT and AZURE_DEPLOYMENT:
+                import httpx
+                from openai import AzureOpenAI, AsyncAzureOpenAI
+                
                 # Create client with basic configuration
                 self.azure_client = AzureOpenAI(
                     api_key=AZURE_API_KEY,
                     azure_endpoint=AZURE_ENDPOINT,
                     api_version="2024-12-01-preview"
                 )
+                # Async client for streaming, sharing one keep-alive connection pool
+                self.async_azure_client = AsyncAzureOpenAI(
+                    api_key=AZURE_API_KEY,
+                    azure_endpoint=AZURE_ENDPOINT,
+                    api_version="2024-12-01-preview",
+                    http_client=httpx.AsyncClient(
+                        limits=httpx.Limits(
+                            max_connections=AZURE_MAX_CONNECTIONS,
+                            max_keepalive_connections=AZURE_MAX_KEEPALIVE
+                        ),
+                        timeout=httpx.Timeout(AZURE_TIMEOUT, connect=10.0)
+                    )
+                )
                 logger.info("Azure OpenAI client initialized successfully")
             else:
                 logger.warning("Azure OpenAI credentials not found")
                 self.azure_client = None
+                self.async_azure_client = None
         except Exception as e:
             logger.error(f"Failed to initialize Azure OpenAI: {e}")
             self.azure_client = None
+            self.async_azure_client = None
     
-    def _initialize_construction_items(self):
-        """Initialize construction items database"""
-        self.construction_items = [
-            {"object": "person", "unit_cost": 0, "supplier": ""}, #
-            # Structural Materials
-            {"object": "Drywall", "unit_cost": 0, "supplier": "https://homehardware.com/drywall"},
-            {"object": "Plywood", "unit_cost": 0, "supplier": "https://homedepot.com/plywood"},
-            {"object": "2x4 Lumber", "unit_cost": 0, "supplier": "https://lowes.com/lumber"},
-            {"object": "Concrete Block", "unit_cost": 0, "supplier": "https://menards.com/concrete-block"},
-            {"object": "Rebar", "unit_cost": 0, "supplier": "https://homedepot.com/rebar"},
-            
-            # Fixtures
-            {"object": "Ceiling Fan", "unit_cost": 0, "supplier": "https://homedepot.com/ceiling-fan"},
-            {"object": "Sink", "unit_cost": 0, "supplier": "https://lowes.com/sink"},
-            {"object": "Toilet", "unit_cost": 0, "supplier": "https://homedepot.com/toilet"},
-            {"object": "Shower Head", "unit_cost": 0, "supplier": "https://lowes.com/shower-head"},
-            {"object": "Faucet", "unit_cost": 0, "supplier": "https://homedepot.com/faucet"},
-            
-            # Electrical
-            {"object": "Light Switch", "unit_cost": 0, "supplier": "https://lowes.com/light-switch"},
-            {"object": "Outlet", "unit_cost": 0, "supplier": "https://homedepot.com/outlet"},
-            {"object": "Circuit Breaker", "unit_cost": 0, "supplier": "https://menards.com/circuit-breaker"},
-            {"object": "Wire (per ft)", "unit_cost": 0, "supplier": "https://homedepot.com/wire"},
-            {"object": "Light Fixture", "unit_cost": 0, "supplier": "https://lowes.com/light-fixture"},
-            
-            # Plumbing
-            {"object": "PVC Pipe", "unit_cost": 0, "supplier": "https://homedepot.com/pvc-pipe"},
-            {"object": "Copper Pipe", "unit_cost": 0, "supplier": "https://lowes.com/copper-pipe"},
-            {"object": "PEX Pipe", "unit_cost": 0, "supplier": "https://menards.com/pex-pipe"},
-            {"object": "Pipe Fitting", "unit_cost": 0, "supplier": "https://homedepot.com/pipe-fitting"},
-            {"object": "Valve", "unit_cost": 0, "supplier": "https://lowes.com/valve"},
-            
-            # Tools
-            {"object": "Hammer", "unit_cost": 0, "supplier": "https://homedepot.com/hammer"},
-            {"object": "Drill", "unit_cost": 0, "supplier": "https://lowes.com/drill"},
-            {"object": "Saw", "unit_cost": 0, "supplier": "https://menards.com/saw"},
-            {"object": "Wrench", "unit_cost": 0, "supplier": "https://homedepot.com/wrench"},
-            {"object": "Screwdriver", "unit_cost": 0, "supplier": "https://lowes.com/screwdriver"},
-            
-            # Safety Equipment
-            {"object": "Hard Hat", "unit_cost": 0, "supplier": "https://homedepot.com/hard-hat"},
-            {"object": "Safety Glasses", "unit_cost": 0, "supplier": "https://lowes.com/safety-glasses"},
-            {"object": "Work Gloves", "unit_cost": 0, "supplier": "https://menards.com/work-gloves"},
-            {"object": "Safety Vest", "unit_cost": 0, "supplier": "https://homedepot.com/safety-vest"},
-            {"object": "Steel Toe Boots", "unit_cost": 0, "supplier": "https://lowes.com/steel-toe-boots"},
-            
-            # Fasteners
-            {"object": "Nails", "unit_cost": 0, "supplier": "https://homedepot.com/nails"},
-            {"object": "Screws", "unit_cost": 0, "supplier": "https://lowes.com/screws"},
-            {"object": "Bolts", "unit_cost": 0, "supplier": "https://menards.com/bolts"},
-            {"object": "Washers", "unit_cost": 0, "supplier": "https://homedepot.com/washers"},
-            {"object": "Nuts", "unit_cost": 0, "supplier": "https://lowes.com/nuts"},
-            
-            # Adhesives & Sealants
-            {"object": "Construction Adhesive", "unit_cost": 0, "supplier": "https://homedepot.com/construction-adhesive"},
-            {"object": "Silicone Caulk", "unit_cost": 0, "supplier": "https://lowes.com/silicone-caulk"},
-            {"object": "Spray Foam", "unit_cost": 0, "supplier": "https://menards.com/spray-foam"},
-            {"object": "Liquid Nails", "unit_cost": 0, "supplier": "https://homedepot.com/liquid-nails"},
-            {"object": "Gorilla Glue", "unit_cost": 0, "supplier": "https://lowes.com/gorilla-glue"},
-            
-            # Concrete and Masonry
-            {"object": "Concrete Mix", "unit_cost": 0, "supplier": "https://homedepot.com/concrete-mix"},
-            {"object": "Mortar", "unit_cost": 0, "supplier": "https://lowes.com/mortar"},
-            {"object": "Bricks", "unit_cost": 0, "supplier": "https://menards.com/bricks"},
-            {"object": "Sand", "unit_cost": 0, "supplier": "https://homedepot.com/sand"},
-            {"object": "Gravel", "unit_cost": 0, "supplier": "https://lowes.com/gravel"},
-            
-            # Insulation
-            {"object": "Fiberglass Insulation", "unit_cost": 0, "supplier": "https://homedepot.com/insulation"},
-            {"object": "Foam Board", "unit_cost": 0, "supplier": "https://lowes.com/foam-board"},
-            {"object": "Spray Foam", "unit_cost": 0, "supplier": "https://menards.com/spray-foam"},
-            {"object": "Vapor Barrier", "unit_cost": 0, "supplier": "https://homedepot.com/vapor-barrier"},
-            {"object": "Weather Stripping", "unit_cost": 0, "supplier": "https://lowes.com/weather-stripping"},
-            
-            # Cabinetry
-            {"object": "Kitchen Cabinet", "unit_cost": 0, "supplier": "https://homedepot.com/kitchen-cabinet"},
-            {"object": "Bathroom Vanity", "unit_cost": 0, "supplier": "https://lowes.com/bathroom-vanity"},
-            {"object": "Drawer Slides", "unit_cost": 0, "supplier": "https://menards.com/drawer-slides"},
-            {"object": "Cabinet Knob", "unit_cost": 0, "supplier": "https://homedepot.com/cabinet-knob"},
-            {"object": "Pantry Shelf", "unit_cost": 0, "supplier": "https://lowes.com/pantry-shelf"},
-            
-            # Flooring
-            {"object": "Hardwood Flooring", "unit_cost": 0, "supplier": "https://homedepot.com/hardwood-flooring"},
-            {"object": "Laminate Flooring", "unit_cost": 0, "supplier": "https://lowes.com/laminate-flooring"},
-            {"object": "Vinyl Plank", "unit_cost": 0, "supplier": "https://menards.com/vinyl-plank"},
-            {"object": "Carpet (sq yd)", "unit_cost": 0, "supplier": "https://homedepot.com/carpet"},
-            {"object": "Underlayment", "unit_cost": 0, "supplier": "https://lowes.com/underlayment"},
-            
-            # Additional items
-            {"object": "Drywall Screws", "unit_cost": 0, "supplier": "https://homedepot.com/drywall-screws"},
-            {"object": "Joint Compound", "unit_cost": 0, "supplier": "https://lowes.com/joint-compound"},
-            {"object": "Tape Measure", "unit_cost": 0, "supplier": "https://menards.com/tape-measure"},
-            {"object": "Level", "unit_cost": 0, "supplier": "https://homedepot.com/level"},
-            {"object": "Utility Knife", "unit_cost": 0, "supplier": "https://lowes.com/utility-knife"},
-        ]
-        logger.info(f"Construction items database initialized with {len(self.construction_items)} items")
+    async def find_objects_async(self, image: Image.Image, tiled: bool = False) -> Tuple[sv.Detections, Dict[str, int]]:
+        """
+        Find construction items through the batch scheduler without blocking the event loop.
+        
+        Tiled images are split into overlapping tiles that are scheduled together,
+        so they share micro-batches and spread over the replicas.
+        """
+        import supervision as sv
+        
+        if self.model is None:
+            return sv.Detections.empty(), {}
+        
+        self.get_catalog()
+        image_np = await asyncio.get_running_loop().run_in_executor(None, np.array, image)
+        if tiled:
+            tiles = image_tiles(image_np)
+            with time_stage("inference"):
+                results = await asyncio.gather(*(self.batch_scheduler.submit(tile) for tile, _ in tiles))
+            with time_stage("tile_merge"):
+                detections = merge_tile_detections(results, [offset for _, offset in tiles])
+        else:
+            with time_stage("inference"):
+                detections = await self.batch_scheduler.submit(image_np)
+        with time_stage("filter"):
+            return self._filter_detections(detections)
     
-    def detect_objects(self, image: Image.Image) -> Tuple[Image.Image, Dict[str, int]]:
+    def detect_objects(self, image: Image.Image, model: Optional[YOLO] = None, tiled: bool = False) -> Tuple[Image.Image, Dict[str, int]]:
         """
         Detect objects in image using YOLOv8 -11
         """
-        if self.model is None:
+        if model is None:
+            model = self.model
+        if model is None:
             return image, {}
         
         try:
+            self.get_catalog()
             image_np = np.array(image)
-            results = self.model(image_np)
-           
-            if len(results[0].boxes) > 0:
-                detections = sv.Detections(
-                    xyxy=results[0].boxes.xyxy.cpu().numpy(),
-                    confidence=results[0].boxes.conf.cpu().numpy(),
-                    class_id=results[0].boxes.cls.cpu().numpy().astype(int)
-                )
-                
-                construction_item_names = [item["object"] for item in self.construction_items]
-                filtered_detections = []
-                
-                for i in range(len(detections)):
-                    class_name = self.model.model.names[detections.class_id[i]]
-                    if class_name in construction_item_names:
-                        filtered_detections.append((
-                            detections.xyxy[i],
-                            detections.confidence[i],
-                            detections.class_id[i]
-                        ))
-                
-                if filtered_detections:
-                    annotated_image = self.box_annotator.annotate(
-                        scene=image_np.copy(),
-                        detections=sv.Detections(
-                            xyxy=np.array([d[0] for d in filtered_detections]),
-                            confidence=np.array([d[1] for d in filtered_detections]),
-                            class_id=np.array([d[2] for d in filtered_detections])
-                        )
-                    )
-                    
-                    detected_items = {}
-                    for _, _, class_id in filtered_detections:
-                        class_name = self.model.model.names[class_id]
-                        detected_items[class_name] = detected_items.get(class_name, 0) + 1
-                    
-                    return Image.fromarray(annotated_image), detected_items
-            
-            return image, {}
+            if tiled:
+                # All tiles in one forward pass
+                tiles = image_tiles(image_np)
+                results = self._predict_batch(model, [tile for tile, _ in tiles])
+                detections = merge_tile_detections(results, [offset for _, offset in tiles])
+            else:
+                detections = self._predict_batch(model, [image_np])[0]
+            detections, detected_items = self._filter_detections(detections)
+            return self.annotate_image(image, detections), detected_items
             
         except Exception as e:
             logger.error(f"Error in object detection: {e}")
             return image, {}
     
+    def _predict_batch(self, model: YOLO, images: List[np.ndarray]) -> List[sv.Detections]:
+        """
+        Run one batched forward pass and split the results per image
+        """
+        import supervision as sv
+        
+        # Only keep construction item classes so NMS never runs on irrelevant boxes
+        if isinstance(model, InferenceWorker):
+            return [
+                sv.Detections(xyxy=xyxy, confidence=confidence, class_id=class_id)
+                for xyxy, confidence, class_id in model.predict(
+                    images, conf=YOLO_CONFIDENCE, iou=YOLO_IOU, classes=self.allowed_class_ids
+                )
+            ]
+        
+        results = model(images, conf=YOLO_CONFIDENCE, iou=YOLO_IOU, classes=self.allowed_class_ids)
+        
+        batch_detections = []
+        for result in results:
+            batch_detections.append(sv.Detections(
+                xyxy=result.boxes.xyxy.cpu().numpy(),
+                confidence=result.boxes.conf.cpu().numpy(),
+                class_id=result.boxes.cls.cpu().numpy().astype(int)
+            ))
+        return batch_detections
+    
+    def _filter_detections(self, detections: sv.Detections) -> Tuple[sv.Detections, Dict[str, int]]:
+        """
+        Keep only construction item detections and count them per class
+        """
+        import supervision as sv
+        
+        if len(detections) == 0:
+            return sv.Detections.empty(), {}
+        
+        detections = detections[self.allowed_class_mask[detections.class_id]]
+        if len(detections) == 0:
+            return sv.Detections.empty(), {}
+        
+        counts = np.bincount(detections.class_id, minlength=len(self.class_names))
+        detected_items = {self.class_names[class_id]: int(counts[class_id]) for class_id in np.flatnonzero(counts)}
+        return detections, detected_items
+    
+    def _build_class_allowlist(self, catalog: CatalogSnapshot):
+        """
+        Precompute which model classes are construction items
+        """
+        self._allowlist_version = catalog.version
+        if self.model is None:
+            return
+        
+        names = get_class_names(self.model)
+        class_names = [names[class_id] for class_id in range(len(names))]
+        allowed_class_mask = np.array([catalog.lookup(name) is not None for name in class_names], dtype=bool)
+        
+        self.class_names = class_names
+        self.allowed_class_ids = np.flatnonzero(allowed_class_mask).tolist()
+        self.allowed_class_mask = allowed_class_mask
+        logger.info(f"{len(self.allowed_class_ids)} of {len(class_names)} model classes are construction items")
+    
+    def annotate_image(self, image: Image.Image, detections: sv.Detections) -> Image.Image:
+        """
+        Draw detection boxes on a copy of the image
+        """
+        if len(detections) == 0:
+            return image
+        
+        return Image.fromarray(self.annotate_array(image, detections))
+    
+    def annotate_array(self, image: Image.Image, detections: sv.Detections) -> np.ndarray:
+        """
+        Draw detection boxes on a copy of the image, returned as an RGB array for encode_image
+        """
+        scene = np.array(image)
+        if len(detections) == 0:
+            return scene
+        return self.box_annotator.annotate(scene=scene, detections=detections)
+    
+    def get_detection_version(self, catalog: Optional[CatalogSnapshot] = None, tiling: str = TILED_INFERENCE) -> str:
+        """
+        Get a version string for detection results (model weights, backend, thresholds, tiling and catalog)
+        """
+        catalog = catalog or self.get_catalog()
+        return (
+            f"{YOLO_MODEL_PATH}:backend={self.backend}:conf={YOLO_CONFIDENCE}:iou={YOLO_IOU}:decode={IMAGE_DECODE_MAX_SIZE}"
+            f":tiling={tiling_version(tiling)}:catalog={catalog.version}"
+        )
+    
+    def _build_gpt_prompts(self, question: str, detected_items: Dict[str, int], cost_breakdown: list, total_cost: float) -> Tuple[str, str, str]:
+        """
+        Build the system prompt, request context and question text for a Q&A request
+        """
+        # Build context, summarized to fit the token budget when there are many items
+        objects_str, cost_breakdown_str = build_context(detected_items, cost_breakdown)
+        return render_qa_prompt(question, objects_str, cost_breakdown_str, total_cost)
+    
+    def _build_gpt_messages(self, image: Image.Image, question: str, detected_items: Dict[str, int], cost_breakdown: list, total_cost: float) -> List[dict]:
+        """
+        Build the chat messages for a Q&A request
+        """
+        # Send the image at the size the vision model looks at, not the upload resolution
+        base64_image, image_size, detail = encode_vision_image(image)
+        
+        system_prompt, context, question_text = self._build_gpt_prompts(question, detected_items, cost_breakdown, total_cost)
+        
+        prompt_text_tokens = text_tokens(system_prompt) + text_tokens(context) + text_tokens(question_text)
+        prompt_image_tokens = image_tokens(image_size, detail)
+        PROMPT_TOKENS.observe(prompt_text_tokens + prompt_image_tokens)
+        logger.info(
+            f"Q&A prompt for {AZURE_DEPLOYMENT}: ~{prompt_text_tokens + prompt_image_tokens} tokens "
+            f"(text {prompt_text_tokens}, image {prompt_image_tokens} at {image_size[0]}x{image_size[1]} {detail} detail, "
+            f"{len(detected_items)} item types, {len(cost_breakdown)} cost lines)"
+        )
+        
+        return [
+            {"role": "system", "content": system_prompt},
+            {
+                "role": "user",
+                # Most stable first, so questions about the same photo share the cached prefix
+                "content": [
+                    {"type": "text", "text": context},
+                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}", "detail": detail}},
+                    {"type": "text", "text": question_text}
+                ]
+            }
+        ]
+    
+    def estimate_gpt_tokens(self, image_size: Tuple[int, int], question: str, detected_items: Dict[str, int], cost_breakdown: list, total_cost: float) -> int:
+        """
+        Estimate the tokens a Q&A request counts against the Azure tokens-per-minute quota
+        """
+        prompts = self._build_gpt_prompts(question, detected_items, cost_breakdown, total_cost)
+        detail = choose_detail(image_size)
+        return estimate_request_tokens(list(prompts), vision_size(image_size, detail), GPT_MAX_COMPLETION_TOKENS, detail)
+    
+    def prepare_gpt_request(self, image: Image.Image, question: str, detected_items: Dict[str, int], cost_breakdown: list, total_cost: float) -> Tuple[List[dict], int]:
+        """
+        Build the chat messages for a Q&A request and estimate their tokens, for the Q&A job queue
+        """
+        with time_stage("prompt"):
+            messages = self._build_gpt_messages(image, question, detected_items, cost_breakdown, total_cost)
+        return messages, self.estimate_gpt_tokens(image.size, question, detected_items, cost_breakdown, total_cost)
+    
+    async def complete_gpt_messages(self, messages: List[dict]) -> str:
+        """
+        Send prepared chat messages to Azure once, raising on failure.
+        
+        Client retries are disabled: the Q&A job queue retries rate-limited and
+        failed calls itself, within the deployment's quota.
+        """
+        if not self.async_azure_client:
+            raise RuntimeError("Azure OpenAI service not available. Please check your API credentials.")
+        
+        with time_stage("azure"):
+            response = await self.async_azure_client.with_options(max_retries=0).chat.completions.create(
+                model=AZURE_DEPLOYMENT,  # Use deployment name as model
+                messages=messages,
+                max_completion_tokens=GPT_MAX_COMPLETION_TOKENS
+            )
+        
+        record_usage(response.usage)
+        return response.choices[0].message.content.strip()
+    
     def get_gpt_response(self, image: Image.Image, question: str, detected_items: Dict[str, int], cost_breakdown: list, total_cost: float) -> str:
         """
         Get GPT response for Q&A with enhanced analysis
@@ -225,115 +454,95 @@ class AIServices:
             return "Azure OpenAI service not available. Please check your API credentials."
         
         try:
-            # Convert image to base64
-            buffered = io.BytesIO()
-            image.save(buffered, format="JPEG")
-            base64_image = base64.b64encode(buffered.getvalue()).decode()
-            
-            # Build context
-            objects_str = ", ".join([f"{k} ({v})" for k, v in detected_items.items()]) if detected_items else "None"
-            
-            cost_lines = []
-            for item in cost_breakdown:
-                cost_lines.append(f"- {item['object']}: {item['quantity']} x ${item['unit_cost']} = ${item['total_cost']} (Supplier: {item['supplier']})")
-            cost_breakdown_str = "\n".join(cost_lines) if cost_lines else "No cost items detected."
-            
-            # Enhanced system prompt with detailed analysis requirements
-            system_prompt = f"""
-You are a professional construction cost estimator and consultant. Analyze the image and provide comprehensive cost analysis.
-
-First, provide a clear and concise description of what you see in the image (detected objects, scene, and context). Then continue with the following analysis:
-
-The following construction objects were detected in the image:
-{objects_str}
-
-Here is the cost breakdown for these items:
-{cost_breakdown_str}
-
-The total estimated cost is: ${total_cost}
-
-Your analysis should include:
-
-1. **LABOR ANALYSIS** (use appropriate rates for different trades):
-   - **General Labor**: $25-35/hr (basic tasks, moving materials, cleanup)
-   - **Carpentry**: $45-65/hr (woodwork, framing, trim work)
-   - **Electrical**: $65-85/hr (wiring, installations, safety work)
-   - **Plumbing**: $60-80/hr (pipe work, fixtures, connections)
-   - **HVAC**: $70-90/hr (heating/cooling systems)
-   - **Roofing**: $40-60/hr (shingles, repairs, maintenance)
-   - **Painting**: $35-55/hr (interior/exterior painting)
-   - **Masonry**: $50-70/hr (brick, concrete, stone work)
-   - **Flooring**: $45-65/hr (installation, repairs)
-   - **Specialized Equipment**: $75-100/hr (heavy machinery, specialized tools)
-   
-   - List each task with estimated hours and appropriate labor rate
-   - Calculate total labor hours per task
-   - Calculate total labor cost (hours × appropriate rate)
-
-2. **MATERIALS ANALYSIS** (SEARCH THE WEB FOR CURRENT PRICES):
-   - For each detected item, search the internet for current market prices
-   - Search major retailers like Home Depot, Lowe's, Menards, Amazon, etc.
-   - Get real-time pricing for the specific items detected
-   - List all required materials with current quantities and unit costs
-   - Calculate total materials cost using current market prices
-   - Include direct supplier links where available
-
-3. **SUMMARY**:
-   - Labor cost (broken down by trade if applicable)
-   - Materials cost (using current web-sourced prices)
-   - Grand total (Labor + Materials)
-
-4. **CRITICAL THINKING & DECISION MAKING**:
-   - Cost optimization suggestions based on current market prices
-   - Alternative materials or methods with price comparisons
-   - Quality vs. cost trade-offs using real market data
-   - Timeline considerations
-   - Risk assessment
-
-5. **ITEM-SPECIFIC ANALYSIS**:
-   - For each detected item, search and provide current market prices
-   - Include direct supplier links for purchasing
-   - Suggest alternatives or upgrades with price comparisons
-   - Provide multiple supplier options when available
-
-IMPORTANT: Start your response with a description of what you see in the image. Then, search the web for current, real-time prices for each detected item. Do not use estimated or outdated prices. Get actual current market prices from major retailers and suppliers.
-
-Be specific, actionable, and provide detailed calculations using current web-sourced prices. Format your response clearly with sections for Description, Labor, Materials, Summary, and Recommendations.
-"""
-            
-            user_prompt = f"User question: {question}\n\nPlease analyze the image and provide a comprehensive cost estimate with detailed breakdowns for labor, materials, and total costs. Include supplier links and recommendations for cost optimization."
-            
-            logger.info(f"Using Azure deployment: {AZURE_DEPLOYMENT}")
-            logger.info(f"Detected items: {detected_items}")
-            logger.info(f"Cost breakdown: {cost_breakdown}")
-            logger.info(f"Total cost: {total_cost}")
-             
-            response = self.azure_client.chat.completions.create(
-                model=AZURE_DEPLOYMENT,  # Use deployment name as model
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": user_prompt},
-                            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
-                        ]
-                    }
-                ],
-                max_completion_tokens=8000  # Increased for more complete responses
-            )
-            
-            return response.choices[0].message.content.strip()
-            
+            return self.request_gpt_response(image, question, detected_items, cost_breakdown, total_cost)
         except Exception as e:
             logger.error(f"Error getting GPT response: {e}")
             return f"Error: Unable to get GPT response. {str(e)}"
     
+    def request_gpt_response(self, image: Image.Image, question: str, detected_items: Dict[str, int], cost_breakdown: list, total_cost: float) -> str:
+        """
+        Request a GPT response, raising on failure
+        """
+        with time_stage("prompt"):
+            messages = self._build_gpt_messages(image, question, detected_items, cost_breakdown, total_cost)
+        with time_stage("azure"):
+            response = self.azure_client.chat.completions.create(
+                model=AZURE_DEPLOYMENT,  # Use deployment name as model
+                messages=messages,
+                max_completion_tokens=GPT_MAX_COMPLETION_TOKENS  # Increased for more complete responses
+            )
+        
+        record_usage(response.usage)
+        return response.choices[0].message.content.strip()
+    
+    async def stream_gpt_response(self, image: Image.Image, question: str, detected_items: Dict[str, int], cost_breakdown: list, total_cost: float) -> AsyncIterator[str]:
+        """
+        Stream GPT response tokens for Q&A as they are generated
+        """
+        if not self.async_azure_client:
+            raise RuntimeError("Azure OpenAI service not available. Please check your API credentials.")
+        
+        # Image encoding is CPU-bound, keep it off the event loop
+        with time_stage("prompt"):
+            messages = await asyncio.get_running_loop().run_in_executor(
+                None, self._build_gpt_messages, image, question, detected_items, cost_breakdown, total_cost
+            )
+        
+        started = time.perf_counter()
+        stream = await self.async_azure_client.chat.completions.create(
+            model=AZURE_DEPLOYMENT,  # Use deployment name as model
+            messages=messages,
+            max_completion_tokens=GPT_MAX_COMPLETION_TOKENS,
+            stream=True,
+            stream_options={"include_usage": True}  # Usage arrives in a final chunk without choices
+        )
+        
+        first_token = True
+        async for chunk in stream:
+            if chunk.usage:
+                record_usage(chunk.usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first_token:
+                    STAGE_SECONDS.labels(stage="azure_first_token").observe(time.perf_counter() - started)
+                    first_token = False
+                yield chunk.choices[0].delta.content
+        STAGE_SECONDS.labels(stage="azure").observe(time.perf_counter() - started)
+    
+    async def close(self):
+        """
+        Release the inference pool and Azure connections
+        """
+        if self.inference_pool:
+            self.inference_pool.shutdown()
+        if self.async_azure_client:
+            await self.async_azure_client.close()
+    
+    def get_catalog(self) -> CatalogSnapshot:
+        """
+        Get the current catalog snapshot, refreshing the class allowlist if it changed
+        """
+        snapshot = self.catalog.snapshot()
+        if snapshot.version != self._allowlist_version:
+            self._build_class_allowlist(snapshot)
+        return snapshot
+    
     def get_construction_items(self) -> list:
         """
         Get construction items database
         """
-        return self.construction_items
+        return self.get_catalog().items
+    
+    def get_inference_stats(self) -> Dict[str, dict]:
+        """
+        Get inference pool and batching statistics
+        """
+        return {
+            "readiness": self.readiness,
+            "backend": self.backend,
+            "processes": INFERENCE_PROCESSES,
+            "pool": self.inference_pool.stats() if self.inference_pool else None,
+            "batching": self.batch_scheduler.stats() if self.batch_scheduler else None
+        }
     
     def is_model_loaded(self) -> bool:
         """
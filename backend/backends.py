@@ -0,0 +1,267 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+if TYPE_CHECKING:
+    import supervision as sv
+    from ultralytics import YOLO
+
+logger = logging.getLogger(__name__)
+
+# Inference backend configuration
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch").lower()
+INFERENCE_INT8 = os.getenv("INFERENCE_INT8", "false").lower() in ("1", "true", "yes")
+MODEL_EXPORT_DIR = os.getenv("MODEL_EXPORT_DIR", ".cache/models")
+MODEL_IMAGE_SIZE = int(os.getenv("MODEL_IMAGE_SIZE", "640"))
+# Images used to calibrate INT8 activation ranges (defaults to the ultralytics sample images)
+INT8_CALIBRATION_DIR = os.getenv("INT8_CALIBRATION_DIR", "")
+# Exported models must find at least this share of the PyTorch boxes (and vice versa)
+PARITY_MIN_MATCH = float(os.getenv("PARITY_MIN_MATCH", "0.9"))
+PARITY_IOU = 0.5
+
+BACKENDS = ("torch", "onnx", "openvino")
+
+
+def backend_name(backend: str = INFERENCE_BACKEND, int8: bool = INFERENCE_INT8) -> str:
+    """
+    Get the name of a backend configuration, e.g. "onnx-int8"
+    """
+    if backend == "torch" or not int8:
+        return backend
+    return f"{backend}-int8"
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def artifact_path(weights_path: str, backend: str, int8: bool) -> str:
+    """
+    Get the cache path of an exported model.
+
+    The path includes a hash of the source weights, the backend, the
+    quantization and the input size, so any change produces a new export.
+    """
+    stem = os.path.splitext(os.path.basename(weights_path))[0]
+    name = f"{stem}-{_file_hash(weights_path)}-{MODEL_IMAGE_SIZE}-{backend_name(backend, int8)}"
+    # The suffix tells ultralytics which runtime to load the artifact with
+    suffix = ".onnx" if backend == "onnx" else "_openvino_model"
+    return os.path.join(MODEL_EXPORT_DIR, name + suffix)
+
+
+def export_model(model_path: str, backend: str, int8: bool) -> str:
+    """
+    Export the PyTorch model for a backend, reusing a cached artifact if present
+    """
+    from ultralytics import YOLO
+
+    reference = YOLO(model_path)
+    target = artifact_path(reference.ckpt_path or model_path, backend, int8)
+    if os.path.exists(target):
+        return target
+
+    logger.info(f"Exporting {model_path} for {backend_name(backend, int8)}")
+    exported = reference.export(
+        format=backend,
+        imgsz=MODEL_IMAGE_SIZE,
+        dynamic=True,  # Allow batched predictions
+        int8=int8 and backend == "openvino"
+    )
+
+    os.makedirs(MODEL_EXPORT_DIR, exist_ok=True)
+    if backend == "onnx" and int8:
+        # ultralytics has no ONNX INT8 export; quantize with ONNX Runtime instead
+        _quantize_onnx(exported, target)
+        os.remove(exported)
+    else:
+        shutil.move(exported, target)
+
+    report = check_parity(reference, YOLO(target, task="detect"))
+    with open(f"{target}.parity.json", "w") as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Exported {target}: {report}")
+    return target
+
+
+def _calibration_images() -> List[np.ndarray]:
+    if INT8_CALIBRATION_DIR:
+        paths = sorted(
+            os.path.join(INT8_CALIBRATION_DIR, name) for name in os.listdir(INT8_CALIBRATION_DIR)
+            if name.lower().endswith((".jpg", ".jpeg", ".png"))
+        )
+    else:
+        from ultralytics.utils import ASSETS
+        paths = sorted(ASSETS.glob("*.jpg"))
+    return [np.array(Image.open(path).convert("RGB")) for path in paths]
+
+
+def _quantize_onnx(source: str, target: str):
+    """
+    Statically quantize an ONNX model to INT8 (QDQ format).
+
+    Box decoding after the last convolutions stays in float: it mixes pixel
+    coordinates with 0-1 class scores, which a shared INT8 range would erase.
+    """
+    import onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    graph = onnx.load(source).graph
+    producers = {output: node for node in graph.node for output in node.output}
+    head = set()
+    pending = [output.name for output in graph.output]
+    while pending:
+        node = producers.get(pending.pop())
+        if node is None or node.op_type == "Conv" or node.name in head:
+            continue
+        head.add(node.name)
+        pending.extend(node.input)
+
+    input_name = graph.input[0].name
+    size = (MODEL_IMAGE_SIZE, MODEL_IMAGE_SIZE)
+    batches = [
+        {input_name: (np.array(Image.fromarray(image).resize(size)).transpose(2, 0, 1)[None] / 255).astype(np.float32)}
+        for image in _calibration_images()
+    ]
+
+    class CalibrationImages(CalibrationDataReader):
+        def __init__(self):
+            self.batches = iter(batches)
+
+        def get_next(self):
+            return next(self.batches, None)
+
+    quantize_static(
+        source,
+        target,
+        CalibrationImages(),
+        quant_format=QuantFormat.QDQ,
+        nodes_to_exclude=sorted(head),
+        weight_type=QuantType.QInt8,
+        activation_type=QuantType.QUInt8
+    )
+
+
+def load_model(model_path: str, backend: str = INFERENCE_BACKEND, int8: bool = INFERENCE_INT8) -> Tuple[YOLO, str]:
+    """
+    Load the detection model for the configured backend.
+
+    Returns the model and the name of the backend actually used. Exports that
+    failed the parity check against PyTorch fall back to PyTorch.
+    """
+    from ultralytics import YOLO
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend} (use one of {', '.join(BACKENDS)})")
+    if backend == "torch":
+        return YOLO(model_path), backend
+
+    target = export_model(model_path, backend, int8)
+    with open(f"{target}.parity.json") as f:
+        report = json.load(f)
+    if not report["passed"]:
+        logger.error(f"{backend_name(backend, int8)} model failed the parity check, using PyTorch: {report}")
+        return YOLO(model_path), "torch"
+
+    model = YOLO(target, task="detect")
+    # Set up the runtime now rather than on the first request
+    model(np.zeros((MODEL_IMAGE_SIZE, MODEL_IMAGE_SIZE, 3), dtype=np.uint8), verbose=False)
+    return model, backend_name(backend, int8)
+
+
+def get_class_names(model: YOLO) -> Dict[int, str]:
+    """
+    Get the class names of a PyTorch, exported or worker process model
+    """
+    if hasattr(getattr(model, "model", None), "names"):
+        return model.model.names
+    if getattr(model, "names", None):
+        # Inference worker processes report the names of the model they loaded
+        return model.names
+    if model.predictor is None:
+        model(np.zeros((MODEL_IMAGE_SIZE, MODEL_IMAGE_SIZE, 3), dtype=np.uint8), verbose=False)
+    return model.predictor.model.names
+
+
+def match_detections(expected: sv.Detections, actual: sv.Detections) -> List[Tuple[float, float]]:
+    """
+    Match boxes one-to-one by class and IoU, best overlaps first.
+
+    Returns the IoU and confidence difference of every matched pair.
+    """
+    import supervision as sv
+
+    if len(expected) == 0 or len(actual) == 0:
+        return []
+
+    iou = sv.box_iou_batch(expected.xyxy, actual.xyxy)
+    iou[expected.class_id[:, None] != actual.class_id[None, :]] = 0
+
+    matches = []
+    for i, j in zip(*np.unravel_index(np.argsort(-iou, axis=None), iou.shape)):
+        if iou[i, j] < PARITY_IOU:
+            break
+        if np.isnan(iou[i, j]):
+            continue
+        matches.append((float(iou[i, j]), abs(float(expected.confidence[i]) - float(actual.confidence[j]))))
+        iou[i, :] = np.nan
+        iou[:, j] = np.nan
+    return matches
+
+
+def check_parity(reference: YOLO, candidate: YOLO, images: Optional[List[np.ndarray]] = None) -> Dict:
+    """
+    Compare an exported model's detections with the PyTorch model's.
+
+    The check passes when both the share of reference boxes found by the
+    candidate and the share of candidate boxes found in the reference reach
+    PARITY_MIN_MATCH.
+    """
+    import supervision as sv
+
+    if images is None:
+        images = _calibration_images()
+
+    reference_boxes = candidate_boxes = 0
+    matches = []
+    for image in images:
+        expected = sv.Detections.from_ultralytics(reference(image, imgsz=MODEL_IMAGE_SIZE, verbose=False)[0])
+        actual = sv.Detections.from_ultralytics(candidate(image, imgsz=MODEL_IMAGE_SIZE, verbose=False)[0])
+        reference_boxes += len(expected)
+        candidate_boxes += len(actual)
+        matches.extend(match_detections(expected, actual))
+
+    recall = len(matches) / reference_boxes if reference_boxes else 1.0
+    precision = len(matches) / candidate_boxes if candidate_boxes else 1.0
+    return {
+        "images": len(images),
+        "reference_boxes": reference_boxes,
+        "candidate_boxes": candidate_boxes,
+        "recall": round(recall, 3),
+        "precision": round(precision, 3),
+        "mean_iou": round(float(np.mean([iou for iou, _ in matches])), 3) if matches else None,
+        "max_confidence_diff": round(max(diff for _, diff in matches), 3) if matches else None,
+        "passed": recall >= PARITY_MIN_MATCH and precision >= PARITY_MIN_MATCH,
+    }
+
+
+if __name__ == "__main__":
+    # Export the configured backend and print its parity report
+    logging.basicConfig(level=logging.INFO)
+    from ai_services import YOLO_MODEL_PATH
+    if INFERENCE_BACKEND == "torch":
+        raise SystemExit("Set INFERENCE_BACKEND to onnx or openvino to export a model")
+    target = export_model(YOLO_MODEL_PATH, INFERENCE_BACKEND, INFERENCE_INT8)
+    with open(f"{target}.parity.json") as f:
+        print(f.read())
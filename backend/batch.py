@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import os
+from typing import AsyncIterator, Awaitable, Callable, Dict, List
+
+from catalog import CatalogSnapshot
+from inference import BATCH_MAX_SIZE, INFERENCE_WORKERS
+from utils import calculate_costs
+
+logger = logging.getLogger(__name__)
+
+# Images of one batch request processed at once; enough to fill every replica with a full micro-batch
+BATCH_PIPELINE_DEPTH = int(os.getenv("BATCH_PIPELINE_DEPTH", str(INFERENCE_WORKERS * BATCH_MAX_SIZE)))
+
+
+async def run_pipelined(jobs: List[Callable[[], Awaitable[Dict]]], depth: int = BATCH_PIPELINE_DEPTH) -> AsyncIterator[Dict]:
+    """
+    Run jobs with at most depth in flight, yielding each result as it finishes.
+
+    While some images wait for inference, the next ones are read and decoded,
+    and concurrent images are grouped into micro-batches by the scheduler.
+    Unfinished jobs are cancelled if the consumer stops early (for example
+    when the client disconnects).
+    """
+    jobs = iter(jobs)
+    pending = set()
+    try:
+        while True:
+            for job in jobs:
+                pending.add(asyncio.ensure_future(job()))
+                if len(pending) >= depth:
+                    break
+            if not pending:
+                return
+
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class BatchSummary:
+    """
+    Aggregates per-image results of a batch into one cost estimate
+    """
+
+    def __init__(self):
+        self.images = 0
+        self.failed = 0
+        self.detected_items: Dict[str, int] = {}
+
+    def add(self, result: Dict):
+        self.images += 1
+        if not result["success"]:
+            self.failed += 1
+            return
+        for name, count in result["detected_objects"].items():
+            self.detected_items[name] = self.detected_items.get(name, 0) + count
+
+    def to_dict(self, catalog: CatalogSnapshot) -> Dict:
+        """
+        Summarize the batch, pricing the combined item counts
+        """
+        cost_breakdown, total_cost = calculate_costs(self.detected_items, catalog)
+        return {
+            "images": self.images,
+            "succeeded": self.images - self.failed,
+            "failed": self.failed,
+            "detected_objects": self.detected_items,
+            "cost_breakdown": cost_breakdown,
+            "total_cost": total_cost,
+        }
@@ -0,0 +1,84 @@
+"""
+Performance benchmarks for the detection and Q&A pipelines.
+
+- benchmarks.stages: micro-benchmarks of each pipeline stage
+- benchmarks.load: load generator for /detect and /qa
+- benchmarks.fake_azure: local Azure OpenAI chat-completions stand-in
+- benchmarks.compare: compare two result files and flag regressions
+
+Run them from the backend directory, e.g. `python -m benchmarks.stages`.
+"""
+import json
+import math
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+RESULTS_DIR = os.getenv("BENCHMARK_RESULTS_DIR", "benchmarks/results")
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """
+    Summarize latency samples (seconds) as milliseconds: mean and p50/p95/p99
+    """
+    if not samples:
+        return {"count": 0}
+
+    ordered = sorted(samples)
+
+    def percentile(share: float) -> float:
+        # Nearest-rank percentile, so every reported value is an observed one
+        return ordered[max(1, math.ceil(len(ordered) * share)) - 1]
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "p50_ms": round(percentile(0.50) * 1000, 3),
+        "p95_ms": round(percentile(0.95) * 1000, 3),
+        "p99_ms": round(percentile(0.99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def environment() -> Dict:
+    """
+    Describe the commit, machine and configuration a run was made on
+    """
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        # Settings that change the numbers; compare runs with the same values
+        "config": {
+            name: os.environ[name] for name in sorted(os.environ)
+            if name.startswith(("INFERENCE_", "BATCH_", "IMAGE_", "MODEL_", "YOLO_"))
+        },
+    }
+
+
+def write_results(kind: str, results: Dict, path: Optional[str] = None) -> str:
+    """
+    Write benchmark results with their environment to a JSON file
+    """
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+
+    with open(path, "w") as f:
+        json.dump({"kind": kind, "environment": environment(), "results": results}, f, indent=2)
+    return path
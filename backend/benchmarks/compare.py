@@ -0,0 +1,80 @@
+"""
+Compare two benchmark result files and flag regressions.
+
+Latency percentiles that grew, or throughput that dropped, by more than the
+threshold are regressions; the exit status is 1 if there are any, so the
+comparison can gate a CI job.
+
+Usage: python -m benchmarks.compare baseline.json candidate.json [--threshold 0.1]
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Iterator, List, Tuple
+
+# Metrics compared, and whether a higher value is better
+METRICS = {"p50_ms": False, "p95_ms": False, "p99_ms": False, "throughput_rps": True}
+
+
+def flatten(results: Dict, prefix: str = "") -> Iterator[Tuple[str, float]]:
+    """
+    Yield (path, value) for every compared metric in a results tree
+    """
+    for key, value in results.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            yield from flatten(value, path)
+        elif key in METRICS and isinstance(value, (int, float)):
+            yield path, value
+
+
+def compare(baseline: Dict, candidate: Dict, threshold: float = 0.1) -> List[Dict]:
+    """
+    Compare the metrics present in both result sets; returns one row per metric
+    """
+    before = dict(flatten(baseline["results"]))
+    after = dict(flatten(candidate["results"]))
+
+    rows = []
+    for path in sorted(before.keys() & after.keys()):
+        old, new = before[path], after[path]
+        change = (new - old) / old if old else 0.0
+        higher_is_better = METRICS[path.rsplit(".", 1)[-1]]
+        worse = -change if higher_is_better else change
+        rows.append({
+            "metric": path,
+            "baseline": old,
+            "candidate": new,
+            "change": round(change, 4),
+            "regression": worse > threshold,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    if baseline["kind"] != candidate["kind"]:
+        raise SystemExit(f"Cannot compare {baseline['kind']} results with {candidate['kind']} results")
+
+    print(f"{baseline['environment']['commit']} -> {candidate['environment']['commit']}")
+    rows = compare(baseline, candidate, args.threshold)
+    for row in rows:
+        flag = "REGRESSION" if row["regression"] else ""
+        print(f"{row['metric']:55} {row['baseline']:10.2f} {row['candidate']:10.2f} {row['change']:+8.1%}  {flag}")
+
+    regressions = sum(row["regression"] for row in rows)
+    print(f"{regressions} regression(s) over {args.threshold:.0%} in {len(rows)} metrics")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
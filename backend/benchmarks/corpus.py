@@ -0,0 +1,56 @@
+"""
+Fixed corpus of synthetic images for benchmarks.
+
+Images are generated from a seed, so every run and every machine benchmarks
+the same bytes. They contain gradients, shapes and sensor-like noise rather
+than pure noise, so JPEG sizes and decode times resemble real photos.
+"""
+import io
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+# Common upload sizes: VGA, HD, Full HD and a 12 MP phone photo
+RESOLUTIONS = [(640, 480), (1280, 720), (1920, 1080), (4032, 3024)]
+CORPUS_SEED = 1234
+JPEG_QUALITY = 90
+
+
+def synthetic_image(width: int, height: int, seed: int = CORPUS_SEED) -> Image.Image:
+    """
+    Generate a deterministic photo-like RGB image
+    """
+    rng = np.random.default_rng(seed)
+
+    # Two-axis color gradient background
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = rng.uniform(40, 200, size=3)
+    background = base + 40 * np.stack([x / width, y / height, (x + y) / (width + height)], axis=-1)
+    image = Image.fromarray(np.clip(background, 0, 255).astype(np.uint8))
+
+    # Box- and pipe-like shapes at resolution-independent positions
+    draw = ImageDraw.Draw(image)
+    for _ in range(24):
+        x0, y0 = rng.uniform(0, 0.9, size=2) * (width, height)
+        w, h = rng.uniform(0.03, 0.25, size=2) * (width, height)
+        color = tuple(int(c) for c in rng.integers(0, 256, size=3))
+        if rng.random() < 0.5:
+            draw.rectangle([x0, y0, x0 + w, y0 + h], fill=color)
+        else:
+            draw.ellipse([x0, y0, x0 + w, y0 + h], fill=color)
+
+    noise = rng.normal(0, 6, size=(height, width, 3))
+    return Image.fromarray(np.clip(np.asarray(image) + noise, 0, 255).astype(np.uint8))
+
+
+def build_corpus(resolutions: List[Tuple[int, int]] = RESOLUTIONS, seed: int = CORPUS_SEED) -> List[Tuple[str, bytes]]:
+    """
+    Build the corpus as (name, JPEG bytes) pairs, one image per resolution
+    """
+    corpus = []
+    for width, height in resolutions:
+        buffered = io.BytesIO()
+        synthetic_image(width, height, seed).save(buffered, format="JPEG", quality=JPEG_QUALITY)
+        corpus.append((f"{width}x{height}", buffered.getvalue()))
+    return corpus
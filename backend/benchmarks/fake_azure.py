@@ -0,0 +1,120 @@
+"""
+Local stand-in for the Azure OpenAI chat-completions API.
+
+Answers every request with a fixed text after a configurable delay, streamed
+or not, so Q&A load tests measure this service rather than Azure and cost
+nothing. Point the API at it with:
+
+    AZURE_ENDPOINT=http://127.0.0.1:8100 AZURE_API_KEY=fake AZURE_DEPLOYMENT=fake
+
+Usage: python -m benchmarks.fake_azure [--port 8100] [--latency 0.8] [--token-delay 0.02]
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+ANSWER_WORDS = (
+    "The image shows construction materials including timber, steel beams and cement bags. "
+    "Based on the detected quantities the estimated cost is within the typical range for a small site. "
+    "Consider ordering an extra ten percent to cover waste and offcuts."
+).split(" ")
+
+
+def create_app(latency: float = 0.8, token_delay: float = 0.02, tokens: int = 60) -> FastAPI:
+    """
+    Create the fake chat-completions app.
+
+    latency is the time to the first token; each further token takes
+    token_delay, so a non-streamed answer arrives after
+    latency + (tokens - 1) * token_delay.
+    """
+    app = FastAPI(title="Fake Azure OpenAI")
+    app.state.requests = 0
+    words = [ANSWER_WORDS[i % len(ANSWER_WORDS)] for i in range(tokens)]
+
+    def chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(payload)}\n\n"
+
+    usage = {
+        "prompt_tokens": 2000,
+        "completion_tokens": tokens,
+        "total_tokens": 2000 + tokens,
+        "prompt_tokens_details": {"cached_tokens": 1024},
+    }
+
+    def usage_chunk(completion_id: str, model: str) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [],
+            "usage": usage,
+        }
+        return f"data: {json.dumps(payload)}\n\n"
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def chat_completions(deployment: str, request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        if body.get("stream"):
+            async def events():
+                await asyncio.sleep(latency)
+                yield chunk(completion_id, deployment, {"role": "assistant", "content": ""})
+                for i, word in enumerate(words):
+                    if i:
+                        await asyncio.sleep(token_delay)
+                    yield chunk(completion_id, deployment, {"content": word if i == 0 else f" {word}"})
+                yield chunk(completion_id, deployment, {}, finish_reason="stop")
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    yield usage_chunk(completion_id, deployment)
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await asyncio.sleep(latency + max(0, tokens - 1) * token_delay)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": deployment,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": " ".join(words)},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        }
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local Azure OpenAI chat-completions stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.8, help="seconds to the first token")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds between streamed tokens")
+    parser.add_argument("--tokens", type=int, default=60, help="tokens per answer")
+    args = parser.parse_args()
+
+    uvicorn.run(create_app(args.latency, args.token_delay, args.tokens), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
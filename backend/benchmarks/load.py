@@ -0,0 +1,215 @@
+"""
+Load generator for the /detect and /qa endpoints.
+
+A fixed number of concurrent clients send requests back to back and record
+the latency of each one. Reported per scenario: p50/p95/p99 latency,
+throughput and errors; streamed Q&A also reports time to the first event.
+
+Every request uploads a unique variant of a corpus image (same pixels,
+different bytes), so the detection and answer caches are bypassed unless
+--cached is given.
+
+With --serve, the fake Azure server and the API are started locally with
+the API pointed at the fake, and stopped afterwards:
+
+    python -m benchmarks.load --serve --scenarios detect,qa_stream --concurrency 8 --requests 200
+"""
+import argparse
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks import summarize, write_results
+from benchmarks.corpus import build_corpus
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ("detect", "detect_boxes_only", "qa", "qa_stream")
+QUESTION = "What will these materials cost and what else do I need?"
+READY_TIMEOUT = 300
+
+
+def unique_variant(image_data: bytes, n: int) -> bytes:
+    """
+    Make the upload bytes unique without changing the pixels (decoders ignore data after the JPEG end marker)
+    """
+    return image_data + n.to_bytes(8, "big")
+
+
+async def send(client: httpx.AsyncClient, scenario: str, image_data: bytes) -> Dict:
+    """
+    Send one request; returns its latency, time to first event (streaming only) and whether it succeeded
+    """
+    files = {"file": ("benchmark.jpg", image_data, "image/jpeg")}
+    started = time.perf_counter()
+    first_event = None
+
+    if scenario == "detect":
+        response = await client.post("/detect", files=files)
+    elif scenario == "detect_boxes_only":
+        response = await client.post("/detect", files=files, params={"boxes_only": "true"})
+    elif scenario == "qa":
+        response = await client.post("/qa", files=files, params={"question": QUESTION})
+    else:
+        async with client.stream("POST", "/qa/stream", files=files, data={"question": QUESTION}) as response:
+            async for line in response.aiter_lines():
+                if first_event is None and line.startswith("data:"):
+                    first_event = time.perf_counter() - started
+        latency = time.perf_counter() - started
+        return {"latency": latency, "first_event": first_event, "ok": response.status_code == 200}
+
+    latency = time.perf_counter() - started
+    # Failed detections and answers are still 200 responses, with success false
+    ok = response.status_code == 200 and response.json().get("success", True)
+    return {"latency": latency, "first_event": None, "ok": ok}
+
+
+async def run_scenario(url: str, scenario: str, corpus: List, concurrency: int, requests: int, cached: bool) -> Dict:
+    """
+    Run one scenario with a fixed number of concurrent clients
+    """
+    counter = iter(range(requests))
+    samples = []
+
+    async def client_loop(client: httpx.AsyncClient):
+        for n in counter:
+            image_data = corpus[n % len(corpus)][1]
+            if not cached:
+                image_data = unique_variant(image_data, n)
+            try:
+                samples.append(await send(client, scenario, image_data))
+            except httpx.HTTPError as e:
+                logger.warning(f"{scenario} request failed: {e}")
+                samples.append({"latency": None, "first_event": None, "ok": False})
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=httpx.Timeout(300)) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    succeeded = [sample for sample in samples if sample["ok"]]
+    result = {
+        "requests": len(samples),
+        "concurrency": concurrency,
+        "errors": len(samples) - len(succeeded),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(succeeded) / elapsed, 3) if elapsed else 0.0,
+        "latency": summarize([sample["latency"] for sample in succeeded]),
+    }
+    if scenario == "qa_stream":
+        result["first_event"] = summarize([sample["first_event"] for sample in succeeded if sample["first_event"] is not None])
+    return result
+
+
+def wait_until_ready(url: str, timeout: float = READY_TIMEOUT):
+    """
+    Wait until the API reports that warm-up has finished
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            readiness = httpx.get(f"{url}/health", timeout=5).json().get("readiness")
+        except httpx.HTTPError:
+            readiness = None
+        if readiness == "ready":
+            return
+        if readiness == "failed":
+            raise RuntimeError(f"{url} failed to warm up; see the API log")
+        time.sleep(0.5)
+    raise TimeoutError(f"{url} was not ready after {timeout:.0f}s")
+
+
+@contextmanager
+def local_servers(port: int, azure_port: int, azure_args: List[str]):
+    """
+    Start the fake Azure server and the API (pointed at it) as subprocesses
+    """
+    env = {
+        **os.environ,
+        "AZURE_ENDPOINT": f"http://127.0.0.1:{azure_port}",
+        "AZURE_API_KEY": "fake",
+        "AZURE_DEPLOYMENT": "fake",
+        # Answers must come from the fake, not from a cache warmed by an earlier run
+        "ANSWER_CACHE_BACKEND": "none",
+    }
+    processes = [
+        subprocess.Popen([sys.executable, "-m", "benchmarks.fake_azure", "--port", str(azure_port), *azure_args]),
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"], env=env
+        ),
+    ]
+    try:
+        url = f"http://127.0.0.1:{port}"
+        wait_until_ready(url)
+        yield url
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=30)
+
+
+async def run(url: str, scenarios: List[str], concurrency: int, requests: int, cached: bool) -> Dict:
+    corpus = build_corpus()
+    results = {}
+    for scenario in scenarios:
+        logger.info(f"Running {scenario}: {requests} requests, {concurrency} concurrent")
+        results[scenario] = await run_scenario(url, scenario, corpus, concurrency, requests, cached)
+    return results
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Load test /detect and /qa")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="API to test (ignored with --serve)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated, from {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario")
+    parser.add_argument("--cached", action="store_true", help="repeat identical uploads so caches can hit")
+    parser.add_argument("--serve", action="store_true", help="start the fake Azure server and the API locally")
+    parser.add_argument("--port", type=int, default=8010, help="API port with --serve")
+    parser.add_argument("--azure-port", type=int, default=8100, help="fake Azure port with --serve")
+    parser.add_argument("--azure-latency", type=float, default=0.8, help="fake Azure time to first token")
+    parser.add_argument("--azure-token-delay", type=float, default=0.02, help="fake Azure delay between tokens")
+    parser.add_argument("--output", help="result file (default: a timestamped file in benchmarks/results)")
+    args = parser.parse_args(argv)
+
+    scenarios = args.scenarios.split(",")
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    logging.basicConfig(level=logging.INFO)
+    settings = {
+        "scenarios": scenarios,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "cached": args.cached,
+    }
+    if args.serve:
+        settings["fake_azure"] = {"latency": args.azure_latency, "token_delay": args.azure_token_delay}
+        azure_args = ["--latency", str(args.azure_latency), "--token-delay", str(args.azure_token_delay)]
+        with local_servers(args.port, args.azure_port, azure_args) as url:
+            results = asyncio.run(run(url, scenarios, args.concurrency, args.requests, args.cached))
+    else:
+        results = asyncio.run(run(args.url, scenarios, args.concurrency, args.requests, args.cached))
+
+    path = write_results("load", {"settings": settings, "scenarios": results}, args.output)
+    for scenario, result in results.items():
+        latency = result["latency"]
+        print(
+            f"{scenario:18} {result['throughput_rps']:8.2f} req/s  p50 {latency.get('p50_ms', 0):9.1f} ms  "
+            f"p95 {latency.get('p95_ms', 0):9.1f} ms  p99 {latency.get('p99_ms', 0):9.1f} ms  errors {result['errors']}"
+        )
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
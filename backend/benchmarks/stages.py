@@ -0,0 +1,239 @@
+"""
+Micro-benchmarks of the detection pipeline stages.
+
+Each stage runs on every corpus image, in-process and without HTTP, so the
+numbers isolate the stage itself:
+
+- decode: JPEG bytes to the size-capped RGB image (utils.decode_image)
+- detect_objects: inference, filtering and annotation (AIServices.detect_objects)
+- detect_objects_tiled: the same in tiled mode, on the image decoded for tiling
+- annotate: drawing a fixed set of boxes (AIServices.annotate_image)
+- image_to_base64: JPEG encoding of the image returned to clients
+- encode_previous: encoding the annotated PIL image as JPEG at quality 85
+  and full size (utils.image_to_jpeg, the previous path)
+- encode_jpeg, encode_webp: image_encoding.encode_image on the annotator's
+  array with the configured encoder, max side and adaptive quality
+- encode_opencv_jpeg, encode_opencv_webp: the same with cv2.imencode
+  The encode stages run at the detection size and, as "<size>_tiled", at the
+  larger size used for tiled detection; encoded sizes are reported under
+  encoded_bytes
+- response_pydantic: the previous /detect response path (base64, model
+  validation, jsonable_encoder and json.dumps) for the annotated image
+- response_orjson, response_msgpack: the same body serialized by the
+  responses module, as JSON or as MessagePack with the raw JPEG bytes
+- calculate_costs: pricing every catalog item
+
+Usage: python -m benchmarks.stages [--repeat 20] [--output results.json]
+"""
+import argparse
+import logging
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+from PIL import Image
+
+from benchmarks import summarize, write_results
+from benchmarks.corpus import RESOLUTIONS, build_corpus
+
+logger = logging.getLogger(__name__)
+
+ANNOTATION_BOXES = 20
+
+
+def time_calls(fn: Callable, repeat: int, warmup: int) -> List[float]:
+    """
+    Call fn warmup times untimed, then repeat times timed; returns the durations in seconds
+    """
+    for _ in range(warmup):
+        fn()
+
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def fixed_detections(width: int, height: int, class_ids: List[int]):
+    """
+    Build a deterministic set of boxes covering the image, for annotation benchmarks
+    """
+    import supervision as sv
+
+    rng = np.random.default_rng(0)
+    top_left = rng.uniform(0, 0.8, size=(ANNOTATION_BOXES, 2)) * (width, height)
+    extent = rng.uniform(0.05, 0.2, size=(ANNOTATION_BOXES, 2)) * (width, height)
+    return sv.Detections(
+        xyxy=np.hstack([top_left, top_left + extent]).astype(np.float32),
+        confidence=rng.uniform(0.3, 1, size=ANNOTATION_BOXES).astype(np.float32),
+        class_id=np.array([class_ids[i % len(class_ids)] for i in range(ANNOTATION_BOXES)])
+    )
+
+
+def detection_body(annotated_jpeg: bytes, boxes: int = ANNOTATION_BOXES) -> Dict:
+    """
+    Build a /detect response body of typical shape around an encoded annotated image
+    """
+    from datetime import datetime
+
+    return {
+        "success": True,
+        "detected_objects": {"Door": 2, "Window": 4},
+        "annotated_image": annotated_jpeg,
+        "detection_id": None,
+        "boxes": [{"object": "Door", "confidence": 0.9, "xyxy": [1.0, 2.0, 3.0, 4.0]}] * boxes,
+        "image_size": [640, 480],
+        "cost_breakdown": [
+            {"object": "Door", "quantity": 2, "unit_cost": 120.0, "total_cost": 240.0, "supplier": "https://example.com"}
+        ],
+        "total_cost": 240.0,
+        "recommendations": "",
+        "error": None,
+        "timestamp": datetime.now(),
+    }
+
+
+def pydantic_response(body: Dict) -> bytes:
+    """
+    Serialize a /detect body the way FastAPI does for a returned DetectionResponse model
+    """
+    import base64
+
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    from models import DetectionResponse
+
+    fields = {**body, "annotated_image": base64.b64encode(body["annotated_image"]).decode()}
+    model = DetectionResponse.model_validate(DetectionResponse(**fields).model_dump())
+    return JSONResponse(jsonable_encoder(model)).body
+
+
+def load_services(with_model: bool = True):
+    """
+    Set up AIServices for in-process benchmarks: one model replica, no pool or Azure client
+    """
+    import supervision as sv
+
+    from ai_services import AIServices, YOLO_MODEL_PATH
+    from backends import load_model
+    from catalog import Catalog
+
+    services = AIServices()
+    if with_model:
+        services.model, services.backend = load_model(YOLO_MODEL_PATH)
+    services.box_annotator = sv.BoxAnnotator(thickness=3)
+    services.catalog = Catalog()
+    if services.model is not None:
+        services.get_catalog()
+    return services
+
+
+def run(repeat: int = 20, warmup: int = 3, resolutions=RESOLUTIONS, with_model: bool = True) -> Dict:
+    """
+    Benchmark every stage over the corpus
+    """
+    from tiling import decode_for_detection
+    from image_encoding import encode_image
+    from responses import dump_json, dump_msgpack
+    from utils import calculate_costs, decode_image, image_to_base64, image_to_jpeg
+
+    services = load_services(with_model)
+    corpus = build_corpus(resolutions)
+    stages: Dict[str, Dict] = {
+        "decode": {}, "annotate": {}, "image_to_base64": {},
+        "response_pydantic": {}, "response_orjson": {}, "response_msgpack": {},
+        "encode_previous": {}, "encode_jpeg": {}, "encode_webp": {},
+        "encode_opencv_jpeg": {}, "encode_opencv_webp": {},
+    }
+    encoded_bytes: Dict[str, Dict[str, int]] = {}
+    if services.model is not None:
+        stages["detect_objects"] = {}
+        stages["detect_objects_tiled"] = {}
+
+    for name, image_data in corpus:
+        image, _ = decode_image(image_data)
+        logger.info(f"Benchmarking {name} (decoded to {image.size[0]}x{image.size[1]})")
+
+        stages["decode"][name] = summarize(time_calls(lambda: decode_image(image_data), repeat, warmup))
+        if services.model is not None:
+            stages["detect_objects"][name] = summarize(time_calls(lambda: services.detect_objects(image), repeat, warmup))
+            tiled_image, _ = decode_for_detection(image_data, tiled=True)
+            stages["detect_objects_tiled"][name] = summarize(
+                time_calls(lambda: services.detect_objects(tiled_image, tiled=True), repeat, warmup)
+            )
+
+        detections = fixed_detections(*image.size, services.allowed_class_ids or [0])
+        stages["annotate"][name] = summarize(time_calls(lambda: services.annotate_image(image, detections), repeat, warmup))
+        annotated = services.annotate_image(image, detections)
+        stages["image_to_base64"][name] = summarize(time_calls(lambda: image_to_base64(annotated), repeat, warmup))
+
+        tiled_image, _ = decode_for_detection(image_data, tiled=True)
+        for label, source in ((name, image), (f"{name}_tiled", tiled_image)):
+            source_detections = fixed_detections(*source.size, services.allowed_class_ids or [0])
+            annotated_array = services.annotate_array(source, source_detections)
+            annotated_pil = Image.fromarray(annotated_array)
+            encoders = {
+                "encode_previous": lambda: image_to_jpeg(annotated_pil),
+                "encode_jpeg": lambda: encode_image(annotated_array, "jpeg"),
+                "encode_webp": lambda: encode_image(annotated_array, "webp"),
+                "encode_opencv_jpeg": lambda: encode_image(annotated_array, "jpeg", encoder="opencv"),
+                "encode_opencv_webp": lambda: encode_image(annotated_array, "webp", encoder="opencv"),
+            }
+            encoded_bytes[label] = {}
+            for stage, encode in encoders.items():
+                stages[stage][label] = summarize(time_calls(encode, repeat, warmup))
+                encoded_bytes[label][stage] = len(encode())
+
+        body = detection_body(image_to_jpeg(annotated))
+        stages["response_pydantic"][name] = summarize(time_calls(lambda: pydantic_response(body), repeat, warmup))
+        stages["response_orjson"][name] = summarize(time_calls(lambda: dump_json(body), repeat, warmup))
+        stages["response_msgpack"][name] = summarize(time_calls(lambda: dump_msgpack(body), repeat, warmup))
+
+    # Pricing does not depend on the image; price every catalog item at once as the worst case
+    catalog = services.catalog.snapshot()
+    detected_items = {item["object"]: 3 for item in catalog.items}
+    stages["calculate_costs"] = {
+        f"{len(detected_items)}_items": summarize(
+            time_calls(lambda: calculate_costs(detected_items, catalog), repeat * 10, warmup)
+        )
+    }
+
+    return {
+        "backend": services.backend,
+        "repeat": repeat,
+        "corpus": {name: {"bytes": len(image_data)} for name, image_data in corpus},
+        "stages": stages,
+        "encoded_bytes": encoded_bytes,
+    }
+
+
+def parse_resolutions(value: str):
+    return [tuple(int(side) for side in size.split("x")) for size in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark the detection pipeline stages")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per stage and image")
+    parser.add_argument("--warmup", type=int, default=3, help="untimed runs before timing")
+    parser.add_argument("--resolutions", type=parse_resolutions, default=RESOLUTIONS, help="e.g. 640x480,1920x1080")
+    parser.add_argument("--no-model", action="store_true", help="skip detect_objects (no model weights needed)")
+    parser.add_argument("--output", help="result file (default: a timestamped file in benchmarks/results)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    results = run(args.repeat, args.warmup, args.resolutions, with_model=not args.no_model)
+    path = write_results("stages", results, args.output)
+
+    for stage, by_image in results["stages"].items():
+        for name, summary in by_image.items():
+            print(f"{stage:16} {name:>16}  p50 {summary['p50_ms']:9.2f} ms  p95 {summary['p95_ms']:9.2f} ms")
+    for name, sizes in results["encoded_bytes"].items():
+        print(f"{'encoded_bytes':16} {name:>16}  " + "  ".join(f"{stage} {size}" for stage, size in sizes.items()))
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
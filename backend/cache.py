@@ -0,0 +1,420 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from responses import dump_msgpack, load_msgpack
+
+logger = logging.getLogger(__name__)
+
+# Detection cache configuration
+DETECTION_CACHE_BACKEND = os.getenv("DETECTION_CACHE_BACKEND", "memory")
+DETECTION_CACHE_TTL = int(os.getenv("DETECTION_CACHE_TTL", "3600"))
+DETECTION_CACHE_MAX_MB = float(os.getenv("DETECTION_CACHE_MAX_MB", "64"))
+DETECTION_CACHE_DIR = os.getenv("DETECTION_CACHE_DIR", ".cache/detections")
+
+# Answer cache configuration
+ANSWER_CACHE_BACKEND = os.getenv("ANSWER_CACHE_BACKEND", "disk")
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "604800"))
+ANSWER_CACHE_MAX_MB = float(os.getenv("ANSWER_CACHE_MAX_MB", "256"))
+ANSWER_CACHE_DIR = os.getenv("ANSWER_CACHE_DIR", ".cache/answers")
+
+# Annotated image cache configuration
+ANNOTATED_CACHE_BACKEND = os.getenv("ANNOTATED_CACHE_BACKEND", "memory")
+ANNOTATED_CACHE_TTL = int(os.getenv("ANNOTATED_CACHE_TTL", "3600"))
+ANNOTATED_CACHE_MAX_MB = float(os.getenv("ANNOTATED_CACHE_MAX_MB", "128"))
+ANNOTATED_CACHE_DIR = os.getenv("ANNOTATED_CACHE_DIR", ".cache/annotated")
+
+# Uploads kept in memory so annotated images can be rendered on demand
+UPLOAD_STORE_TTL = int(os.getenv("UPLOAD_STORE_TTL", "900"))
+UPLOAD_STORE_MAX_MB = float(os.getenv("UPLOAD_STORE_MAX_MB", "256"))
+
+# Stored responses replayed for a repeated Idempotency-Key
+IDEMPOTENCY_BACKEND = os.getenv("IDEMPOTENCY_BACKEND", "disk")
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_MAX_MB = float(os.getenv("IDEMPOTENCY_MAX_MB", "256"))
+IDEMPOTENCY_DIR = os.getenv("IDEMPOTENCY_DIR", ".cache/idempotency")
+
+
+class CacheBackend(ABC):
+    """Byte store with LRU + TTL eviction and a size cap"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: bytes):
+        ...
+
+    @abstractmethod
+    def clear(self):
+        ...
+
+    @abstractmethod
+    def size_bytes(self) -> int:
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+
+class MemoryCacheBackend(CacheBackend):
+    """In-process cache backend"""
+
+    def __init__(self, ttl: int, max_bytes: int):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.time():
+                self._remove(key)
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._size += len(value)
+
+            # Evict least recently used entries until we are under the cap
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        _, value = self._entries.pop(key)
+        self._size -= len(value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def size_bytes(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskCacheBackend(CacheBackend):
+    """
+    On-disk cache backend that survives restarts.
+
+    One file per entry; the file modification time is used both for TTL and
+    as the LRU clock (it is refreshed on every hit).
+    """
+
+    def __init__(self, directory: str, ttl: int, max_bytes: int):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._sizes: Dict[str, int] = {}
+        for name in os.listdir(self.directory):
+            if name.endswith(".cache"):
+                self._sizes[name[:-len(".cache")]] = os.path.getsize(os.path.join(self.directory, name))
+        self._size = sum(self._sizes.values())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.cache")
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            if os.path.getmtime(path) + self.ttl < time.time():
+                with self._lock:
+                    self._remove(key)
+                return None
+
+            with open(path, "rb") as f:
+                value = f.read()
+            os.utime(path)
+            return value
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.error(f"Error reading cache entry {key}: {e}")
+            return None
+
+    def set(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Error writing cache entry {key}: {e}")
+            return
+
+        with self._lock:
+            self._size += len(value) - self._sizes.get(key, 0)
+            self._sizes[key] = len(value)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """
+        Remove expired entries, then least recently used ones, until under the cap
+        """
+        entries = []
+        for key in list(self._sizes):
+            try:
+                entries.append((os.path.getmtime(self._path(key)), key))
+            except OSError:
+                self._forget(key)
+
+        now = time.time()
+        for mtime, key in sorted(entries):
+            if self._size <= self.max_bytes and mtime + self.ttl >= now:
+                break
+            self._remove(key)
+
+    def _remove(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+        self._forget(key)
+
+    def _forget(self, key: str):
+        self._size -= self._sizes.pop(key, 0)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._sizes):
+                self._remove(key)
+
+    def size_bytes(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._sizes)
+
+
+def create_cache_backend(backend: str, directory: str, ttl: int, max_mb: float) -> Optional[CacheBackend]:
+    """
+    Create a cache backend by name ("memory", "disk" or "none")
+    """
+    max_bytes = int(max_mb * 1024 * 1024)
+    if backend == "memory":
+        return MemoryCacheBackend(ttl, max_bytes)
+    if backend == "disk":
+        return DiskCacheBackend(directory, ttl, max_bytes)
+    if backend == "none":
+        return None
+    raise ValueError(f"Unknown cache backend: {backend}")
+
+
+def content_hash(data: bytes) -> str:
+    """
+    Get the SHA-256 hex digest of uploaded content
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+class ResultCache:
+    """JSON result cache on top of a backend, with hit/miss counters"""
+
+    def __init__(self, backend: Optional[CacheBackend]):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def encode(self, result: Any) -> bytes:
+        return json.dumps(result).encode()
+
+    def decode(self, value: bytes) -> Any:
+        return json.loads(value)
+
+    def get(self, key: str, bypass: bool = False) -> Optional[Any]:
+        if self.backend is None:
+            return None
+        if bypass:
+            self.bypassed += 1
+            return None
+
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return self.decode(value)
+
+    def set(self, key: str, result: Any):
+        if self.backend is None:
+            return
+        self.backend.set(key, self.encode(result))
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.backend is not None,
+            "entries": len(self.backend) if self.backend is not None else 0,
+            "size_bytes": self.backend.size_bytes() if self.backend is not None else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+class DetectionCache(ResultCache):
+    """
+    Content-addressed cache for detection results.
+
+    Entries are keyed by the SHA-256 of the uploaded bytes and the detection
+    version (model weights and thresholds), so a new model or threshold never
+    serves stale results.
+    """
+
+    @staticmethod
+    def make_key(image_hash: str, version: str) -> str:
+        return hashlib.sha256(f"{image_hash}:{version}".encode()).hexdigest()
+
+
+class AnswerCache(ResultCache):
+    """
+    Cache for GPT answers.
+
+    Entries are keyed by the image content hash, the normalized question, the
+    detected items, the prices quoted to the model and the prompt template
+    version, so the same canned question about the same photo is answered
+    without another Azure round-trip, and a catalog price change is not.
+    """
+
+    @staticmethod
+    def normalize_question(question: str) -> str:
+        question = re.sub(r"\s+", " ", question.strip().lower())
+        return question.rstrip("?!. ")
+
+    @classmethod
+    def make_key(cls, image_hash: str, question: str, detected_items: Dict[str, int], prompt_version: str,
+                 costs: Any = None) -> str:
+        key_data = json.dumps([
+            image_hash,
+            cls.normalize_question(question),
+            detected_items,
+            prompt_version,
+            costs
+        ], sort_keys=True)
+        return hashlib.sha256(key_data.encode()).hexdigest()
+
+
+class AnnotatedImageCache(ResultCache):
+    """
+    Cache for rendered annotated images.
+
+    Values are encoded image bytes, keyed like the detection result they were
+    drawn from, so they are rendered at most once per image and detection version.
+    """
+
+    def encode(self, result: bytes) -> bytes:
+        return result
+
+    def decode(self, value: bytes) -> bytes:
+        return value
+
+
+class IdempotencyStore(ResultCache):
+    """
+    Responses stored under client-supplied Idempotency-Key headers.
+
+    Each entry holds the response body and a fingerprint of the request that
+    produced it, so a replayed request gets the stored response while a
+    different request reusing the key can be refused.
+    """
+
+    def encode(self, result: Any) -> bytes:
+        # MessagePack keeps binary response fields (the annotated image) as bytes
+        return dump_msgpack(result)
+
+    def decode(self, value: bytes) -> Any:
+        return load_msgpack(value)
+
+    @staticmethod
+    def make_key(scope: str, idempotency_key: str) -> str:
+        return hashlib.sha256(f"{scope}:{idempotency_key}".encode()).hexdigest()
+
+
+def create_detection_cache() -> DetectionCache:
+    """
+    Create the detection cache from environment configuration
+    """
+    backend = create_cache_backend(
+        DETECTION_CACHE_BACKEND, DETECTION_CACHE_DIR, DETECTION_CACHE_TTL, DETECTION_CACHE_MAX_MB
+    )
+    logger.info(f"Detection cache backend: {DETECTION_CACHE_BACKEND}")
+    return DetectionCache(backend)
+
+
+def create_answer_cache() -> AnswerCache:
+    """
+    Create the GPT answer cache from environment configuration
+    """
+    backend = create_cache_backend(
+        ANSWER_CACHE_BACKEND, ANSWER_CACHE_DIR, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_MB
+    )
+    logger.info(f"Answer cache backend: {ANSWER_CACHE_BACKEND}")
+    return AnswerCache(backend)
+
+
+def create_annotated_cache() -> AnnotatedImageCache:
+    """
+    Create the annotated image cache from environment configuration
+    """
+    backend = create_cache_backend(
+        ANNOTATED_CACHE_BACKEND, ANNOTATED_CACHE_DIR, ANNOTATED_CACHE_TTL, ANNOTATED_CACHE_MAX_MB
+    )
+    logger.info(f"Annotated image cache backend: {ANNOTATED_CACHE_BACKEND}")
+    return AnnotatedImageCache(backend)
+
+
+def create_idempotency_store() -> IdempotencyStore:
+    """
+    Create the idempotency response store from environment configuration
+    """
+    backend = create_cache_backend(
+        IDEMPOTENCY_BACKEND, IDEMPOTENCY_DIR, IDEMPOTENCY_TTL, IDEMPOTENCY_MAX_MB
+    )
+    logger.info(f"Idempotency store backend: {IDEMPOTENCY_BACKEND}")
+    return IdempotencyStore(backend)
+
+
+def create_upload_store() -> MemoryCacheBackend:
+    """
+    Create the in-memory store of uploads awaiting an annotated render
+    """
+    return MemoryCacheBackend(UPLOAD_STORE_TTL, int(UPLOAD_STORE_MAX_MB * 1024 * 1024))
@@ -0,0 +1,173 @@
+import csv
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Catalog configuration
+CATALOG_PATH = os.getenv(
+    "CATALOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "construction_items.json")
+)
+CATALOG_RELOAD_INTERVAL = float(os.getenv("CATALOG_RELOAD_INTERVAL", "2"))
+
+
+class CatalogSnapshot:
+    """
+    Immutable, versioned view of the construction item catalog.
+
+    Lookups are case-insensitive and resolve aliases, in O(1).
+    """
+
+    def __init__(self, items: List[Dict], version: str):
+        self.items = items
+        self.version = version
+        self._index: Dict[str, Dict] = {}
+
+        # Canonical names win over aliases; the first occurrence of a name wins
+        for item in items:
+            self._index.setdefault(item["object"].casefold(), item)
+        for item in items:
+            for alias in item.get("aliases", []):
+                self._index.setdefault(alias.casefold(), item)
+
+    def lookup(self, name: str) -> Optional[Dict]:
+        """
+        Find an item by name or alias
+        """
+        return self._index.get(name.casefold())
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+def _normalize_item(raw: Dict) -> Dict:
+    """
+    Normalize a raw catalog row into an item dict
+    """
+    aliases = raw.get("aliases") or []
+    if isinstance(aliases, str):
+        aliases = [alias.strip() for alias in aliases.split("|") if alias.strip()]
+
+    return {
+        "object": str(raw["object"]).strip(),
+        "category": (raw.get("category") or "General").strip(),
+        "unit_cost": float(raw.get("unit_cost") or 0),
+        "supplier": (raw.get("supplier") or "").strip(),
+        "aliases": aliases,
+    }
+
+
+def _load_json(path: str) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _load_csv(path: str) -> List[Dict]:
+    # Columns: object, category, unit_cost, supplier, aliases ("|"-separated)
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def _load_sqlite(path: str) -> List[Dict]:
+    # Table: construction_items(object, category, unit_cost, supplier, aliases)
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        connection.row_factory = sqlite3.Row
+        rows = connection.execute(
+            "SELECT object, category, unit_cost, supplier, aliases FROM construction_items"
+        ).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        connection.close()
+
+
+LOADERS = {
+    ".json": _load_json,
+    ".csv": _load_csv,
+    ".db": _load_sqlite,
+    ".sqlite": _load_sqlite,
+    ".sqlite3": _load_sqlite,
+}
+
+
+def load_snapshot(path: str) -> CatalogSnapshot:
+    """
+    Load a catalog snapshot from a JSON, CSV or SQLite file
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in LOADERS:
+        raise ValueError(f"Unsupported catalog format: {extension}")
+
+    with open(path, "rb") as f:
+        version = hashlib.sha1(f.read()).hexdigest()[:12]
+
+    items = []
+    seen = set()
+    for raw in LOADERS[extension](path):
+        item = _normalize_item(raw)
+        key = item["object"].casefold()
+        if key in seen:
+            logger.warning(f"Duplicate catalog item ignored: {item['object']}")
+            continue
+        seen.add(key)
+        items.append(item)
+
+    return CatalogSnapshot(items, version)
+
+
+class Catalog:
+    """
+    Hot-reloadable construction item catalog.
+
+    The catalog file is checked for changes at most every reload_interval
+    seconds. A changed file is loaded into a new snapshot that replaces the old
+    one in a single assignment, so readers always see a complete catalog. If
+    the new file fails to load, the previous snapshot stays in use.
+    """
+
+    def __init__(self, path: str = CATALOG_PATH, reload_interval: float = CATALOG_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._stamp = self._file_stamp()
+        self._last_check = time.monotonic()
+        self._snapshot = load_snapshot(path)
+        logger.info(f"Catalog loaded with {len(self._snapshot)} items (version {self._snapshot.version})")
+
+    def _file_stamp(self) -> tuple:
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def snapshot(self) -> CatalogSnapshot:
+        """
+        Get the current catalog snapshot, reloading it if the file changed
+        """
+        if time.monotonic() - self._last_check >= self.reload_interval:
+            self._maybe_reload()
+        return self._snapshot
+
+    def _maybe_reload(self):
+        # Only one caller checks at a time; the others keep using the current snapshot
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._last_check = time.monotonic()
+            stamp = self._file_stamp()
+            if stamp == self._stamp:
+                return
+
+            # Record the stamp first so a broken file is not retried until it changes again
+            self._stamp = stamp
+            snapshot = load_snapshot(self.path)
+            self._snapshot = snapshot
+            logger.info(f"Catalog reloaded with {len(snapshot)} items (version {snapshot.version})")
+        except Exception as e:
+            logger.error(f"Failed to reload catalog, keeping version {self._snapshot.version}: {e}")
+        finally:
+            self._lock.release()
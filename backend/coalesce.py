@@ -0,0 +1,48 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one computation.
+
+    The first caller for a key starts the computation; callers that arrive
+    while it runs wait for the same result (or exception) instead of repeating
+    the work. The computation is shielded, so a caller that disconnects does
+    not cancel it for the others. Once it finishes the key is free again, and
+    later calls are served by the caches the computation fills.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+        if call is None or call.get_loop() is not asyncio.get_running_loop():
+            self.started += 1
+            call = asyncio.ensure_future(fn())
+            self._calls[key] = call
+            call.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(call)
+
+    def _finish(self, key: str, call: asyncio.Future):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # Mark the exception as retrieved; every waiter has already received it
+        if not call.cancelled():
+            call.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.started + self.coalesced
+        return {
+            "in_flight": len(self._calls),
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "coalesced_rate": round(self.coalesced / total, 3) if total else 0.0,
+        }
@@ -0,0 +1,325 @@
+import base64
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# History database; set HISTORY_DB_PATH to "none" to disable recording
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "data/history.db")
+# Records written per transaction, and how long the writer waits to fill a batch
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "200"))
+HISTORY_FLUSH_MS = float(os.getenv("HISTORY_FLUSH_MS", "250"))
+# Records waiting for the writer; beyond this new records are dropped rather than slowing requests
+HISTORY_QUEUE_MAX = int(os.getenv("HISTORY_QUEUE_MAX", "10000"))
+HISTORY_PAGE_MAX = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    project TEXT,
+    created_at REAL NOT NULL,
+    image_hash TEXT NOT NULL,
+    detected_objects TEXT NOT NULL,
+    cost_breakdown TEXT NOT NULL,
+    total_cost REAL NOT NULL,
+    boxes TEXT,
+    image_size TEXT,
+    question TEXT,
+    answer TEXT
+);
+CREATE INDEX IF NOT EXISTS records_by_date ON records (created_at, id);
+CREATE INDEX IF NOT EXISTS records_by_project ON records (project, created_at, id);
+CREATE INDEX IF NOT EXISTS records_by_image ON records (image_hash, created_at, id);
+CREATE TABLE IF NOT EXISTS record_items (
+    record_id INTEGER NOT NULL REFERENCES records (id),
+    object TEXT NOT NULL COLLATE NOCASE,
+    quantity INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS record_items_by_object ON record_items (object, created_at, record_id);
+"""
+
+SUMMARY_COLUMNS = "r.id, r.kind, r.project, r.created_at, r.image_hash, r.detected_objects, r.total_cost, r.question"
+DETAIL_COLUMNS = SUMMARY_COLUMNS + ", r.cost_breakdown, r.boxes, r.image_size, r.answer"
+JSON_COLUMNS = ("detected_objects", "cost_breakdown", "boxes", "image_size")
+
+
+def encode_cursor(created_at: float, record_id: int) -> str:
+    """
+    Encode the position after a record as an opaque page cursor
+    """
+    return base64.urlsafe_b64encode(f"{created_at!r}:{record_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    """
+    Decode a page cursor; raises ValueError if it is malformed
+    """
+    try:
+        created_at, record_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return float(created_at), int(record_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+class HistoryStore:
+    """
+    SQLite history of detections and Q&A answers.
+
+    Requests only enqueue records. A writer thread inserts them in batched
+    transactions (up to batch_size records, or whatever arrived within
+    flush_ms), so persistence never adds a disk write to request latency.
+    The database runs in WAL mode, so reads proceed while the writer commits.
+    Queries page with keyset pagination on (created_at, id): each page is an
+    index range scan starting after the cursor, as cheap on page 1000 as on
+    page 1. Without a path the store is disabled and records are discarded.
+    """
+
+    def __init__(self, path: Optional[str], batch_size: int = HISTORY_BATCH_SIZE, flush_ms: float = HISTORY_FLUSH_MS,
+                 queue_max: int = HISTORY_QUEUE_MAX):
+        self.path = path
+        self.enabled = path is not None
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = flush_ms / 1000
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_max)
+        self._readers = threading.local()
+        self._lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._initialized = False
+
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA busy_timeout = 5000")
+        return connection
+
+    def _initialize(self):
+        """
+        Create the database and schema and start the writer, on first use
+        """
+        with self._lock:
+            if self._initialized:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = self._connect()
+            try:
+                connection.execute("PRAGMA journal_mode = WAL")
+                connection.executescript(SCHEMA)
+            finally:
+                connection.close()
+            self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+            self._writer.start()
+            self._initialized = True
+            logger.info(f"History store: {self.path}")
+
+    def record_detection(self, project: Optional[str], image_hash: str, analysis: Dict[str, Any],
+                         boxes: Optional[list] = None):
+        """
+        Queue a detection result for the history
+        """
+        self._enqueue({
+            "kind": "detection",
+            "project": project,
+            "image_hash": image_hash,
+            "detected_objects": analysis["detected_items"],
+            "cost_breakdown": analysis["cost_breakdown"],
+            "total_cost": analysis["total_cost"],
+            "boxes": boxes,
+            "image_size": analysis.get("original_size"),
+        })
+
+    def record_answer(self, project: Optional[str], image_hash: str, analysis: Dict[str, Any], question: str, answer: str):
+        """
+        Queue a Q&A answer for the history
+        """
+        self._enqueue({
+            "kind": "answer",
+            "project": project,
+            "image_hash": image_hash,
+            "detected_objects": analysis["detected_items"],
+            "cost_breakdown": analysis["cost_breakdown"],
+            "total_cost": analysis["total_cost"],
+            "question": question,
+            "answer": answer,
+        })
+
+    def _enqueue(self, record: Dict[str, Any]):
+        if not self.enabled:
+            return
+        if not self._initialized:
+            self._initialize()
+        record["created_at"] = time.time()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("History queue full, dropping record")
+
+    def _write_loop(self):
+        connection = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            records = [record for record in batch if record is not None]
+            try:
+                if records:
+                    self._write(connection, records)
+            except Exception as e:
+                logger.error(f"Failed to write {len(records)} history records: {e}")
+                self.dropped += len(records)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+            if len(records) < len(batch):
+                connection.close()
+                return
+
+    def _write(self, connection: sqlite3.Connection, records: List[Dict[str, Any]]):
+        with connection:
+            for record in records:
+                cursor = connection.execute(
+                    "INSERT INTO records (kind, project, created_at, image_hash, detected_objects, cost_breakdown,"
+                    " total_cost, boxes, image_size, question, answer) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        record["kind"], record["project"], record["created_at"], record["image_hash"],
+                        json.dumps(record["detected_objects"]), json.dumps(record["cost_breakdown"]),
+                        record["total_cost"], json.dumps(record.get("boxes")), json.dumps(record.get("image_size")),
+                        record.get("question"), record.get("answer"),
+                    )
+                )
+                connection.executemany(
+                    "INSERT INTO record_items (record_id, object, quantity, created_at) VALUES (?, ?, ?, ?)",
+                    [
+                        (cursor.lastrowid, name, quantity, record["created_at"])
+                        for name, quantity in record["detected_objects"].items()
+                    ]
+                )
+        self.written += len(records)
+        self.batches += 1
+
+    def flush(self):
+        """
+        Wait until every queued record is written
+        """
+        if self._initialized:
+            self._queue.join()
+
+    def close(self):
+        """
+        Write the remaining records and stop the writer
+        """
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+
+    def _reader(self) -> sqlite3.Connection:
+        connection = getattr(self._readers, "connection", None)
+        if connection is None:
+            connection = self._readers.connection = self._connect()
+        return connection
+
+    def query(self, project: Optional[str] = None, item: Optional[str] = None, kind: Optional[str] = None,
+              since: Optional[float] = None, until: Optional[float] = None, limit: int = 50,
+              cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Get one page of records, newest first, and the cursor of the next page (None on the last page).
+
+        Filtering by item walks the item index; otherwise the project or date
+        index is used. Raises ValueError for a malformed cursor.
+        """
+        if not self._initialized:
+            self._initialize()
+        limit = max(1, min(limit, HISTORY_PAGE_MAX))
+
+        if item is not None:
+            # Keyset on the item index, which carries created_at and record_id
+            source = "record_items i JOIN records r ON r.id = i.record_id"
+            created_at, record_id, conditions, params = "i.created_at", "i.record_id", ["i.object = ?"], [item]
+        else:
+            source = "records r"
+            created_at, record_id, conditions, params = "r.created_at", "r.id", [], []
+
+        if project is not None:
+            conditions.append("r.project = ?")
+            params.append(project)
+        if kind is not None:
+            conditions.append("r.kind = ?")
+            params.append(kind)
+        if since is not None:
+            conditions.append(f"{created_at} >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append(f"{created_at} < ?")
+            params.append(until)
+        if cursor is not None:
+            conditions.append(f"({created_at}, {record_id}) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._reader().execute(
+            f"SELECT {SUMMARY_COLUMNS} FROM {source} {where} ORDER BY {created_at} DESC, {record_id} DESC LIMIT ?",
+            params + [limit + 1]
+        ).fetchall()
+
+        records = [self._row_to_record(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = encode_cursor(last["created_at"], last["id"])
+        return records, next_cursor
+
+    def get(self, record_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get one record with its cost breakdown, boxes and answer
+        """
+        if not self._initialized:
+            self._initialize()
+        row = self._reader().execute(f"SELECT {DETAIL_COLUMNS} FROM records r WHERE r.id = ?", (record_id,)).fetchone()
+        return self._row_to_record(row) if row is not None else None
+
+    @staticmethod
+    def _row_to_record(row: sqlite3.Row) -> Dict[str, Any]:
+        record = dict(row)
+        for column in JSON_COLUMNS:
+            if column in record:
+                record[column] = json.loads(record[column]) if record[column] is not None else None
+        return record
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+        }
+
+
+def create_history_store() -> HistoryStore:
+    """
+    Create the history store from environment configuration
+    """
+    if HISTORY_DB_PATH.lower() in ("", "none"):
+        logger.info("History store disabled")
+        return HistoryStore(None)
+    return HistoryStore(HISTORY_DB_PATH)
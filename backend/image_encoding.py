@@ -0,0 +1,139 @@
+import io
+import math
+import os
+from typing import Optional, Tuple, Union
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from responses import accept_quality
+
+# Annotated image output: longest side in pixels (0 keeps the full size) and quality at up to 1 megapixel
+ANNOTATED_MAX_SIDE = int(os.getenv("ANNOTATED_MAX_SIDE", "2048"))
+ANNOTATED_QUALITY = int(os.getenv("ANNOTATED_QUALITY", "85"))
+# Larger images are encoded at lower quality, down to this floor; equal to ANNOTATED_QUALITY disables it
+ANNOTATED_MIN_QUALITY = int(os.getenv("ANNOTATED_MIN_QUALITY", "65"))
+# Format used when the client does not ask for WebP: jpeg, or webp for clients known to support it
+ANNOTATED_FORMAT = os.getenv("ANNOTATED_FORMAT", "jpeg").lower()
+# WebP effort from 0 (fastest) to 6 (smallest); only used by the pil encoder
+ANNOTATED_WEBP_METHOD = int(os.getenv("ANNOTATED_WEBP_METHOD", "0"))
+# Encoder library: pil (libjpeg-turbo with SIMD in Pillow wheels) or opencv (cv2.imencode)
+IMAGE_ENCODER = os.getenv("IMAGE_ENCODER", "pil").lower()
+
+MEDIA_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+CV2_QUALITY_FLAGS = {"jpeg": cv2.IMWRITE_JPEG_QUALITY, "webp": cv2.IMWRITE_WEBP_QUALITY}
+
+
+def negotiate_format(accept: Optional[str], default: str = ANNOTATED_FORMAT) -> str:
+    """
+    Pick the annotated image format: WebP when the Accept header lists it at least as high as JPEG
+    """
+    if accept:
+        webp = accept_quality(accept, ("image/webp",))
+        if webp > 0 and webp >= accept_quality(accept, ("image/jpeg",)):
+            return "webp"
+    return default if default in MEDIA_TYPES else "jpeg"
+
+
+def encoding_version(image_format: str) -> str:
+    """
+    Get a version string for encoded images, so cached renders follow configuration changes
+    """
+    return (
+        f"{image_format}:{IMAGE_ENCODER}:max={ANNOTATED_MAX_SIDE}"
+        f":q={ANNOTATED_QUALITY}-{ANNOTATED_MIN_QUALITY}:m={ANNOTATED_WEBP_METHOD}"
+    )
+
+
+def adaptive_quality(size: Tuple[int, int], quality: int = ANNOTATED_QUALITY,
+                     min_quality: int = ANNOTATED_MIN_QUALITY) -> int:
+    """
+    Get the encoding quality for an image size.
+
+    Up to 1 megapixel the image is encoded at quality; every doubling of the
+    pixel count beyond that lowers it by 10, down to min_quality. Artifacts
+    shrink with the pixels they are spread over, while the bytes saved grow.
+    """
+    megapixels = size[0] * size[1] / 1_000_000
+    if megapixels <= 1:
+        return quality
+    return max(min(min_quality, quality), round(quality - 10 * math.log2(megapixels)))
+
+
+def output_size(size: Tuple[int, int], max_side: int = ANNOTATED_MAX_SIDE) -> Tuple[int, int]:
+    """
+    Get the output size of an image, fitted within max_side (0 for no limit)
+    """
+    width, height = size
+    if max_side <= 0 or max(width, height) <= max_side:
+        return width, height
+    scale = max_side / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def resize_pixels(pixels: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    """
+    Downscale a pixel array to size.
+
+    Whole-factor reductions go through INTER_AREA, which has a fast path for
+    integer factors (the array is cropped by under factor pixels to divide
+    evenly); bilinear interpolation covers the remaining factor of at most 2
+    without aliasing. A plain INTER_AREA resize is several times slower.
+    """
+    height, width = pixels.shape[:2]
+    factor = min(width // size[0], height // size[1])
+    if factor >= 2:
+        pixels = pixels[:height - height % factor, :width - width % factor]
+        pixels = cv2.resize(pixels, (width // factor, height // factor), interpolation=cv2.INTER_AREA)
+    if pixels.shape[1] == size[0] and pixels.shape[0] == size[1]:
+        return pixels
+    return cv2.resize(pixels, size, interpolation=cv2.INTER_LINEAR)
+
+
+def _encode_pil(pixels: np.ndarray, image_format: str, quality: int) -> bytes:
+    # frombuffer wraps the array's memory instead of copying it
+    height, width = pixels.shape[:2]
+    image = Image.frombuffer("RGB", (width, height), pixels, "raw", "RGB", 0, 1)
+    buffered = io.BytesIO()
+    if image_format == "webp":
+        image.save(buffered, format="WEBP", quality=quality, method=ANNOTATED_WEBP_METHOD)
+    else:
+        image.save(buffered, format="JPEG", quality=quality)
+    return buffered.getvalue()
+
+
+def _encode_opencv(pixels: np.ndarray, image_format: str, quality: int) -> bytes:
+    pixels = cv2.cvtColor(pixels, cv2.COLOR_RGB2BGR)
+    ok, encoded = cv2.imencode(f".{image_format}", pixels, [CV2_QUALITY_FLAGS[image_format], quality])
+    if not ok:
+        raise ValueError(f"Could not encode image as {image_format}")
+    return encoded.tobytes()
+
+
+def encode_image(image: Union[np.ndarray, Image.Image], image_format: str = "jpeg",
+                 max_side: int = ANNOTATED_MAX_SIDE, quality: Optional[int] = None,
+                 encoder: str = IMAGE_ENCODER) -> bytes:
+    """
+    Encode an RGB pixel array (such as the annotator's output) as JPEG or WebP.
+
+    The image is fitted within max_side on the array and, unless quality is
+    given, encoded at the adaptive quality for its size. Both encoders read
+    the array in place; the annotator's output is never copied into a PIL image.
+    """
+    pixels = np.asarray(image)
+    if pixels.ndim == 2:
+        pixels = cv2.cvtColor(pixels, cv2.COLOR_GRAY2RGB)
+    elif pixels.shape[2] == 4:
+        pixels = cv2.cvtColor(pixels, cv2.COLOR_RGBA2RGB)
+
+    height, width = pixels.shape[:2]
+    size = output_size((width, height), max_side)
+    if size != (width, height):
+        pixels = resize_pixels(pixels, size)
+
+    quality = quality if quality is not None else adaptive_quality(size)
+    pixels = np.ascontiguousarray(pixels, dtype=np.uint8)
+    if encoder == "opencv":
+        return _encode_opencv(pixels, image_format, quality)
+    return _encode_pil(pixels, image_format, quality)
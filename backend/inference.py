@@ -0,0 +1,427 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Inference pool configuration
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(min(4, os.cpu_count() or 1))))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "16"))
+INFERENCE_RETRY_AFTER = int(os.getenv("INFERENCE_RETRY_AFTER", "2"))
+# Number of model worker processes; 0 runs the replicas as threads in the API process
+INFERENCE_PROCESSES = int(os.getenv("INFERENCE_PROCESSES", "0"))
+INFERENCE_WORKER_NAME = "inference-worker"
+# Initial shared memory per worker: a full batch of decoded 1024 x 768 RGB images
+SHARED_MEMORY_INITIAL_BYTES = 8 * 1024 * 768 * 3
+
+# Micro-batching configuration
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "10"))
+# Requests allowed to wait for a batch; beyond it they are rejected like a full pool queue
+BATCH_QUEUE_SIZE = int(os.getenv("BATCH_QUEUE_SIZE", "64"))
+
+
+class InferenceQueueFull(Exception):
+    """Raised when the inference pool cannot accept more work"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Inference queue is full, please retry later")
+        self.retry_after = retry_after
+
+
+class InferencePool:
+    """
+    Dedicated executor for blocking model inference.
+
+    Each replica is checked out by exactly one call at a time, so replicas that
+    are not thread-safe (such as YOLO models) can be shared across requests.
+    Calls beyond the number of replicas wait in a bounded queue; once that queue
+    is full, new submissions are rejected with InferenceQueueFull.
+    """
+
+    def __init__(self, replicas: List[Any], max_queue: int = INFERENCE_QUEUE_SIZE,
+                 retry_after: int = INFERENCE_RETRY_AFTER):
+        if not replicas:
+            raise ValueError("InferencePool needs at least one replica")
+
+        self.size = len(replicas)
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+
+        self._replicas = queue.Queue()
+        for replica in replicas:
+            self._replicas.put(replica)
+
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    async def submit(self, fn: Callable, *args) -> Any:
+        """
+        Run fn(replica, *args) on the executor with a checked-out replica
+        """
+        with self._lock:
+            if self._pending >= self.size + self.max_queue:
+                raise InferenceQueueFull(self.retry_after)
+            self._pending += 1
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._run, fn, args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _run(self, fn: Callable, args: tuple) -> Any:
+        """
+        Check out a replica, run the call and return the replica to the pool
+        """
+        replica = self._replicas.get()
+        try:
+            return fn(replica, *args)
+        finally:
+            self._replicas.put(replica)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get current pool usage
+        """
+        with self._lock:
+            pending = self._pending
+        return {
+            "replicas": self.size,
+            "in_flight": min(pending, self.size),
+            "queued": max(0, pending - self.size),
+            "max_queue": self.max_queue,
+        }
+
+    def shutdown(self):
+        """
+        Stop the executor, waiting for running calls to finish, and close the replicas
+        """
+        self._executor.shutdown(wait=True)
+        while not self._replicas.empty():
+            replica = self._replicas.get()
+            if hasattr(replica, "close"):
+                replica.close()
+        logger.info("Inference pool shut down")
+
+
+def is_inference_worker() -> bool:
+    """
+    Check whether this is a model worker process
+    """
+    return multiprocessing.current_process().name == INFERENCE_WORKER_NAME
+
+
+def _worker_main(connection, model_path: str, threads: int):
+    """
+    Model worker process: load the model, then serve predictions until told to stop
+    """
+    import torch
+    from backends import get_class_names, load_model
+
+    torch.set_num_threads(threads)
+    try:
+        model, backend = load_model(model_path)
+        connection.send(("ready", get_class_names(model), backend))
+    except Exception as e:
+        connection.send(("error", f"{type(e).__name__}: {e}"))
+        return
+
+    segment = None
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+
+        name, layout, kwargs = request
+        try:
+            if segment is None or segment.name != name:
+                if segment is not None:
+                    try:
+                        segment.close()
+                    except BufferError:
+                        pass  # Still referenced by the previous batch; unmapped once collected
+                segment = shared_memory.SharedMemory(name=name)
+
+            # Zero-copy views of the images written by the API process
+            images = [np.ndarray(shape, dtype=np.uint8, buffer=segment.buf, offset=offset) for offset, shape in layout]
+            results = model(images, verbose=False, **kwargs)
+            connection.send([
+                (
+                    result.boxes.xyxy.cpu().numpy(),
+                    result.boxes.conf.cpu().numpy(),
+                    result.boxes.cls.cpu().numpy().astype(int)
+                )
+                for result in results
+            ])
+            del images, results
+        except Exception as e:
+            connection.send(RuntimeError(f"{type(e).__name__}: {e}"))
+
+
+class InferenceWorker:
+    """
+    Handle to a model worker process, used as a replica of an InferencePool.
+
+    Images are handed to the worker through a shared memory segment owned by
+    this handle (reused between calls and grown when a batch does not fit), so
+    only the batch layout and the compact detection arrays cross the pipe.
+    Like any replica, a worker serves one call at a time.
+    """
+
+    def __init__(self, model_path: str, threads: int = 1):
+        self.model_path = model_path
+        self.threads = threads
+        self.names: Dict[int, str] = {}
+        self.backend = None
+        self._segment = None
+        self._context = multiprocessing.get_context("spawn")
+        self._start()
+
+    def _start(self):
+        self._connection, child_connection = self._context.Pipe()
+        self.process = self._context.Process(
+            target=_worker_main,
+            args=(child_connection, self.model_path, self.threads),
+            name=INFERENCE_WORKER_NAME,
+            daemon=True
+        )
+        self.process.start()
+        child_connection.close()
+        self._ready = False
+
+    def wait_ready(self):
+        """
+        Wait until the worker has loaded its model
+        """
+        if self._ready:
+            return
+
+        try:
+            message = self._connection.recv()
+        except EOFError:
+            raise RuntimeError("Inference worker exited during startup")
+        if message[0] == "error":
+            self.process.join()
+            raise RuntimeError(f"Inference worker failed to load the model: {message[1]}")
+
+        _, self.names, self.backend = message
+        self._ready = True
+        logger.info(f"Inference worker {self.process.pid} ready ({self.backend} backend)")
+
+    def _reserve(self, size: int):
+        """
+        Make sure the shared memory segment can hold size bytes
+        """
+        if self._segment is not None and self._segment.size >= size:
+            return
+
+        if self._segment is not None:
+            self._segment.close()
+            self._segment.unlink()
+        self._segment = shared_memory.SharedMemory(create=True, size=max(size, SHARED_MEMORY_INITIAL_BYTES))
+
+    def predict(self, images: List[np.ndarray], **kwargs) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Run the model on a batch of RGB images in the worker process.
+
+        Returns (xyxy, confidence, class_id) arrays per image.
+        """
+        self.wait_ready()
+
+        layout = []
+        offset = 0
+        for image in images:
+            layout.append((offset, image.shape))
+            offset += image.nbytes
+
+        self._reserve(offset)
+        for (start, shape), image in zip(layout, images):
+            np.ndarray(shape, dtype=np.uint8, buffer=self._segment.buf, offset=start)[...] = image
+
+        try:
+            self._connection.send((self._segment.name, layout, kwargs))
+            result = self._connection.recv()
+        except (EOFError, BrokenPipeError):
+            # Replace a crashed worker so the pool keeps its capacity
+            logger.error(f"Inference worker {self.process.pid} exited, restarting")
+            self._start()
+            raise RuntimeError("Inference worker exited")
+
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def close(self):
+        """
+        Stop the worker process and release the shared memory
+        """
+        try:
+            self._connection.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self._connection.close()
+
+        if self._segment is not None:
+            self._segment.close()
+            self._segment.unlink()
+            self._segment = None
+
+
+def start_inference_workers(count: int, model_path: str, threads: int = 1) -> List[InferenceWorker]:
+    """
+    Start worker processes in parallel and return the ones that loaded the model
+    """
+    workers = [InferenceWorker(model_path, threads) for _ in range(count)]
+    ready = []
+    for worker in workers:
+        try:
+            worker.wait_ready()
+            ready.append(worker)
+        except Exception as e:
+            logger.error(f"Failed to start inference worker: {e}")
+            worker.close()
+    return ready
+
+
+class BatchScheduler:
+    """
+    Collects concurrent inference requests into batches.
+
+    A batch is dispatched to the inference pool as soon as it holds
+    max_batch_size items or its oldest item has waited max_wait_ms. The batch
+    function receives a replica and the list of items and must return one
+    result per item, in order. At most max_queue items wait to be batched;
+    further submissions are rejected with InferenceQueueFull.
+    """
+
+    def __init__(self, pool: InferencePool, batch_fn: Callable,
+                 max_batch_size: int = BATCH_MAX_SIZE, max_wait_ms: float = BATCH_MAX_WAIT_MS,
+                 max_queue: int = BATCH_QUEUE_SIZE):
+        self.pool = pool
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.max_queue = max(1, max_queue)
+
+        self._loop = None
+        self._queue = None
+        self._collector = None
+        # Items taken off the queue into the batch being formed
+        self._collecting = 0
+        self._dispatches = set()
+
+        self._batches = 0
+        self._items = 0
+        self._batch_sizes: Dict[int, int] = {}
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+
+    async def submit(self, item: Any) -> Any:
+        """
+        Queue an item for the next batch and wait for its result
+        """
+        self._ensure_collector()
+        future = self._loop.create_future()
+        try:
+            self._queue.put_nowait((item, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            raise InferenceQueueFull(self.pool.retry_after)
+        return await future
+
+    def _ensure_collector(self):
+        """
+        Start the collector task on the running event loop
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._collector is None or self._collector.done():
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._collector = loop.create_task(self._collect())
+
+    async def _collect(self):
+        """
+        Group queued items into batches and dispatch them
+        """
+        while True:
+            batch = [await self._queue.get()]
+            self._collecting = 1
+            deadline = batch[0][2] + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+                self._collecting = len(batch)
+
+            self._collecting = 0
+            self._record(batch)
+            # Dispatch without waiting so the next batch can form while this one runs
+            task = self._loop.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch: List[tuple]):
+        """
+        Run one batch on the pool and hand each caller its own result
+        """
+        try:
+            results = await self.pool.submit(self.batch_fn, [item for item, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _record(self, batch: List[tuple]):
+        """
+        Update batch size and wait time statistics
+        """
+        now = time.perf_counter()
+        size = len(batch)
+        self._batches += 1
+        self._items += size
+        self._batch_sizes[size] = self._batch_sizes.get(size, 0) + 1
+        for _, _, enqueued in batch:
+            wait = now - enqueued
+            self._total_wait += wait
+            self._max_wait_seen = max(self._max_wait_seen, wait)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get batch size and wait time statistics
+        """
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queued": (self._queue.qsize() if self._queue is not None else 0) + self._collecting,
+            "max_queue": self.max_queue,
+            "batches": self._batches,
+            "items": self._items,
+            "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+            "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+            "avg_wait_ms": round(self._total_wait / self._items * 1000, 3) if self._items else 0.0,
+            "max_wait_ms_seen": round(self._max_wait_seen * 1000, 3),
+        }
@@ -0,0 +1,276 @@
+import logging
+import os
+import struct
+import zipfile
+import zlib
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+
+logger = logging.getLogger(__name__)
+
+# Upload intake configuration
+UPLOAD_MAX_MB = float(os.getenv("UPLOAD_MAX_MB", "20"))
+UPLOAD_MAX_BYTES = int(UPLOAD_MAX_MB * 1024 * 1024)
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", "64000000"))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# JPEG EXIF/ICC segments come before the frame header; give up if it is not found within this many bytes
+UPLOAD_HEADER_MAX_BYTES = 512 * 1024
+# Room for multipart boundaries and form fields on top of the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+# Batch uploads (many photos or a zip archive in one request)
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", "200"))
+BATCH_UPLOAD_MAX_MB = float(os.getenv("BATCH_UPLOAD_MAX_MB", "1024"))
+BATCH_UPLOAD_MAX_BYTES = int(BATCH_UPLOAD_MAX_MB * 1024 * 1024)
+
+# Baseline, extended, progressive and lossless JPEG frame markers
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# JPEG markers without a length field
+JPEG_STANDALONE_MARKERS = {0x01, 0xD8} | set(range(0xD0, 0xD8))
+
+
+class UploadRejected(HTTPException):
+    """Upload refused by the intake checks, before it is fully read or decoded"""
+
+
+def _jpeg_size(head: bytes) -> Optional[Tuple[int, int]]:
+    position = 2
+    while position + 4 <= len(head):
+        if head[position] != 0xFF:
+            raise UploadRejected(status_code=400, detail="Corrupt JPEG header")
+
+        marker = head[position + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            position += 1
+            continue
+        if marker in JPEG_STANDALONE_MARKERS:
+            position += 2
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            if position + 9 > len(head):
+                return None
+            height, width = struct.unpack(">HH", head[position + 5:position + 9])
+            return width, height
+
+        (length,) = struct.unpack(">H", head[position + 2:position + 4])
+        position += 2 + length
+    return None
+
+
+def _webp_size(head: bytes) -> Optional[Tuple[int, int]]:
+    if len(head) < 30:
+        return None
+
+    chunk = head[12:16]
+    if chunk == b"VP8 ":
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        b0, b1, b2, b3 = head[21:25]
+        return 1 + (b0 | (b1 & 0x3F) << 8), 1 + (b1 >> 6 | b2 << 2 | (b3 & 0x0F) << 10)
+    if chunk == b"VP8X":
+        return 1 + int.from_bytes(head[24:27], "little"), 1 + int.from_bytes(head[27:30], "little")
+    raise UploadRejected(status_code=400, detail="Corrupt WebP header")
+
+
+def sniff_image(head: bytes) -> Optional[Tuple[str, Tuple[int, int]]]:
+    """
+    Identify an image format and its dimensions from the first bytes of a file.
+
+    Returns None when more bytes are needed to find the dimensions. Raises
+    UploadRejected for content that is not a supported image.
+    """
+    if head.startswith(b"\xff\xd8"):
+        size = _jpeg_size(head)
+        return ("JPEG", size) if size else None
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        if len(head) < 24:
+            return None
+        return "PNG", struct.unpack(">II", head[16:24])
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        if len(head) < 10:
+            return None
+        return "GIF", struct.unpack("<HH", head[6:10])
+    if head.startswith(b"BM"):
+        if len(head) < 26:
+            return None
+        width, height = struct.unpack("<ii", head[18:26])
+        return "BMP", (abs(width), abs(height))
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        size = _webp_size(head)
+        return ("WEBP", size) if size else None
+    if len(head) < 12:
+        return None
+    raise UploadRejected(status_code=415, detail="Unsupported image format (use jpg, jpeg, png, bmp, gif or webp)")
+
+
+def check_image_header(head: bytes, max_pixels: int = IMAGE_MAX_PIXELS, final: bool = False) -> Optional[Tuple[str, Tuple[int, int]]]:
+    """
+    Sniff the image header and reject images whose dimensions exceed the pixel budget
+    """
+    sniffed = sniff_image(head)
+    if sniffed is None:
+        if final or len(head) >= UPLOAD_HEADER_MAX_BYTES:
+            raise UploadRejected(status_code=400, detail="Could not read image dimensions")
+        return None
+
+    image_format, (width, height) = sniffed
+    if width == 0 or height == 0:
+        raise UploadRejected(status_code=400, detail="Image has no pixels")
+    if width * height > max_pixels:
+        raise UploadRejected(
+            status_code=413,
+            detail=f"Image is {width}x{height}; at most {max_pixels} pixels are allowed"
+        )
+    return sniffed
+
+
+async def read_image_upload(
+    file: UploadFile, max_bytes: int = UPLOAD_MAX_BYTES, max_pixels: int = IMAGE_MAX_PIXELS
+) -> bytes:
+    """
+    Read an uploaded image in chunks, rejecting it as early as possible.
+
+    The format and dimensions are checked as soon as the header has arrived,
+    so non-images and decompression bombs are refused after the first chunk,
+    and the read stops as soon as the byte cap is exceeded.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise UploadRejected(status_code=413, detail=f"File is larger than {max_bytes // (1024 * 1024)} MB")
+
+    chunks = []
+    received = 0
+    sniffed = None
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+
+        chunks.append(chunk)
+        received += len(chunk)
+        if received > max_bytes:
+            raise UploadRejected(status_code=413, detail=f"File is larger than {max_bytes // (1024 * 1024)} MB")
+        if sniffed is None and received <= UPLOAD_HEADER_MAX_BYTES:
+            sniffed = check_image_header(b"".join(chunks), max_pixels)
+
+    if sniffed is None:
+        check_image_header(b"".join(chunks), max_pixels, final=True)
+    return b"".join(chunks)
+
+
+def is_zip_archive(head: bytes) -> bool:
+    """
+    Check whether the first bytes of a file are a zip archive
+    """
+    return head.startswith((b"PK\x03\x04", b"PK\x05\x06"))
+
+
+def list_zip_images(archive: BinaryIO) -> Tuple[zipfile.ZipFile, List[zipfile.ZipInfo]]:
+    """
+    Open a zip archive and list its files, skipping directories and OS metadata.
+
+    Only the central directory is read; entries are extracted one at a time by
+    read_zip_image.
+    """
+    try:
+        zf = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise UploadRejected(status_code=400, detail="Corrupt zip archive")
+
+    entries = [
+        info for info in zf.infolist()
+        if not info.is_dir()
+        and not info.filename.startswith("__MACOSX/")
+        and not os.path.basename(info.filename).startswith(".")
+    ]
+    return zf, entries
+
+
+def read_zip_image(
+    zf: zipfile.ZipFile, info: zipfile.ZipInfo, max_bytes: int = UPLOAD_MAX_BYTES, max_pixels: int = IMAGE_MAX_PIXELS
+) -> bytes:
+    """
+    Extract one image from a zip archive with the same checks as a direct upload.
+
+    The declared size is checked before extracting and the actual size while
+    extracting, so a forged header cannot inflate an entry past the byte cap.
+    """
+    if info.file_size > max_bytes:
+        raise UploadRejected(status_code=413, detail=f"File is larger than {max_bytes // (1024 * 1024)} MB")
+
+    chunks = []
+    received = 0
+    sniffed = None
+    try:
+        with zf.open(info) as entry:
+            while True:
+                chunk = entry.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+
+                chunks.append(chunk)
+                received += len(chunk)
+                if received > max_bytes:
+                    raise UploadRejected(status_code=413, detail=f"File is larger than {max_bytes // (1024 * 1024)} MB")
+                if sniffed is None and received <= UPLOAD_HEADER_MAX_BYTES:
+                    sniffed = check_image_header(b"".join(chunks), max_pixels)
+    except (zipfile.BadZipFile, zlib.error, NotImplementedError, RuntimeError) as e:
+        # Corrupt, encrypted or unsupported-compression entries
+        raise UploadRejected(status_code=400, detail=f"Cannot extract {info.filename}: {e}")
+
+    if sniffed is None:
+        check_image_header(b"".join(chunks), max_pixels, final=True)
+    return b"".join(chunks)
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware that caps request body size.
+
+    Requests with a Content-Length over the limit are answered with 413 before
+    the body is read; chunked bodies are cut off as soon as they pass it.
+    path_limits sets a different limit for specific paths, such as batch uploads.
+    """
+
+    def __init__(
+        self, app, max_body_bytes: int = UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD_BYTES, path_limits: Optional[Dict[str, int]] = None
+    ):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        max_body_bytes = self.path_limits.get(scope["path"], self.max_body_bytes)
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > max_body_bytes:
+            logger.warning(f"Rejected {scope['path']} upload of {int(content_length)} bytes")
+            await self._reject(send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body_bytes:
+                    # Raised inside body parsing, which passes HTTPExceptions through as responses
+                    raise UploadRejected(status_code=413, detail="Request body too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send):
+        body = b'{"detail":"Request body too large"}'
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
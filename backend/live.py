@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import supervision as sv
+
+logger = logging.getLogger(__name__)
+
+# Live detection configuration
+LIVE_FRAME_MAX_MB = float(os.getenv("LIVE_FRAME_MAX_MB", "4"))
+LIVE_FRAME_MAX_BYTES = int(LIVE_FRAME_MAX_MB * 1024 * 1024)
+# Processed frames a lost track is remembered for, so an item that leaves the view briefly keeps its ID
+LIVE_TRACK_BUFFER = int(os.getenv("LIVE_TRACK_BUFFER", "30"))
+LIVE_TRACK_THRESHOLD = float(os.getenv("LIVE_TRACK_THRESHOLD", "0.25"))
+LIVE_MATCH_THRESHOLD = float(os.getenv("LIVE_MATCH_THRESHOLD", "0.8"))
+
+
+class LatestFrame:
+    """
+    Single-slot mailbox for camera frames.
+
+    A frame that arrives while the previous one is still waiting replaces it,
+    so when inference falls behind the stale frames are dropped and the next
+    detection always runs on the newest frame.
+    """
+
+    def __init__(self):
+        self.received = 0
+        self.dropped = 0
+        self._frame: Optional[Tuple[int, bytes]] = None
+        self._closed = False
+        self._event = asyncio.Event()
+
+    def put(self, data: bytes) -> int:
+        """
+        Offer a frame, replacing any frame not yet taken; returns its frame number
+        """
+        if self._frame is not None:
+            self.dropped += 1
+        self.received += 1
+        self._frame = (self.received, data)
+        self._event.set()
+        return self.received
+
+    async def get(self) -> Optional[Tuple[int, bytes]]:
+        """
+        Wait for the newest frame and its number; returns None once closed
+        """
+        while self._frame is None:
+            if self._closed:
+                return None
+            self._event.clear()
+            await self._event.wait()
+
+        frame, self._frame = self._frame, None
+        return frame
+
+    def close(self):
+        self._closed = True
+        self._event.set()
+
+
+class ItemTracker:
+    """
+    Per-connection ByteTrack state and counts of unique tracked items.
+
+    Each track is counted once, under the class it had when first seen, so an
+    item that stays in view across many frames is not counted again.
+    """
+
+    def __init__(self, class_names: List[str]):
+        self.class_names = class_names
+        self.reset()
+
+    def reset(self):
+        import supervision as sv
+
+        self.tracker = sv.ByteTrack(
+            track_thresh=LIVE_TRACK_THRESHOLD,
+            track_buffer=LIVE_TRACK_BUFFER,
+            match_thresh=LIVE_MATCH_THRESHOLD
+        )
+        self.items: Dict[int, str] = {}
+
+    def update(self, detections: sv.Detections) -> Tuple[sv.Detections, List[Dict]]:
+        """
+        Track the detections of a frame; returns the tracked detections and the items seen for the first time
+        """
+        tracked = self.tracker.update_with_detections(detections)
+
+        new_items = []
+        for track_id, class_id in zip(tracked.tracker_id.tolist(), tracked.class_id.tolist()):
+            if track_id not in self.items:
+                name = self.class_names[class_id] if class_id < len(self.class_names) else str(class_id)
+                self.items[track_id] = name
+                new_items.append({"track_id": track_id, "object": name})
+        return tracked, new_items
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Count unique tracked items per object name
+        """
+        counts: Dict[str, int] = {}
+        for name in self.items.values():
+            counts[name] = counts.get(name, 0) + 1
+        return counts
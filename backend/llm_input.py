@@ -0,0 +1,167 @@
+import base64
+import io
+import math
+import os
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+# Vision input: auto picks low detail for images that fit one 512 px tile, high detail otherwise
+GPT_IMAGE_DETAIL = os.getenv("GPT_IMAGE_DETAIL", "auto").lower()
+GPT_IMAGE_QUALITY = int(os.getenv("GPT_IMAGE_QUALITY", "85"))
+# Shrink the image by up to this share when that saves a row or column of 512 px tiles
+GPT_IMAGE_TILE_SNAP = float(os.getenv("GPT_IMAGE_TILE_SNAP", "0.15"))
+# Token budget for the detected items and cost lines in the prompt
+GPT_CONTEXT_TOKENS = int(os.getenv("GPT_CONTEXT_TOKENS", "1000"))
+
+VISION_TILE = 512
+VISION_MAX_SIDE = 2048
+VISION_SHORT_SIDE = 768
+
+
+def text_tokens(text: str) -> int:
+    """
+    Estimate the tokens of a text (about 4 characters per token)
+    """
+    return len(text) // 4
+
+
+def image_tokens(size: Tuple[int, int], detail: str = "high") -> int:
+    """
+    Estimate the prompt tokens of an image sent at its vision size: 85 for low
+    detail, plus 170 per 512 px tile for high detail
+    """
+    if detail == "low":
+        return 85
+    width, height = vision_size(size, "high", snap=0)
+    return 85 + 170 * math.ceil(width / VISION_TILE) * math.ceil(height / VISION_TILE)
+
+
+def estimate_request_tokens(texts: List[str], image_size: Optional[Tuple[int, int]], max_completion_tokens: int,
+                            detail: str = "high") -> int:
+    """
+    Estimate the tokens a chat request counts against the TPM limit: prompt text,
+    the image and the completion allowance
+    """
+    prompt = sum(text_tokens(text) for text in texts) + 10 * len(texts)
+    if image_size is not None:
+        prompt += image_tokens(image_size, detail)
+    return prompt + max_completion_tokens
+
+
+def choose_detail(size: Tuple[int, int], detail: str = GPT_IMAGE_DETAIL) -> str:
+    """
+    Pick the vision detail level for an image.
+
+    Low detail shows the model a 512 px version for a flat 85 tokens, which
+    loses nothing for images that already fit one tile; larger site photos
+    need high detail to make out individual items.
+    """
+    if detail in ("low", "high"):
+        return detail
+    return "low" if max(size) <= VISION_TILE else "high"
+
+
+def vision_size(size: Tuple[int, int], detail: str, snap: float = GPT_IMAGE_TILE_SNAP) -> Tuple[int, int]:
+    """
+    Get the size the vision model actually looks at, so no larger image is uploaded.
+
+    High detail fits the image within 2048 px, then scales the shortest side
+    down to 768 px, and bills per 512 px tile. When shrinking by at most snap
+    drops a row or column of tiles, the smaller size is used.
+    """
+    width, height = size
+    if detail == "low":
+        scale = min(1.0, VISION_TILE / max(width, height))
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    scale = min(1.0, VISION_MAX_SIDE / max(width, height))
+    scale = min(scale, VISION_SHORT_SIDE / min(width, height))
+
+    def tiles(candidate: float) -> int:
+        return math.ceil(width * candidate / VISION_TILE) * math.ceil(height * candidate / VISION_TILE)
+
+    best = scale
+    for side in (width * scale, height * scale):
+        whole_tiles = math.floor(side / VISION_TILE) * VISION_TILE
+        candidate = scale * whole_tiles / side
+        if whole_tiles and candidate >= scale * (1 - snap) and tiles(candidate) < tiles(best):
+            best = candidate
+    return max(1, math.floor(width * best)), max(1, math.floor(height * best))
+
+
+def encode_vision_image(image: Image.Image, detail: Optional[str] = None) -> Tuple[str, Tuple[int, int], str]:
+    """
+    Downscale an image to its vision size and encode it as base64 JPEG.
+
+    Returns the base64 data, the encoded size and the detail level to request.
+    """
+    detail = detail or choose_detail(image.size)
+    size = vision_size(image.size, detail)
+    if size != image.size:
+        image = image.resize(size, Image.BICUBIC, reducing_gap=3.0)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    buffered = io.BytesIO()
+    image.save(buffered, format="JPEG", quality=GPT_IMAGE_QUALITY)
+    return base64.b64encode(buffered.getvalue()).decode(), size, detail
+
+
+def summarize_detections(detected_items: Dict[str, int], budget: int) -> str:
+    """
+    List detected items with their counts, most frequent first, within a token budget
+    """
+    if not detected_items:
+        return "None"
+
+    items = sorted(detected_items.items(), key=lambda item: -item[1])
+    parts, used = [], 0
+    for index, (name, count) in enumerate(items):
+        part = f"{name} ({count})"
+        if parts and used + text_tokens(part) + 2 > budget:
+            rest = items[index:]
+            parts.append(f"and {len(rest)} more types ({sum(count for _, count in rest)} items)")
+            break
+        parts.append(part)
+        used += text_tokens(part) + 1
+    return ", ".join(parts)
+
+
+def summarize_costs(cost_breakdown: list, budget: int) -> str:
+    """
+    List cost lines, largest total first, within a token budget.
+
+    Lines that do not fit are folded into one line with their count and
+    combined cost, so the grand total in the prompt still adds up.
+    """
+    if not cost_breakdown:
+        return "No cost items detected."
+
+    lines, used = [], 0
+    ordered = sorted(cost_breakdown, key=lambda item: -item["total_cost"])
+    for index, item in enumerate(ordered):
+        line = (
+            f"- {item['object']}: {item['quantity']} x ${item['unit_cost']} = ${item['total_cost']}"
+            f" (Supplier: {item['supplier']})"
+        )
+        if lines and used + text_tokens(line) + 20 > budget:
+            rest = ordered[index:]
+            rest_total = round(sum(rest_item["total_cost"] for rest_item in rest), 2)
+            lines.append(f"- {len(rest)} smaller items ({sum(rest_item['quantity'] for rest_item in rest)} units) = ${rest_total}")
+            break
+        lines.append(line)
+        used += text_tokens(line) + 1
+    return "\n".join(lines)
+
+
+def build_context(detected_items: Dict[str, int], cost_breakdown: list,
+                  budget: int = GPT_CONTEXT_TOKENS) -> Tuple[str, str]:
+    """
+    Summarize detections and cost lines for the prompt within a token budget.
+
+    The item list gets up to a quarter of the budget; the cost lines get the rest.
+    """
+    objects = summarize_detections(detected_items, budget // 4)
+    costs = summarize_costs(cost_breakdown, budget - text_tokens(objects))
+    return objects, costs
@@ -1,25 +1,53 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
+from fastapi import FastAPI, File, Form, Header, UploadFile, HTTPException, Depends, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from typing import List, Dict, Optional
+from fastapi.responses import Response, StreamingResponse
+from typing import Awaitable, Callable, List, Dict, Optional, Union
 import uvicorn
 import logging
 import os
 from datetime import datetime
 from PIL import Image
 import io
+import json
+import re
+import asyncio
+import time
+from functools import partial
 from fastapi.staticfiles import StaticFiles
-
-# Local imports
-from models import DetectionResponse, QAResponse, HealthResponse, ItemsResponse
-from security import get_api_key
-from ai_services import AIServices
-from utils import image_to_base64, calculate_costs, get_recommendations
+from fastapi.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 
-# Load environment variables
+# Load environment variables before the local modules read their configuration
 load_dotenv()
 
+# Local imports
+from models import DetectionResponse, QAResponse, QAJobResponse, HealthResponse, ItemsResponse, HistoryPage, HistoryRecord
+from security import get_api_key
+from ai_services import AIServices, GPT_PROMPT_VERSION
+from inference import InferenceQueueFull
+from qa_jobs import PRIORITIES, QA_LONG_POLL_MAX, QAJob, QAJobQueue, QAJobQueueFull, RateLimiter, retry_delay
+from intake import (
+    BATCH_MAX_IMAGES, BATCH_UPLOAD_MAX_BYTES, UploadLimitMiddleware, UploadRejected, check_image_header, is_zip_archive,
+    list_zip_images, read_image_upload, read_zip_image
+)
+from live import LIVE_FRAME_MAX_BYTES, ItemTracker, LatestFrame
+from tiling import decode_for_detection, should_tile, tiling_mode
+from batch import BatchSummary, run_pipelined
+from catalog import CatalogSnapshot
+from metrics import DETECTIONS_PER_IMAGE, MetricsMiddleware, register_service_collector, render_metrics, time_stage
+from coalesce import SingleFlight
+from responses import MSGPACK_RESPONSE_DOCS, render_response
+from image_encoding import MEDIA_TYPES, encode_image, encoding_version, negotiate_format
+from history import create_history_store
+from cache import (
+    AnswerCache, DetectionCache, IdempotencyStore, content_hash, create_annotated_cache, create_answer_cache,
+    create_detection_cache, create_idempotency_store, create_upload_store, ANNOTATED_CACHE_TTL
+)
+from utils import (
+    calculate_costs, get_recommendations, detections_to_boxes, boxes_to_detections,
+    decode_image, format_boxes, scale_boxes
+)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -31,6 +59,12 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Reject oversized request bodies before they are read; batches get their own, larger cap
+app.add_middleware(UploadLimitMiddleware, path_limits={"/detect/batch": BATCH_UPLOAD_MAX_BYTES})
+
+# Per-route latency and in-flight requests, outermost so rejected requests are counted too
+app.add_middleware(MetricsMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -40,8 +74,142 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize AI services
+# Initialize AI services (models load in the background, see startup below)
 ai_services = AIServices()
+detection_cache = create_detection_cache()
+answer_cache = create_answer_cache()
+annotated_cache = create_annotated_cache()
+upload_store = create_upload_store()
+idempotency_store = create_idempotency_store()
+history = create_history_store()
+
+# Concurrent identical requests share one computation
+inflight = SingleFlight()
+
+# Azure calls share one rate budget; Q&A jobs are dispatched within it by priority
+qa_limiter = RateLimiter()
+qa_job_queue = QAJobQueue(qa_limiter)
+
+# Pool and cache statistics are read at scrape time
+register_service_collector(
+    lambda: ai_services.get_inference_stats(),
+    lambda: {
+        "detection": detection_cache.stats(),
+        "answer": answer_cache.stats(),
+        "annotated": annotated_cache.stats(),
+        "idempotency": idempotency_store.stats()
+    }
+)
+
+@app.on_event("startup")
+async def start_ai_services():
+    """Load and warm up the models in the background so the server accepts connections immediately"""
+    ai_services.start_warmup()
+
+@app.on_event("shutdown")
+async def shutdown_ai_services():
+    """Stop the inference pool, Q&A jobs and Azure connections on shutdown, and write pending history"""
+    await qa_job_queue.close()
+    await ai_services.close()
+    await run_in_threadpool(history.close)
+
+async def services_ready():
+    """Wait for the models to finish warming up; requests that arrive early wait rather than fail"""
+    await ai_services.wait_until_ready()
+
+async def read_upload(file: UploadFile) -> bytes:
+    """Read an uploaded image within the upload limits"""
+    with time_stage("upload_read"):
+        return await read_image_upload(file)
+
+async def run_decoder(decode: Callable[..., tuple], *args) -> tuple:
+    """Run an image decoder in the threadpool, rejecting images it cannot decode with 400"""
+    with time_stage("decode"):
+        try:
+            return await run_in_threadpool(decode, *args)
+        except (OSError, ValueError, SyntaxError) as e:
+            # Truncated or corrupt pixel data that got past the header checks is the client's fault
+            raise UploadRejected(status_code=400, detail=f"Could not decode image: {e}")
+
+async def decode_upload(image_data: bytes, tiled: Optional[bool] = None) -> tuple:
+    """Decode an uploaded image for inference, returning the image and original size"""
+    return await run_decoder(decode_for_detection, image_data, tiled)
+
+async def read_and_decode(file: UploadFile, tiled: Optional[bool] = None) -> tuple:
+    """Read an uploaded image and decode it for inference, returning the raw bytes, image and original size"""
+    image_data = await read_upload(file)
+    image, original_size = await decode_upload(image_data, tiled)
+    return image_data, image, original_size
+
+async def run_idempotent(scope: str, idempotency_key: Optional[str], fingerprint: str,
+                         compute: Callable[[], Awaitable[dict]], accept: Optional[str] = None) -> Response:
+    """
+    Run a request once per Idempotency-Key, replaying the stored response when the key is repeated.
+    
+    fingerprint identifies the request content; reusing a key for a different request is refused with 422.
+    Only successful responses are stored, so a retry after a failure runs again. The response body is
+    rendered as JSON or MessagePack according to accept, for fresh and replayed responses alike.
+    """
+    if not idempotency_key:
+        return render_response(await compute(), accept)
+    if len(idempotency_key) > 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key must be at most 255 characters")
+    
+    store_key = IdempotencyStore.make_key(scope, idempotency_key)
+    stored = idempotency_store.get(store_key)
+    if stored is not None:
+        if stored["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        return render_response(stored["response"], accept, headers={"Idempotent-Replayed": "true"})
+    
+    result = await compute()
+    if result["success"]:
+        idempotency_store.set(store_key, {"fingerprint": fingerprint, "response": result})
+    return render_response(result, accept)
+
+def queue_full_error(e: Union[InferenceQueueFull, QAJobQueueFull]) -> HTTPException:
+    """Build a 503 response for a saturated inference or Q&A job queue"""
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+async def analyze_image(image_hash: str, image: Image.Image, original_size: tuple, tiled: Optional[bool] = None) -> dict:
+    """
+    Detect construction items and calculate costs, reusing cached results for identical uploads.
+    
+    tiled is the request's tiling choice (None for the configured mode); the image must have been
+    decoded for the same choice by decode_for_detection.
+    """
+    catalog = ai_services.get_catalog()
+    cache_key = DetectionCache.make_key(image_hash, ai_services.get_detection_version(catalog, tiling_mode(tiled)))
+    result = detection_cache.get(cache_key)
+    if result is not None:
+        return result
+    
+    # Concurrent requests for the same image (from any endpoint) share one inference
+    return await inflight.do(f"analysis:{cache_key}", partial(run_analysis, cache_key, catalog, image, original_size, tiled))
+
+async def run_analysis(cache_key: str, catalog: CatalogSnapshot, image: Image.Image, original_size: tuple, tiled: Optional[bool]) -> dict:
+    """Run detection and costing for analyze_image and cache the result"""
+    detections, detected_items = await ai_services.find_objects_async(image, should_tile(original_size, tiled))
+    with time_stage("cost"):
+        cost_breakdown, total_cost = calculate_costs(detected_items, catalog)
+    DETECTIONS_PER_IMAGE.observe(sum(detected_items.values()))
+    result = {
+        "detected_items": detected_items,
+        "boxes": detections_to_boxes(detections),
+        "cost_breakdown": cost_breakdown,
+        "total_cost": total_cost,
+        "image_size": list(image.size),
+        "original_size": list(original_size)
+    }
+    
+    # Don't cache empty results from a model that failed to load
+    if ai_services.is_model_loaded():
+        detection_cache.set(cache_key, result)
+    return result
  
 # API endpoints
 @app.get("/")
@@ -56,109 +224,632 @@ async def health_check():
         status="healthy",
         timestamp=datetime.now(),
         model_loaded=ai_services.is_model_loaded(),
+        readiness=ai_services.readiness,
+        cold_start_seconds=ai_services.cold_start_seconds,
         version="1.0.0"
     )
 
-@app.post("/detect", response_model=DetectionResponse)
+@app.get("/inference/stats")
+async def inference_stats():
+    """Inference pool usage, micro-batching and detection cache statistics"""
+    return {
+        **ai_services.get_inference_stats(),
+        "detection_cache": detection_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "annotated_cache": annotated_cache.stats(),
+        "qa_jobs": qa_job_queue.stats(),
+        "coalescing": inflight.stats(),
+        "idempotency": idempotency_store.stats(),
+        "history": history.stats()
+    }
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics: per-stage latency histograms, request, queue and cache statistics"""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+@app.post("/detect", response_model=DetectionResponse, responses=MSGPACK_RESPONSE_DOCS,
+          dependencies=[Depends(services_ready)])
 async def detect_objects_endpoint(
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    boxes_only: bool = False,
+    tiled: Optional[bool] = None,
+    project: Optional[str] = None,
+    idempotency_key: Optional[str] = Header(None),
+    accept: Optional[str] = Header(None)
     # api_key: str = Depends(get_api_key)  # Temporarily disabled for testing
 ):
-    """Detect objects in uploaded image and provide cost estimation"""
+    """Detect objects in uploaded image and provide cost estimation (JSON, or MessagePack via Accept)"""
+    # Validate file type
+    if not file.content_type or not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="File must be an image (jpg, jpeg, png, bmp, gif, webp, etc.)")
+    
+    image_data = await read_upload(file)
+    image_hash = content_hash(image_data)
+    # Listing image/webp in Accept (e.g. "application/json, image/webp") gets a WebP annotated image
+    image_format = negotiate_format(accept)
+    
+    # Identical concurrent uploads share one detection, annotation and encoding
+    request_key = f"detect:{image_hash}:{boxes_only}:{tiling_mode(tiled)}:{project}:{image_format}"
+    return await run_idempotent(
+        "detect", idempotency_key, request_key,
+        partial(inflight.do, request_key, partial(
+            detect_image, image_data, image_hash, boxes_only, tiled, project, image_format
+        )),
+        accept
+    )
+
+def detection_payload(success: bool, detected_objects: dict, cost_breakdown: list, total_cost: float,
+                      recommendations: str, annotated_image: bytes = b"", annotated_image_type: Optional[str] = None,
+                      detection_id: Optional[str] = None,
+                      boxes: Optional[list] = None, image_size: Optional[list] = None,
+                      error: Optional[str] = None) -> dict:
+    """Build a /detect response body with the fields of DetectionResponse, without validating it"""
+    return {
+        "success": success,
+        "detected_objects": detected_objects,
+        "annotated_image": annotated_image,
+        "annotated_image_type": annotated_image_type,
+        "detection_id": detection_id,
+        "boxes": boxes,
+        "image_size": image_size,
+        "cost_breakdown": cost_breakdown,
+        "total_cost": float(total_cost),
+        "recommendations": recommendations,
+        "error": error,
+        "timestamp": datetime.now()
+    }
+
+async def detect_image(image_data: bytes, image_hash: str, boxes_only: bool, tiled: Optional[bool],
+                       project: Optional[str] = None, image_format: str = "jpeg") -> dict:
+    """Detect objects in an uploaded image and build the /detect response body"""
     try:
-        # Validate file type
-        if not file.content_type or not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="File must be an image (jpg, jpeg, png, bmp, gif, webp, etc.)")
+        image, original_size = await decode_upload(image_data, tiled)
         
-        # Read and process image
-        image_data = await file.read()
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Detect objects using AI services
-        annotated_image, detected_items = ai_services.detect_objects(image)
-        print("[DEBUG] Detected classes:", detected_items)  # DEBUG: Print detected classes
-        
-        # Calculate costs
-        cost_breakdown, total_cost = calculate_costs(detected_items, ai_services.get_construction_items())
+        # Detect objects and calculate costs using AI services
+        analysis = await analyze_image(image_hash, image, original_size, tiled)
+        detected_items = analysis["detected_items"]
+        cost_breakdown, total_cost = analysis["cost_breakdown"], analysis["total_cost"]
+        logger.debug(f"Detected classes: {detected_items}")
         
         # Get recommendations
         recommendations = get_recommendations(detected_items, ai_services.get_construction_items())
         
-        # Convert annotated image to base64
-        annotated_image_b64 = image_to_base64(annotated_image)
+        # Boxes in original image pixels, for the history and the boxes-only response
+        boxes = format_boxes(
+            scale_boxes(analysis["boxes"], analysis["image_size"], analysis["original_size"]), ai_services.class_names
+        )
+        history.record_detection(project, image_hash, analysis, boxes)
         
-        return DetectionResponse(
+        # Return boxes only; the annotated image is rendered on demand by /detections/{id}/annotated
+        if boxes_only:
+            upload_store.set(image_hash, image_data)
+            return detection_payload(
+                success=True,
+                detected_objects=detected_items,
+                detection_id=image_hash,
+                boxes=boxes,
+                image_size=analysis["original_size"],
+                cost_breakdown=cost_breakdown,
+                total_cost=total_cost,
+                recommendations=recommendations
+            )
+        
+        # Draw detected boxes and encode; the bytes are base64-encoded for JSON and sent as is in MessagePack
+        annotated_image = await run_in_threadpool(render_annotated_image, image, analysis["boxes"], image_format)
+        
+        return detection_payload(
             success=True,
             detected_objects=detected_items,
-            annotated_image=annotated_image_b64,
+            annotated_image=annotated_image,
+            annotated_image_type=MEDIA_TYPES[image_format],
             cost_breakdown=cost_breakdown,
             total_cost=total_cost,
-            recommendations=recommendations,
-            timestamp=datetime.now()
+            recommendations=recommendations
         )
         
+    except InferenceQueueFull as e:
+        raise queue_full_error(e)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Detection error: {e}")
-        return DetectionResponse(
+        return detection_payload(
             success=False,
             detected_objects={},
-            annotated_image="",
             cost_breakdown=[],
             total_cost=0.0,
             recommendations="",
-            error=str(e),
-            timestamp=datetime.now()
+            error=str(e)
         )
 
-@app.post("/qa", response_model=QAResponse)
+async def detect_batch_image(index: int, filename: str, read, tiled: Optional[bool] = None,
+                             project: Optional[str] = None) -> dict:
+    """Read, decode and analyze one image of a batch; failures are reported in the result instead of raised"""
+    try:
+        with time_stage("upload_read"):
+            image_data = await read()
+        image, original_size = await decode_upload(image_data, tiled)
+        
+        image_hash = content_hash(image_data)
+        while True:
+            try:
+                analysis = await analyze_image(image_hash, image, original_size, tiled)
+                break
+            except InferenceQueueFull as e:
+                # Other traffic filled the queue; the batch client is already waiting on the stream, so wait too
+                await asyncio.sleep(e.retry_after)
+        
+        # Keep the upload so /detections/{id}/annotated can render it later
+        upload_store.set(image_hash, image_data)
+        boxes = format_boxes(
+            scale_boxes(analysis["boxes"], analysis["image_size"], analysis["original_size"]), ai_services.class_names
+        )
+        history.record_detection(project, image_hash, analysis, boxes)
+        return {
+            "type": "result",
+            "index": index,
+            "filename": filename,
+            "success": True,
+            "detection_id": image_hash,
+            "detected_objects": analysis["detected_items"],
+            "boxes": boxes,
+            "image_size": analysis["original_size"],
+            "cost_breakdown": analysis["cost_breakdown"],
+            "total_cost": analysis["total_cost"]
+        }
+    except HTTPException as e:
+        return {"type": "result", "index": index, "filename": filename, "success": False, "status": e.status_code, "error": e.detail}
+    except Exception as e:
+        logger.error(f"Batch detection error for {filename}: {e}")
+        return {"type": "result", "index": index, "filename": filename, "success": False, "status": 500, "error": str(e)}
+
+@app.post("/detect/batch", dependencies=[Depends(services_ready)])
+async def detect_batch_endpoint(
+    files: List[UploadFile] = File(...),
+    tiled: Optional[bool] = None,
+    project: Optional[str] = None
+    # api_key: str = Depends(get_api_key)  # Temporarily disabled for testing
+):
+    """Detect objects in many images (or zip archives of images), streaming one NDJSON line per image"""
+    # List every image up front so a batch that is too large is refused with a proper status code
+    jobs = []
+    for file in files:
+        head = await file.read(4)
+        await file.seek(0)
+        if is_zip_archive(head):
+            archive, entries = await run_in_threadpool(list_zip_images, file.file)
+            for entry in entries:
+                jobs.append((entry.filename, partial(run_in_threadpool, read_zip_image, archive, entry)))
+        else:
+            jobs.append((file.filename, partial(read_image_upload, file)))
+        
+        if len(jobs) > BATCH_MAX_IMAGES:
+            raise UploadRejected(status_code=413, detail=f"At most {BATCH_MAX_IMAGES} images are allowed per batch")
+    
+    if not jobs:
+        raise HTTPException(status_code=400, detail="No images in the upload")
+    
+    async def result_stream():
+        started = time.perf_counter()
+        summary = BatchSummary()
+        tasks = [
+            partial(detect_batch_image, index, filename, read, tiled, project) for index, (filename, read) in enumerate(jobs)
+        ]
+        async for result in run_pipelined(tasks):
+            summary.add(result)
+            yield json.dumps(result) + "\n"
+        
+        totals = summary.to_dict(ai_services.get_catalog())
+        totals["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+        yield json.dumps({"type": "summary", **totals}) + "\n"
+    
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def render_annotated_image(image: Image.Image, boxes: dict, image_format: str = "jpeg") -> bytes:
+    """Draw detection boxes on an image and encode the result as JPEG or WebP"""
+    with time_stage("annotate"):
+        annotated = ai_services.annotate_array(image, boxes_to_detections(boxes))
+    with time_stage("encode"):
+        return encode_image(annotated, image_format)
+
+@app.get("/detections/{detection_id}/annotated", dependencies=[Depends(services_ready)])
+async def annotated_image_endpoint(detection_id: str, request: Request, tiled: Optional[bool] = None):
+    """Get the annotated image for a boxes-only detection (WebP if accepted, else JPEG), rendered once and then cached"""
+    if not re.fullmatch(r"[0-9a-f]{64}", detection_id):
+        raise HTTPException(status_code=404, detail="Detection not found")
+    
+    image_format = negotiate_format(request.headers.get("accept"))
+    version = ai_services.get_detection_version(tiling=tiling_mode(tiled))
+    cache_key = DetectionCache.make_key(detection_id, f"{version}:{encoding_version(image_format)}")
+    headers = {
+        "ETag": f'"{cache_key}"',
+        "Cache-Control": f"private, max-age={ANNOTATED_CACHE_TTL}",
+        "Vary": "Accept"
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    
+    annotated = annotated_cache.get(cache_key)
+    if annotated is None:
+        image_data = upload_store.get(detection_id)
+        if image_data is None:
+            raise HTTPException(status_code=404, detail="Detection not found or expired")
+        
+        image, original_size = await decode_upload(image_data, tiled)
+        try:
+            analysis = await analyze_image(detection_id, image, original_size, tiled)
+        except InferenceQueueFull as e:
+            raise queue_full_error(e)
+        
+        annotated = await run_in_threadpool(render_annotated_image, image, analysis["boxes"], image_format)
+        annotated_cache.set(cache_key, annotated)
+    
+    return Response(content=annotated, media_type=MEDIA_TYPES[image_format], headers=headers)
+
+def is_reset_message(text: str) -> bool:
+    """Check whether a live detection control message asks to reset the tracked items"""
+    try:
+        return json.loads(text).get("type") == "reset"
+    except (ValueError, AttributeError):
+        return False
+
+@app.websocket("/ws/detect")
+async def live_detection_endpoint(websocket: WebSocket):
+    """
+    Live camera detection over a WebSocket.
+    
+    The client sends encoded frames as binary messages, and may send {"type": "reset"} as text
+    to start counting afresh. Frames that arrive while inference is busy replace the waiting one.
+    Every processed frame is answered with its tracked boxes, the items seen for the first time
+    and the counts of unique items so far.
+    """
+    await websocket.accept()
+    await ai_services.wait_until_ready()
+    frames = LatestFrame()
+    tracker = ItemTracker(ai_services.class_names)
+    
+    async def receive_frames():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is not None:
+                    frames.put(message["bytes"])
+                elif message.get("text") and is_reset_message(message["text"]):
+                    tracker.reset()
+        finally:
+            frames.close()
+    
+    receiver = asyncio.create_task(receive_frames())
+    try:
+        while (frame := await frames.get()) is not None:
+            number, frame_data = frame
+            started = time.perf_counter()
+            try:
+                if len(frame_data) > LIVE_FRAME_MAX_BYTES:
+                    raise UploadRejected(status_code=413, detail=f"Frame is larger than {LIVE_FRAME_MAX_BYTES // (1024 * 1024)} MB")
+                check_image_header(frame_data, final=True)
+                image, original_size = await run_decoder(decode_image, frame_data)
+                detections, _ = await ai_services.find_objects_async(image)
+            except InferenceQueueFull as e:
+                await websocket.send_json({"type": "busy", "frame": number, "retry_after": e.retry_after})
+                continue
+            except HTTPException as e:
+                await websocket.send_json({"type": "error", "frame": number, "status": e.status_code, "error": e.detail})
+                continue
+            
+            tracked, new_items = tracker.update(detections)
+            boxes = scale_boxes(
+                {**detections_to_boxes(tracked), "track_id": tracked.tracker_id.tolist()}, image.size, original_size
+            )
+            counts = tracker.counts()
+            cost_breakdown, total_cost = calculate_costs(counts, ai_services.get_catalog())
+            await websocket.send_json({
+                "type": "detections",
+                "frame": number,
+                "dropped": frames.dropped,
+                "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+                "boxes": [
+                    {**box, "track_id": track_id}
+                    for box, track_id in zip(format_boxes(boxes, ai_services.class_names), boxes["track_id"])
+                ],
+                "new_items": new_items,
+                "counts": counts,
+                "cost_breakdown": cost_breakdown,
+                "total_cost": total_cost
+            })
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+
+@app.post("/qa", response_model=QAResponse, responses=MSGPACK_RESPONSE_DOCS, dependencies=[Depends(services_ready)])
 async def qa_endpoint(
     file: UploadFile = File(...),
-    question: str = None
+    question: str = None,
+    no_cache: bool = False,
+    project: Optional[str] = None,
+    idempotency_key: Optional[str] = Header(None),
+    accept: Optional[str] = Header(None)
     # api_key: str = Depends(get_api_key)  # Temporarily disabled for testing
 ):
-    """Ask questions about an image using GPT"""
+    """Ask questions about an image using GPT (JSON, or MessagePack via Accept)"""
+    if not question:
+        raise HTTPException(status_code=400, detail="Question is required")
+    
+    # Validate file type
+    if not file.content_type or not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="File must be an image")
+    
+    image_data = await read_upload(file)
+    image_hash = content_hash(image_data)
+    fingerprint = f"qa:{image_hash}:{content_hash(question.encode())}:{project}"
+    return await run_idempotent(
+        "qa", idempotency_key, fingerprint, partial(answer_question, image_data, image_hash, question, no_cache, project),
+        accept
+    )
+
+def qa_payload(success: bool, answer: str, error: Optional[str] = None) -> dict:
+    """Build a /qa response body with the fields of QAResponse"""
+    return {"success": success, "answer": answer, "error": error, "timestamp": datetime.now()}
+
+async def answer_question(image_data: bytes, image_hash: str, question: str, no_cache: bool,
+                          project: Optional[str] = None) -> dict:
+    """Answer a question about an uploaded image and build the /qa response body"""
     try:
-        if not question:
-            raise HTTPException(status_code=400, detail="Question is required")
-        
-        # Validate file type
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="File must be an image")
+        image, original_size = await decode_upload(image_data)
         
-        # Read and process image
-        image_data = await file.read()
-        image = Image.open(io.BytesIO(image_data))
+        # Detect objects for context (cached when the same image was already analyzed)
+        analysis = await analyze_image(image_hash, image, original_size)
+        detected_items = analysis["detected_items"]
+        cost_breakdown, total_cost = analysis["cost_breakdown"], analysis["total_cost"]
         
-        # Detect objects for context
-        _, detected_items = ai_services.detect_objects(image)
-        cost_breakdown, total_cost = calculate_costs(detected_items, ai_services.get_construction_items())
+        # Get GPT response, reusing the cached answer for a repeated question
+        if not ai_services.is_azure_available():
+            answer = ai_services.get_gpt_response(image, question, detected_items, cost_breakdown, total_cost)
+        else:
+            # Queued like any other job so the call stays within the Azure rate limits and is retried on 429s
+            job = await qa_job_queue.wait(await submit_qa_job(image_hash, image, question, analysis, no_cache=no_cache))
+            if job.status == "failed":
+                raise RuntimeError(job.error)
+            answer = job.answer
         
-        # Get GPT response
-        answer = ai_services.get_gpt_response(image, question, detected_items, cost_breakdown, total_cost)
-        
-        return QAResponse(
-            success=True,
-            answer=answer,
-            timestamp=datetime.now()
-        )
+        history.record_answer(project, image_hash, analysis, question, answer)
+        return qa_payload(success=True, answer=answer)
         
+    except (InferenceQueueFull, QAJobQueueFull) as e:
+        raise queue_full_error(e)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"QA error: {e}")
-        return QAResponse(
-            success=False,
-            answer="",
-            error=str(e),
-            timestamp=datetime.now()
-        ) 
+        return qa_payload(success=False, answer="", error=str(e))
+
+def answer_cache_key(image_hash: str, question: str, analysis: dict) -> str:
+    """Get the answer cache key, covering the prices from the catalog version the analysis used"""
+    return AnswerCache.make_key(
+        image_hash, question, analysis["detected_items"], GPT_PROMPT_VERSION,
+        costs=[analysis["cost_breakdown"], analysis["total_cost"]]
+    )
+
+async def submit_qa_job(image_hash: str, image: Image.Image, question: str, analysis: dict,
+                        priority: str = "normal", no_cache: bool = False) -> QAJob:
+    """
+    Queue the Azure call for a question, or record a finished job when the answer is cached.
+    
+    The same question about the same image, asked while a job for it is still unfinished, joins that job.
+    """
+    detected_items = analysis["detected_items"]
+    cache_key = answer_cache_key(image_hash, question, analysis)
+    cached = answer_cache.get(cache_key, bypass=no_cache)
+    if cached is not None:
+        return qa_job_queue.add_finished(cached["answer"])
+    
+    # Checked before encoding the prompt; submit checks again in case a duplicate was queued meanwhile
+    existing = qa_job_queue.join(cache_key)
+    if existing is not None:
+        return existing
+    
+    # Encode the prompt now so the job holds no upload and retries do not re-encode the image
+    messages, tokens = await run_in_threadpool(
+        ai_services.prepare_gpt_request, image, question, detected_items, analysis["cost_breakdown"], analysis["total_cost"]
+    )
+    
+    async def run() -> str:
+        answer = await ai_services.complete_gpt_messages(messages)
+        answer_cache.set(cache_key, {"answer": answer})
+        return answer
+    
+    return qa_job_queue.submit(run, tokens, priority, key=cache_key)
+
+def qa_job_response(job: QAJob) -> QAJobResponse:
+    """Describe a Q&A job and its outcome"""
+    return QAJobResponse(
+        job_id=job.id,
+        status=job.status,
+        priority=job.priority,
+        position=qa_job_queue.position(job),
+        attempts=job.attempts,
+        answer=job.answer,
+        error=job.error,
+        created_at=datetime.fromtimestamp(job.created_at),
+        finished_at=datetime.fromtimestamp(job.finished_at) if job.finished_at else None
+    )
+
+@app.post("/qa/jobs", response_model=QAJobResponse, status_code=202, dependencies=[Depends(services_ready)])
+async def submit_qa_job_endpoint(
+    response: Response,
+    file: UploadFile = File(...),
+    question: str = Form(None),
+    priority: str = "normal",
+    no_cache: bool = False,
+    project: Optional[str] = None
+    # api_key: str = Depends(get_api_key)  # Temporarily disabled for testing
+):
+    """Submit a question about an image as a job; poll /qa/jobs/{job_id} for the answer"""
+    if not question:
+        raise HTTPException(status_code=400, detail="Question is required")
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"priority must be one of: {', '.join(PRIORITIES)}")
+    
+    # Validate file type
+    if not file.content_type or not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="File must be an image")
+    
+    if not ai_services.is_azure_available():
+        raise HTTPException(status_code=503, detail="Azure OpenAI service not available")
+    
+    image_data, image, original_size = await read_and_decode(file)
+    image_hash = content_hash(image_data)
+    try:
+        analysis = await analyze_image(image_hash, image, original_size)
+        job = await submit_qa_job(image_hash, image, question, analysis, priority, no_cache)
+    except (InferenceQueueFull, QAJobQueueFull) as e:
+        raise queue_full_error(e)
+    
+    def record_answer(finished: QAJob):
+        if finished.status == "succeeded":
+            history.record_answer(project, image_hash, analysis, question, finished.answer)
+    
+    job.add_done_callback(record_answer)
+    response.headers["Location"] = f"/qa/jobs/{job.id}"
+    return qa_job_response(job)
+
+@app.get("/qa/jobs/{job_id}", response_model=QAJobResponse)
+async def get_qa_job(job_id: str, wait: float = 0):
+    """Get a Q&A job; with wait, long-poll up to that many seconds for it to finish"""
+    job = qa_job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    if wait > 0:
+        await qa_job_queue.wait(job, min(wait, QA_LONG_POLL_MAX))
+    return qa_job_response(job)
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    """Format a Server-Sent Event"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.post("/qa/stream", dependencies=[Depends(services_ready)])
+async def qa_stream_endpoint(
+    file: UploadFile = File(...),
+    question: str = Form(None),
+    no_cache: bool = False,
+    project: Optional[str] = None
+    # api_key: str = Depends(get_api_key)  # Temporarily disabled for testing
+):
+    """Ask questions about an image using GPT, streaming the answer as Server-Sent Events"""
+    if not question:
+        raise HTTPException(status_code=400, detail="Question is required")
+    
+    # Validate file type
+    if not file.content_type or not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="File must be an image")
+    
+    if not ai_services.is_azure_available():
+        raise HTTPException(status_code=503, detail="Azure OpenAI service not available")
+    
+    # Read and process image
+    image_data, image, original_size = await read_and_decode(file)
+    
+    # Detect objects for context before the stream starts so errors get a proper status code
+    image_hash = content_hash(image_data)
+    try:
+        analysis = await analyze_image(image_hash, image, original_size)
+    except InferenceQueueFull as e:
+        raise queue_full_error(e)
+    
+    cache_key = answer_cache_key(image_hash, question, analysis)
+    cached = answer_cache.get(cache_key, bypass=no_cache)
+    
+    async def event_stream():
+        if cached is not None:
+            yield sse_event({"delta": cached["answer"]})
+            yield sse_event({}, event="done")
+            history.record_answer(project, image_hash, analysis, question, cached["answer"])
+            return
+        
+        try:
+            # Interactive streams skip the job queue but still spend the shared Azure rate budget
+            await qa_limiter.acquire(ai_services.estimate_gpt_tokens(
+                image.size, question, analysis["detected_items"], analysis["cost_breakdown"], analysis["total_cost"]
+            ))
+            deltas = []
+            async for delta in ai_services.stream_gpt_response(
+                image, question, analysis["detected_items"], analysis["cost_breakdown"], analysis["total_cost"]
+            ):
+                deltas.append(delta)
+                yield sse_event({"delta": delta})
+            answer = "".join(deltas).strip()
+            answer_cache.set(cache_key, {"answer": answer})
+            yield sse_event({}, event="done")
+            history.record_answer(project, image_hash, analysis, question, answer)
+        except Exception as e:
+            if getattr(e, "status_code", None) == 429:
+                qa_limiter.pause(retry_delay(e, 0))
+            logger.error(f"QA stream error: {e}")
+            yield sse_event({"error": str(e)}, event="error")
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def history_record(record: dict) -> HistoryRecord:
+    """Convert a stored history record to its response model"""
+    return HistoryRecord(**{**record, "created_at": datetime.fromtimestamp(record["created_at"])})
+
+@app.get("/history", response_model=HistoryPage)
+async def history_endpoint(
+    project: Optional[str] = None,
+    item: Optional[str] = None,
+    kind: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None
+    # api_key: str = Depends(get_api_key)  # Temporarily disabled for testing
+):
+    """Recorded detections and answers, newest first, filtered by project, item, kind and date; page with cursor"""
+    if not history.enabled:
+        raise HTTPException(status_code=404, detail="History is disabled")
+    if kind is not None and kind not in ("detection", "answer"):
+        raise HTTPException(status_code=400, detail="kind must be one of: detection, answer")
+    
+    try:
+        records, next_cursor = await run_in_threadpool(
+            history.query, project, item, kind,
+            since.timestamp() if since else None, until.timestamp() if until else None, limit, cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return HistoryPage(records=[history_record(record) for record in records], next_cursor=next_cursor)
+
+@app.get("/history/{record_id}", response_model=HistoryRecord)
+async def history_record_endpoint(record_id: int):
+    """Get one recorded detection or answer with its cost breakdown, boxes and answer"""
+    record = await run_in_threadpool(history.get, record_id) if history.enabled else None
+    if record is None:
+        raise HTTPException(status_code=404, detail="Record not found")
+    return history_record(record)
 
-@app.get("/items", response_model=ItemsResponse)
+@app.get("/items", response_model=ItemsResponse, dependencies=[Depends(services_ready)])
 async def get_construction_items():
     # api_key: str = Depends(get_api_key)  # Temporarily disabled for testing
     """Get list of all construction items in database"""
-    items = ai_services.get_construction_items()
+    catalog = ai_services.get_catalog()
     return ItemsResponse(
-        items=items,
-        count=len(items)
+        items=catalog.items,
+        count=len(catalog),
+        version=catalog.version
     )
 
 # app.mount("/", StaticFiles(directory="../frontend", html=True), name="static")
@@ -0,0 +1,138 @@
+import time
+from typing import Callable, Dict
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# A dedicated registry keeps the output to this service's metrics and allows re-imports in tests
+REGISTRY = CollectorRegistry()
+
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_seconds",
+    "Time spent in each stage of the detection and Q&A pipelines",
+    ["stage"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+    registry=REGISTRY
+)
+DETECTIONS_PER_IMAGE = Histogram(
+    "detections_per_image",
+    "Construction items detected per analyzed image",
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100),
+    registry=REGISTRY
+)
+PROMPT_TOKENS = Histogram(
+    "qa_prompt_tokens",
+    "Estimated prompt tokens (text and image) per Q&A request sent to Azure",
+    buckets=(250, 500, 750, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 12000),
+    registry=REGISTRY
+)
+AZURE_TOKENS = Counter(
+    "azure_tokens",
+    "Tokens reported in Azure OpenAI usage: prompt, cached_prompt (served from the prompt cache) and completion",
+    ["kind"],
+    registry=REGISTRY
+)
+REQUEST_SECONDS = Histogram(
+    "http_request_seconds",
+    "HTTP request latency until the response body is complete",
+    ["method", "route", "status"],
+    registry=REGISTRY
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being served",
+    registry=REGISTRY
+)
+
+
+def time_stage(stage: str):
+    """
+    Time a pipeline stage; use as a context manager
+    """
+    return STAGE_SECONDS.labels(stage=stage).time()
+
+
+class ServiceCollector:
+    """
+    Reads inference pool and cache statistics at scrape time
+    """
+
+    def __init__(self, inference_stats: Callable[[], Dict], cache_stats: Callable[[], Dict[str, Dict]]):
+        self.inference_stats = inference_stats
+        self.cache_stats = cache_stats
+
+    def collect(self):
+        stats = self.inference_stats()
+        pool = stats.get("pool") or {}
+        yield GaugeMetricFamily("inference_replicas", "Model replicas in the inference pool", value=pool.get("replicas", 0))
+        yield GaugeMetricFamily("inference_in_flight", "Inference calls running on a replica", value=pool.get("in_flight", 0))
+        batching = stats.get("batching") or {}
+        yield GaugeMetricFamily(
+            "inference_queue_depth", "Inference requests waiting to be batched or for a replica",
+            value=batching.get("queued", 0) + pool.get("queued", 0)
+        )
+        yield GaugeMetricFamily("service_ready", "1 once models have warmed up", value=int(stats.get("readiness") == "ready"))
+
+        hits = CounterMetricFamily("cache_hits", "Cache lookups served from the cache", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Cache lookups not found in the cache", labels=["cache"])
+        hit_rate = GaugeMetricFamily("cache_hit_rate", "Share of cache lookups that were hits", labels=["cache"])
+        entries = GaugeMetricFamily("cache_entries", "Entries held by the cache", labels=["cache"])
+        for name, cache in self.cache_stats().items():
+            hits.add_metric([name], cache["hits"])
+            misses.add_metric([name], cache["misses"])
+            hit_rate.add_metric([name], cache["hit_rate"])
+            entries.add_metric([name], cache["entries"])
+        yield hits
+        yield misses
+        yield hit_rate
+        yield entries
+
+
+def register_service_collector(inference_stats: Callable[[], Dict], cache_stats: Callable[[], Dict[str, Dict]]):
+    """
+    Expose inference pool and cache statistics
+    """
+    REGISTRY.register(ServiceCollector(inference_stats, cache_stats))
+
+
+def render_metrics() -> tuple:
+    """
+    Render all metrics in the Prometheus text format, with its content type
+    """
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording in-flight requests and per-route latency
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def record_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, record_send)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            # The router stores the matched route in the scope; label by its template, not the raw path
+            route = scope.get("route")
+            REQUEST_SECONDS.labels(
+                method=scope["method"],
+                route=route.path if route is not None else "unmatched",
+                status=str(status)
+            ).observe(time.perf_counter() - started)
@@ -14,11 +14,21 @@ class CostItem(BaseModel):
     total_cost: float = Field(..., description="Total cost for this item")
     supplier: str = Field(..., description="Supplier URL")
 
+class DetectionBox(BaseModel):
+    """Model for a single detection box"""
+    object: str = Field(..., description="Object name")
+    confidence: float = Field(..., description="Detection confidence")
+    xyxy: List[float] = Field(..., description="Box corners (x1, y1, x2, y2) in original image pixels")
+
 class DetectionResponse(BaseModel):
     """Response model for object detection"""
     success: bool = Field(..., description="Whether the detection was successful")
     detected_objects: Dict[str, int] = Field(..., description="Detected objects and their counts")
-    annotated_image: str = Field(..., description="Base64 encoded annotated image")
+    annotated_image: str = Field(..., description="Base64 encoded annotated image (empty in boxes-only mode)")
+    annotated_image_type: Optional[str] = Field(None, description="Media type of annotated_image: image/jpeg, or image/webp when Accept lists it")
+    detection_id: Optional[str] = Field(None, description="ID for fetching the annotated image from /detections/{id}/annotated")
+    boxes: Optional[List[DetectionBox]] = Field(None, description="Detection boxes (boxes-only mode)")
+    image_size: Optional[List[int]] = Field(None, description="Width and height the boxes refer to")
     cost_breakdown: List[CostItem] = Field(..., description="Cost breakdown for detected items")
     total_cost: float = Field(..., description="Total estimated cost")
     recommendations: str = Field(..., description="AI-generated recommendations")
@@ -32,23 +42,60 @@ class QAResponse(BaseModel):
     error: Optional[str] = Field(None, description="Error message if Q&A failed")
     timestamp: datetime = Field(default_factory=datetime.now, description="Timestamp of the request")
 
+class QAJobResponse(BaseModel):
+    """Response model for Q&A jobs"""
+    job_id: str = Field(..., description="Job ID for polling /qa/jobs/{job_id}")
+    status: str = Field(..., description="queued, running, retrying, succeeded or failed")
+    priority: str = Field(..., description="Scheduling priority: high, normal or low")
+    position: Optional[int] = Field(None, description="Queued jobs that start before this one (while queued)")
+    attempts: int = Field(0, description="Azure calls made so far")
+    answer: Optional[str] = Field(None, description="AI-generated answer once the job succeeded")
+    error: Optional[str] = Field(None, description="Error message if the job failed")
+    created_at: datetime = Field(..., description="When the job was submitted")
+    finished_at: Optional[datetime] = Field(None, description="When the job finished")
+
+class HistoryRecord(BaseModel):
+    """Model for a recorded detection or Q&A answer"""
+    id: int = Field(..., description="Record ID for /history/{id}")
+    kind: str = Field(..., description="detection or answer")
+    project: Optional[str] = Field(None, description="Project the request was tagged with")
+    created_at: datetime = Field(..., description="When the result was recorded")
+    image_hash: str = Field(..., description="Content hash of the image (the detection ID)")
+    detected_objects: Dict[str, int] = Field(..., description="Detected objects and their counts")
+    total_cost: float = Field(..., description="Total estimated cost")
+    question: Optional[str] = Field(None, description="Question asked (answers only)")
+    cost_breakdown: Optional[List[CostItem]] = Field(None, description="Cost breakdown (single record only)")
+    boxes: Optional[List[DetectionBox]] = Field(None, description="Detection boxes (single detection record only)")
+    image_size: Optional[List[int]] = Field(None, description="Width and height the boxes refer to")
+    answer: Optional[str] = Field(None, description="AI-generated answer (single answer record only)")
+
+class HistoryPage(BaseModel):
+    """Response model for history queries"""
+    records: List[HistoryRecord] = Field(..., description="Records, newest first")
+    next_cursor: Optional[str] = Field(None, description="Pass as cursor to get the next page; absent on the last page")
+
 class HealthResponse(BaseModel):
     """Response model for health check"""
     status: str = Field(..., description="Service status")
     timestamp: datetime = Field(default_factory=datetime.now, description="Current timestamp")
     model_loaded: bool = Field(..., description="Whether YOLO model is loaded")
+    readiness: str = Field(default="ready", description="\"warming\" while models load and warm up, then \"ready\", or \"failed\" if warm-up failed")
+    cold_start_seconds: Optional[float] = Field(None, description="Seconds from startup until the service was ready")
     version: str = Field(default="1.0.0", description="API version")
 
 class ConstructionItem(BaseModel):
     """Model for construction items in database"""
     object: str = Field(..., description="Object name")
+    category: str = Field(default="General", description="Item category")
     unit_cost: float = Field(..., description="Unit cost in USD")
     supplier: str = Field(..., description="Supplier URL")
+    aliases: List[str] = Field(default_factory=list, description="Alternative names matched to this item")
 
 class ItemsResponse(BaseModel):
     """Response model for construction items endpoint"""
     items: List[ConstructionItem] = Field(..., description="List of construction items")
     count: int = Field(..., description="Total number of items")
+    version: Optional[str] = Field(None, description="Catalog version the items were read from")
 
 class ErrorResponse(BaseModel):
     """Standard error response model"""
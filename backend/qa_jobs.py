@@ -0,0 +1,390 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Azure OpenAI deployment quota; Azure counts max_completion_tokens against the TPM limit up front
+AZURE_RPM_LIMIT = int(os.getenv("AZURE_RPM_LIMIT", "60"))
+AZURE_TPM_LIMIT = int(os.getenv("AZURE_TPM_LIMIT", "150000"))
+
+# Q&A job queue configuration
+QA_JOB_CONCURRENCY = int(os.getenv("QA_JOB_CONCURRENCY", "8"))
+QA_JOB_MAX_QUEUED = int(os.getenv("QA_JOB_MAX_QUEUED", "200"))
+QA_JOB_TTL = int(os.getenv("QA_JOB_TTL", "3600"))
+QA_JOB_MAX_ATTEMPTS = int(os.getenv("QA_JOB_MAX_ATTEMPTS", "6"))
+QA_JOB_RETRY_AFTER = 5
+QA_LONG_POLL_MAX = 30
+RETRY_BACKOFF_BASE = 1.0
+RETRY_BACKOFF_MAX = 60.0
+
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously with capacity tokens per minute
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Seconds until amount tokens are available (requests larger than the bucket wait for a full bucket)
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """
+    Request and token budgets of an Azure OpenAI deployment.
+
+    Azure answers 429 when either per-minute quota is exhausted; spending both
+    budgets before each call keeps traffic just under the quota, and a 429
+    pauses all calls for its Retry-After time.
+    """
+
+    def __init__(self, requests_per_minute: int = AZURE_RPM_LIMIT, tokens_per_minute: int = AZURE_TPM_LIMIT):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._paused_until = 0.0
+
+    def wait_time(self, tokens: int) -> float:
+        """
+        Seconds until a call estimated at this many tokens may start
+        """
+        paused = self._paused_until - time.monotonic()
+        return max(paused, self.requests.wait_time(1), self.tokens.wait_time(tokens), 0.0)
+
+    def take(self, tokens: int):
+        self.requests.take(1)
+        self.tokens.take(tokens)
+
+    async def acquire(self, tokens: int):
+        """
+        Wait until the budgets allow a call, then spend them
+        """
+        while (wait := self.wait_time(tokens)) > 0:
+            await asyncio.sleep(wait)
+        self.take(tokens)
+
+    def pause(self, seconds: float):
+        """
+        Hold back every call for the given time (after a 429)
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class QAJobQueueFull(Exception):
+    """Raised when the Q&A job queue cannot accept more jobs"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Q&A job queue is full, please retry later")
+        self.retry_after = retry_after
+
+
+def retry_delay(error: Exception, attempt: int) -> Optional[float]:
+    """
+    Get the delay before retrying a failed Azure call, or None if it should not be retried.
+
+    Rate limits (429), timeouts, conflicts and server errors are retried with
+    full-jitter exponential backoff, never sooner than the Retry-After header.
+    """
+    import openai
+
+    status = getattr(error, "status_code", None)
+    if not (status in (408, 409, 429) or (status or 0) >= 500 or isinstance(error, openai.APIConnectionError)):
+        return None
+
+    retry_after = 0.0
+    response = getattr(error, "response", None)
+    if response is not None:
+        headers = response.headers
+        try:
+            if "retry-after-ms" in headers:
+                retry_after = float(headers["retry-after-ms"]) / 1000
+            elif "retry-after" in headers:
+                retry_after = float(headers["retry-after"])
+        except ValueError:
+            pass
+
+    backoff = random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** attempt))
+    return max(retry_after, backoff)
+
+
+class QAJob:
+    """
+    A queued Q&A request and its outcome
+    """
+
+    def __init__(self, run: Callable[[], Awaitable[str]], tokens: int, priority: str, key: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.run = run
+        self.tokens = tokens
+        self.priority = priority
+        self.order: Optional[int] = None
+        self.status = "queued"
+        self.answer: Optional[str] = None
+        self.error: Optional[str] = None
+        self.attempts = 0
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.done = asyncio.Event()
+        self._callbacks: List[Callable[["QAJob"], None]] = []
+
+    def add_done_callback(self, callback: Callable[["QAJob"], None]):
+        """
+        Call callback with the job once it finishes (right away if it already has)
+        """
+        if self.done.is_set():
+            callback(self)
+        else:
+            self._callbacks.append(callback)
+
+    def finish(self, answer: Optional[str] = None, error: Optional[str] = None):
+        self.status = "failed" if error is not None else "succeeded"
+        self.answer = answer
+        self.error = error
+        self.finished_at = time.time()
+        # Release the prompt (it holds the encoded image)
+        self.run = None
+        self.done.set()
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                logger.error(f"Q&A job callback failed: {e}")
+
+
+class QAJobQueue:
+    """
+    Priority queue of Q&A jobs, dispatched to Azure within the deployment's rate limits.
+
+    The dispatcher starts the most urgent job (by priority, then age) as soon
+    as the rate limiter and the concurrency cap allow it. Retryable failures
+    are re-queued after their backoff, keeping their place in priority order.
+    Jobs submitted with the key of an unfinished job share that job rather
+    than calling Azure again. Finished jobs are kept for ttl seconds so
+    clients can fetch the result.
+    """
+
+    def __init__(self, limiter: RateLimiter, concurrency: int = QA_JOB_CONCURRENCY,
+                 max_queued: int = QA_JOB_MAX_QUEUED, ttl: int = QA_JOB_TTL, max_attempts: int = QA_JOB_MAX_ATTEMPTS):
+        self.limiter = limiter
+        self.concurrency = max(1, concurrency)
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+
+        self._jobs: Dict[str, QAJob] = {}
+        self._unfinished: Dict[str, QAJob] = {}
+        self._heap: List[Tuple[int, int, QAJob]] = []
+        self._order = itertools.count()
+        self._running = 0
+        self._retrying = 0
+        self._loop = None
+        self._changed = None
+        self._dispatcher = None
+        self._tasks = set()
+
+        self._completed = 0
+        self._failed = 0
+        self._retries = 0
+        self._rate_limited = 0
+        self._coalesced = 0
+
+    def submit(self, run: Callable[[], Awaitable[str]], tokens: int, priority: str = "normal",
+               key: Optional[str] = None) -> QAJob:
+        """
+        Queue a job; run is called (possibly several times) to make the Azure call and return the answer.
+
+        If an unfinished job was submitted with the same key, that job is returned instead.
+        """
+        existing = self.join(key)
+        if existing is not None:
+            return existing
+
+        self._ensure_dispatcher()
+        self._expire()
+        if len(self._heap) + self._retrying >= self.max_queued:
+            raise QAJobQueueFull(QA_JOB_RETRY_AFTER)
+
+        job = QAJob(run, tokens, priority, key)
+        self._jobs[job.id] = job
+        if key is not None:
+            self._unfinished[key] = job
+        self._push(job)
+        return job
+
+    def join(self, key: Optional[str]) -> Optional[QAJob]:
+        """
+        Get the unfinished job submitted with this key, if any, to share its result
+        """
+        job = self._unfinished.get(key) if key is not None else None
+        if job is not None:
+            self._coalesced += 1
+        return job
+
+    def add_finished(self, answer: str) -> QAJob:
+        """
+        Record a job that needs no Azure call, such as a cached answer
+        """
+        self._expire()
+        job = QAJob(None, 0, "normal")
+        job.finish(answer=answer)
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[QAJob]:
+        return self._jobs.get(job_id)
+
+    def position(self, job: QAJob) -> Optional[int]:
+        """
+        Get the number of queued jobs that will start before this one
+        """
+        if job.status != "queued":
+            return None
+        key = (PRIORITIES[job.priority], job.order)
+        return sum(1 for priority, order, _ in self._heap if (priority, order) < key)
+
+    async def wait(self, job: QAJob, timeout: Optional[float] = None) -> QAJob:
+        """
+        Wait until the job has finished or the timeout has passed
+        """
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return job
+
+    def _push(self, job: QAJob):
+        job.status = "queued"
+        if job.order is None:
+            job.order = next(self._order)
+        heapq.heappush(self._heap, (PRIORITIES[job.priority], job.order, job))
+        self._changed.set()
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def _ensure_dispatcher(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._dispatcher is None or self._dispatcher.done():
+            self._loop = loop
+            self._changed = asyncio.Event()
+            self._dispatcher = loop.create_task(self._dispatch())
+
+    async def _dispatch(self):
+        """
+        Start jobs in priority order whenever a slot and the rate budget are free
+        """
+        while True:
+            self._changed.clear()
+            wait = None
+            if self._heap and self._running < self.concurrency:
+                job = self._heap[0][2]
+                wait = self.limiter.wait_time(job.tokens)
+                if wait <= 0:
+                    heapq.heappop(self._heap)
+                    self.limiter.take(job.tokens)
+                    self._start(job)
+                    continue
+
+            # Sleep until the budget refills or a job is added or finishes
+            try:
+                await asyncio.wait_for(self._changed.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _start(self, job: QAJob):
+        self._running += 1
+        job.status = "running"
+        job.attempts += 1
+        task = self._loop.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job: QAJob):
+        try:
+            answer = await job.run()
+            self._finish(job, answer=answer)
+            self._completed += 1
+        except Exception as e:
+            delay = retry_delay(e, job.attempts) if job.attempts < self.max_attempts else None
+            if delay is None:
+                logger.error(f"Q&A job {job.id} failed after {job.attempts} attempt(s): {e}")
+                self._finish(job, error=str(e))
+                self._failed += 1
+            else:
+                self._retries += 1
+                if getattr(e, "status_code", None) == 429:
+                    # The quota is exhausted for every job, not just this one
+                    self._rate_limited += 1
+                    self.limiter.pause(delay)
+                logger.warning(f"Q&A job {job.id} attempt {job.attempts} failed ({e}), retrying in {delay:.1f}s")
+                job.status = "retrying"
+                self._retrying += 1
+                self._loop.call_later(delay, self._requeue, job)
+        finally:
+            self._running -= 1
+            self._changed.set()
+
+    def _finish(self, job: QAJob, answer: Optional[str] = None, error: Optional[str] = None):
+        if job.key is not None and self._unfinished.get(job.key) is job:
+            del self._unfinished[job.key]
+        job.finish(answer, error)
+
+    def _requeue(self, job: QAJob):
+        self._retrying -= 1
+        self._push(job)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get queue and outcome statistics
+        """
+        return {
+            "queued": len(self._heap),
+            "running": self._running,
+            "retrying": self._retrying,
+            "concurrency": self.concurrency,
+            "completed": self._completed,
+            "failed": self._failed,
+            "retries": self._retries,
+            "rate_limited": self._rate_limited,
+            "coalesced": self._coalesced,
+            "rpm_limit": int(self.limiter.requests.capacity),
+            "tpm_limit": int(self.limiter.tokens.capacity),
+        }
+
+    async def close(self):
+        """
+        Stop the dispatcher and cancel running jobs
+        """
+        for task in [self._dispatcher, *self._tasks]:
+            if task is not None:
+                task.cancel()
@@ -0,0 +1,125 @@
+import base64
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import msgpack
+import numpy as np
+import orjson
+from fastapi.responses import Response
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+JSON_MEDIA_TYPES = ("application/json", "application/*", "*/*")
+
+
+def _json_default(value: Any) -> Any:
+    # Binary fields (the annotated image) are base64 in JSON
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(value).decode()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def _msgpack_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Type is not MessagePack serializable: {type(value).__name__}")
+
+
+def dump_json(payload: Any) -> bytes:
+    """
+    Serialize a response payload to JSON with orjson; bytes become base64 strings
+    """
+    return orjson.dumps(payload, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def dump_msgpack(payload: Any) -> bytes:
+    """
+    Serialize a response payload to MessagePack; bytes stay binary and datetimes become ISO strings
+    """
+    return msgpack.packb(payload, default=_msgpack_default, use_bin_type=True)
+
+
+def load_msgpack(data: bytes) -> Any:
+    return msgpack.unpackb(data, raw=False)
+
+
+class FastJSONResponse(Response):
+    """
+    JSON response serialized with orjson, skipping response model validation.
+
+    Payloads are plain dicts shaped like the endpoint's response model, which
+    stays the documented schema. orjson writes multi-megabyte strings several
+    times faster than the json module, and skipping the model avoids copying
+    the payload through validation and jsonable_encoder.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dump_json(content)
+
+
+class MsgpackResponse(Response):
+    """
+    MessagePack response; binary fields are sent as raw bytes rather than base64
+    """
+
+    media_type = MSGPACK_MEDIA_TYPES[0]
+
+    def render(self, content: Any) -> bytes:
+        return dump_msgpack(content)
+
+
+def accept_quality(accept: str, media_types: tuple) -> float:
+    """
+    Get the highest quality the Accept header gives any of the media types (0 when none is accepted)
+    """
+    best = 0.0
+    for media_range in accept.split(","):
+        media_type, *params = [part.strip() for part in media_range.split(";")]
+        if media_type.lower() not in media_types:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        best = max(best, quality)
+    return best
+
+
+def wants_msgpack(accept: Optional[str]) -> bool:
+    """
+    Check whether the client prefers MessagePack over JSON; JSON wins ties and a missing Accept header
+    """
+    if not accept:
+        return False
+    return accept_quality(accept, MSGPACK_MEDIA_TYPES) > accept_quality(accept, JSON_MEDIA_TYPES)
+
+
+def render_response(payload: Dict[str, Any], accept: Optional[str], status_code: int = 200,
+                    headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Render a payload as MessagePack or JSON, as negotiated by the Accept header
+    """
+    response_class = MsgpackResponse if wants_msgpack(accept) else FastJSONResponse
+    response = response_class(payload, status_code=status_code, headers=headers)
+    response.headers["Vary"] = "Accept"
+    return response
+
+
+# Documents the MessagePack variant next to the JSON schema of the response model
+MSGPACK_RESPONSE_DOCS = {
+    200: {
+        "content": {MSGPACK_MEDIA_TYPES[0]: {}},
+        "description": "JSON, or MessagePack (binary fields as raw bytes) when requested with Accept: application/msgpack",
+    }
+}
@@ -0,0 +1,17 @@
+import os
+import shutil
+import tempfile
+
+# main creates its stores at import, so they are pointed away from the real
+# history database and disk caches before any test module imports it
+TEST_DATA_DIR = tempfile.mkdtemp(prefix="construction-tests-")
+
+os.environ["HISTORY_DB_PATH"] = os.path.join(TEST_DATA_DIR, "history.db")
+os.environ["ANSWER_CACHE_BACKEND"] = "memory"
+os.environ["IDEMPOTENCY_BACKEND"] = "memory"
+for name in ("DETECTION_CACHE_DIR", "ANSWER_CACHE_DIR", "ANNOTATED_CACHE_DIR", "IDEMPOTENCY_DIR"):
+    os.environ[name] = os.path.join(TEST_DATA_DIR, name.lower())
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(TEST_DATA_DIR, ignore_errors=True)
@@ -0,0 +1,103 @@
+import types
+
+import numpy as np
+import pytest
+import supervision as sv
+
+from ai_services import AIServices
+from catalog import CatalogSnapshot
+
+
+def create_services(names, item_names):
+    """Create AIServices with a stand-in model, without loading any weights"""
+    services = AIServices.__new__(AIServices)
+    services.model = types.SimpleNamespace(model=types.SimpleNamespace(names=names))
+    items = [{"object": name, "unit_cost": 0, "supplier": "", "aliases": []} for name in item_names]
+    services._build_class_allowlist(CatalogSnapshot(items, "test"))
+    return services
+
+def test_class_allowlist_built_from_construction_items():
+    """Test that the allowlist mask matches construction item names"""
+    services = create_services({0: "person", 1: "bicycle", 2: "Hammer"}, ["person", "Hammer", "Drill"])
+    assert services.allowed_class_ids == [0, 2]
+    assert services.allowed_class_mask.tolist() == [True, False, True]
+
+def test_class_allowlist_is_case_insensitive():
+    """Test that model class names match catalog items regardless of case"""
+    services = create_services({0: "sink", 1: "toilet", 2: "car"}, ["Sink", "Toilet"])
+    assert services.allowed_class_ids == [0, 1]
+
+def test_filter_detections_keeps_and_counts_construction_items():
+    """Test that non-construction detections are dropped and the rest counted"""
+    services = create_services({0: "person", 1: "bicycle", 2: "Hammer"}, ["person", "Hammer"])
+    detections = sv.Detections(
+        xyxy=np.arange(20, dtype=np.float32).reshape(5, 4),
+        confidence=np.array([0.9, 0.8, 0.7, 0.6, 0.5], dtype=np.float32),
+        class_id=np.array([0, 1, 2, 2, 1])
+    )
+
+    filtered, detected_items = services._filter_detections(detections)
+    assert detected_items == {"person": 1, "Hammer": 2}
+    assert filtered.class_id.tolist() == [0, 2, 2]
+    assert filtered.confidence.tolist() == pytest.approx([0.9, 0.7, 0.6])
+    assert filtered.xyxy[1].tolist() == [8, 9, 10, 11]
+
+def test_filter_detections_empty():
+    """Test filtering when nothing is detected or nothing is allowed"""
+    services = create_services({0: "person", 1: "bicycle"}, ["person"])
+    assert services._filter_detections(sv.Detections.empty())[1] == {}
+
+    detections = sv.Detections(
+        xyxy=np.zeros((2, 4), dtype=np.float32),
+        confidence=np.ones(2, dtype=np.float32),
+        class_id=np.array([1, 1])
+    )
+    filtered, detected_items = services._filter_detections(detections)
+    assert len(filtered) == 0
+    assert detected_items == {}
+
+def test_gpt_messages_put_request_data_after_static_prefix():
+    """Test that the system prompt is byte-identical across requests and per-request data follows it"""
+    from PIL import Image
+    from prompts import QA_SYSTEM_PROMPT
+
+    services = AIServices()
+    image = Image.new("RGB", (640, 480), "gray")
+    costs = [{"object": "Hammer", "quantity": 2, "unit_cost": 15.0, "total_cost": 30.0, "supplier": "https://example.com"}]
+    first = services._build_gpt_messages(image, "What will this cost?", {"Hammer": 2}, costs, 30.0)
+    second = services._build_gpt_messages(image, "How long will it take?", {"Drill": 1}, [], 0.0)
+
+    assert first[0] == second[0] == {"role": "system", "content": QA_SYSTEM_PROMPT}
+    context, picture, question = first[1]["content"]
+    assert "Hammer (2)" in context["text"] and "$30.0" in context["text"]
+    assert picture["type"] == "image_url"
+    assert question["text"].startswith("User question: What will this cost?")
+    # Same photo, different question: everything before the question is shared
+    repeat = services._build_gpt_messages(image, "How long will it take?", {"Hammer": 2}, costs, 30.0)
+    assert repeat[1]["content"][:2] == first[1]["content"][:2]
+
+def test_static_prompt_prefix_is_cacheable():
+    """Test that the system prompt alone reaches Azure's minimum cacheable prefix length"""
+    from llm_input import text_tokens
+    from prompts import PROMPT_CACHE_MIN_TOKENS, QA_SYSTEM_PROMPT
+    
+    assert text_tokens(QA_SYSTEM_PROMPT) >= PROMPT_CACHE_MIN_TOKENS
+
+@pytest.mark.parametrize("raises", [False, True])
+def test_warm_up_reports_failure(monkeypatch, raises):
+    """Test that warm-up ends in "failed" when initialization raises or no model loaded, and still releases waiters"""
+    services = AIServices()
+
+    def initialize():
+        if raises:
+            raise RuntimeError("no weights")
+
+    monkeypatch.setattr(services, "_initialize_services", initialize)
+    services._warm_up()
+    assert services.readiness == "failed"
+    assert services._ready.is_set()
+
+    services.model = object()
+    monkeypatch.setattr(services, "_initialize_services", lambda: None)
+    services._warm_up()
+    assert services.readiness == "ready"
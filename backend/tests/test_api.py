@@ -4,6 +4,11 @@ from main import app
 import io
 from PIL import Image
 import numpy as np
+import json
+import zipfile
+import base64
+from cache import AnnotatedImageCache, AnswerCache, IdempotencyStore, MemoryCacheBackend
+from history import HistoryStore
 
 client = TestClient(app)
 
@@ -39,6 +44,14 @@ def test_health_endpoint():
     assert "model_loaded" in data
     assert "version" in data
 
+def test_health_reports_readiness():
+    """Test that warm-up ends in ready when the model loaded and in failed otherwise"""
+    client.get("/items")
+    data = client.get("/health").json()
+    assert data["status"] == "healthy"
+    assert data["readiness"] == ("ready" if data["model_loaded"] else "failed")
+    assert data["cold_start_seconds"] is not None
+
 def test_detect_endpoint_no_auth():
     """Test detection endpoint without authentication"""
     test_image = create_test_image()
@@ -77,5 +90,323 @@ def test_missing_question():
     response = client.post("/qa", files=files)
     assert response.status_code == 401  # Should require authentication first
 
+def test_qa_stream_missing_question():
+    """Test streaming Q&A endpoint without question"""
+    test_image = create_test_image()
+    files = {"file": ("test.jpg", test_image, "image/jpeg")}
+    
+    response = client.post("/qa/stream", files=files)
+    assert response.status_code == 400
+
+@pytest.mark.parametrize("path", ["/detect", "/qa/stream", "/qa/jobs"])
+def test_truncated_image_is_rejected(monkeypatch, path):
+    """Test that an image whose pixel data is cut off is answered with 400, not 500"""
+    import main
+    
+    monkeypatch.setattr(main.ai_services, "is_azure_available", lambda: True)
+    
+    files = {"file": ("test.jpg", create_test_image().getvalue()[:600], "image/jpeg")}
+    response = client.post(path, files=files, data={"question": "What will this cost?"})
+    assert response.status_code == 400
+    assert "Could not decode image" in response.json()["detail"]
+
+def test_qa_stream_sends_events(monkeypatch):
+    """Test that streaming Q&A sends each delta as a Server-Sent Event"""
+    import main
+    
+    async def fake_stream(image, question, detected_items, cost_breakdown, total_cost):
+        for delta in ["Hello", " world"]:
+            yield delta
+    
+    monkeypatch.setattr(main.ai_services, "is_azure_available", lambda: True)
+    monkeypatch.setattr(main.ai_services, "stream_gpt_response", fake_stream)
+    monkeypatch.setattr(main, "answer_cache", AnswerCache(None))
+    
+    test_image = create_test_image()
+    files = {"file": ("test.jpg", test_image, "image/jpeg")}
+    data = {"question": "What will this cost?"}
+    
+    response = client.post("/qa/stream", files=files, data=data)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text == (
+        'data: {"delta": "Hello"}\n\n'
+        'data: {"delta": " world"}\n\n'
+        'event: done\ndata: {}\n\n'
+    )
+
+def test_qa_stream_serves_cached_answer(monkeypatch):
+    """Test that a repeated question is answered from the answer cache"""
+    import main
+    calls = []
+    
+    async def fake_stream(image, question, detected_items, cost_breakdown, total_cost):
+        calls.append(question)
+        yield "Cached answer"
+    
+    monkeypatch.setattr(main.ai_services, "is_azure_available", lambda: True)
+    monkeypatch.setattr(main.ai_services, "stream_gpt_response", fake_stream)
+    monkeypatch.setattr(main, "answer_cache", AnswerCache(MemoryCacheBackend(ttl=60, max_bytes=1024 * 1024)))
+    
+    image_bytes = create_test_image().getvalue()
+    for question in ["What will this cost?", "what will this cost"]:
+        files = {"file": ("test.jpg", image_bytes, "image/jpeg")}
+        response = client.post("/qa/stream", files=files, data={"question": question})
+        assert 'data: {"delta": "Cached answer"}' in response.text
+    assert calls == ["What will this cost?"]
+    
+    files = {"file": ("test.jpg", image_bytes, "image/jpeg")}
+    client.post("/qa/stream?no_cache=true", files=files, data={"question": "What will this cost?"})
+    assert len(calls) == 2
+
+def test_qa_job_submit_and_poll(monkeypatch):
+    """Test that a Q&A job is accepted at once and its answer is fetched by long-polling"""
+    import main
+
+    async def fake_complete(messages):
+        return "Job answer"
+
+    monkeypatch.setattr(main.ai_services, "is_azure_available", lambda: True)
+    monkeypatch.setattr(main.ai_services, "complete_gpt_messages", fake_complete)
+    monkeypatch.setattr(main, "answer_cache", AnswerCache(None))
+
+    files = {"file": ("test.jpg", create_test_image(), "image/jpeg")}
+    response = client.post("/qa/jobs?priority=high", files=files, data={"question": "What will this cost?"})
+    assert response.status_code == 202
+    job = response.json()
+    assert job["priority"] == "high"
+    assert response.headers["location"] == f"/qa/jobs/{job['job_id']}"
+
+    response = client.get(f"/qa/jobs/{job['job_id']}?wait=5")
+    assert response.status_code == 200
+    assert response.json()["status"] == "succeeded"
+    assert response.json()["answer"] == "Job answer"
+
+    assert client.get("/qa/jobs/unknown").status_code == 404
+    files = {"file": ("test.jpg", create_test_image(), "image/jpeg")}
+    response = client.post("/qa/jobs?priority=urgent", files=files, data={"question": "What will this cost?"})
+    assert response.status_code == 400
+
+def test_detect_idempotency_key_replays_response(monkeypatch):
+    """Test that a repeated Idempotency-Key replays the stored response and refuses a different request"""
+    import main
+    monkeypatch.setattr(main, "idempotency_store", IdempotencyStore(MemoryCacheBackend(ttl=60, max_bytes=1024 * 1024)))
+    
+    image_bytes = create_test_image().getvalue()
+    headers = {"Idempotency-Key": "upload-1"}
+    first = client.post("/detect?boxes_only=true", files={"file": ("test.jpg", image_bytes, "image/jpeg")}, headers=headers)
+    assert first.status_code == 200
+    assert "idempotent-replayed" not in first.headers
+    
+    replay = client.post("/detect?boxes_only=true", files={"file": ("test.jpg", image_bytes, "image/jpeg")}, headers=headers)
+    assert replay.status_code == 200
+    assert replay.headers["idempotent-replayed"] == "true"
+    assert replay.json() == first.json()
+    
+    other = create_test_image().getvalue()
+    response = client.post("/detect?boxes_only=true", files={"file": ("test.jpg", other, "image/jpeg")}, headers=headers)
+    assert response.status_code == 422
+
+def test_detect_is_recorded_in_history(monkeypatch, tmp_path):
+    """Test that detections are recorded under their project and listed by /history"""
+    import main
+    store = HistoryStore(str(tmp_path / "history.db"))
+    monkeypatch.setattr(main, "history", store)
+
+    for _ in range(3):
+        files = {"file": ("test.jpg", create_test_image(), "image/jpeg")}
+        assert client.post("/detect?boxes_only=true&project=site-a", files=files).status_code == 200
+    store.flush()
+
+    page = client.get("/history?project=site-a&limit=2").json()
+    assert len(page["records"]) == 2
+    assert page["records"][0]["kind"] == "detection"
+    rest = client.get(f"/history?project=site-a&limit=2&cursor={page['next_cursor']}").json()
+    assert len(rest["records"]) == 1
+    assert rest["next_cursor"] is None
+
+    record = client.get(f"/history/{rest['records'][0]['id']}").json()
+    assert record["image_size"] == [100, 100]
+    assert client.get("/history?cursor=bogus").status_code == 400
+    assert client.get("/history/999999").status_code == 404
+    store.close()
+
+def test_detect_boxes_only_and_annotated_image(monkeypatch):
+    """Test that boxes-only detection skips the image and renders it on demand"""
+    import main
+    renders = []
+    render_annotated_image = main.render_annotated_image
+    
+    def counting_render(image, boxes, image_format="jpeg"):
+        renders.append(boxes)
+        return render_annotated_image(image, boxes, image_format)
+    
+    monkeypatch.setattr(main, "render_annotated_image", counting_render)
+    monkeypatch.setattr(main, "annotated_cache", AnnotatedImageCache(MemoryCacheBackend(ttl=60, max_bytes=1024 * 1024)))
+    
+    files = {"file": ("test.jpg", create_test_image(), "image/jpeg")}
+    response = client.post("/detect?boxes_only=true", files=files)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["annotated_image"] == ""
+    assert data["boxes"] == []
+    assert data["image_size"] == [100, 100]
+    
+    url = f"/detections/{data['detection_id']}/annotated"
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    assert Image.open(io.BytesIO(response.content)).size == (100, 100)
+    
+    assert client.get(url).content == response.content
+    assert client.get(url, headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+    assert len(renders) == 1
+    
+    # Clients that accept WebP get a separately cached WebP rendering
+    response = client.get(url, headers={"Accept": "image/webp,image/*;q=0.8"})
+    assert response.headers["content-type"] == "image/webp"
+    assert response.headers["vary"] == "Accept"
+    assert Image.open(io.BytesIO(response.content)).format == "WEBP"
+    assert len(renders) == 2
+
+def test_detect_negotiates_msgpack():
+    """Test that /detect sends MessagePack with the raw JPEG when asked, and the same image as base64 in JSON"""
+    from responses import load_msgpack
+    image_bytes = create_test_image().getvalue()
+
+    response = client.post("/detect", files={"file": ("test.jpg", image_bytes, "image/jpeg")},
+                           headers={"Accept": "application/msgpack"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/msgpack"
+    data = load_msgpack(response.content)
+    assert data["success"]
+    assert data["annotated_image"][:2] == b"\xff\xd8"
+
+    response = client.post("/detect", files={"file": ("test.jpg", image_bytes, "image/jpeg")})
+    assert response.headers["content-type"] == "application/json"
+    assert base64.b64decode(response.json()["annotated_image"]) == data["annotated_image"]
+
+def test_detect_tiled_mode():
+    """Test that tiled detection returns boxes for the original image size"""
+    image = Image.fromarray(np.random.randint(0, 255, (900, 1400, 3), dtype=np.uint8))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG")
+    files = {"file": ("large.jpg", buffer.getvalue(), "image/jpeg")}
+    
+    response = client.post("/detect?boxes_only=true&tiled=true", files=files)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["success"]
+    assert data["image_size"] == [1400, 900]
+
+def test_annotated_image_unknown_detection():
+    """Test that unknown or malformed detection IDs are not found"""
+    assert client.get(f"/detections/{'0' * 64}/annotated").status_code == 404
+    assert client.get("/detections/not-an-id/annotated").status_code == 404
+
+def test_upload_rejected_before_decode():
+    """Test that oversized bodies and non-image content are refused up front"""
+    response = client.post("/detect", content=b"x", headers={"Content-Length": str(100 * 1024 * 1024)})
+    assert response.status_code == 413
+    
+    files = {"file": ("test.jpg", b"%PDF-1.7 not really an image", "image/jpeg")}
+    response = client.post("/detect", files=files)
+    assert response.status_code == 415
+
+def test_detect_batch_streams_results_and_summary():
+    """Test that a batch of uploads and zipped images yields one line per image and a summary"""
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("site/a.jpg", create_test_image().getvalue())
+        zf.writestr("site/readme.txt", b"these are not the images you are looking for")
+    files = [
+        ("files", ("b.jpg", create_test_image(), "image/jpeg")),
+        ("files", ("site.zip", archive.getvalue(), "application/zip")),
+    ]
+    
+    response = client.post("/detect/batch", files=files)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    
+    results = sorted(lines[:-1], key=lambda line: line["index"])
+    assert [result["filename"] for result in results] == ["b.jpg", "site/a.jpg", "site/readme.txt"]
+    assert [result["success"] for result in results] == [True, True, False]
+    assert results[0]["image_size"] == [100, 100]
+    assert results[2]["status"] == 415
+    
+    summary = lines[-1]
+    assert summary["type"] == "summary"
+    assert (summary["images"], summary["succeeded"], summary["failed"]) == (3, 2, 1)
+    assert "total_cost" in summary
+    assert client.get(f"/detections/{results[0]['detection_id']}/annotated").status_code == 200
+
+def test_detect_batch_reports_undecodable_image_as_400():
+    """Test that a truncated image in a batch fails with 400 like /detect, and the rest still succeed"""
+    files = [
+        ("files", ("good.jpg", create_test_image(), "image/jpeg")),
+        ("files", ("cut.jpg", create_test_image().getvalue()[:600], "image/jpeg")),
+    ]
+    
+    response = client.post("/detect/batch", files=files)
+    assert response.status_code == 200
+    results = sorted([json.loads(line) for line in response.text.splitlines()][:-1], key=lambda line: line["index"])
+    assert [result["success"] for result in results] == [True, False]
+    assert results[1]["status"] == 400
+    assert "Could not decode image" in results[1]["error"]
+
+def test_detect_batch_rejects_too_many_images(monkeypatch):
+    """Test that oversized batches are refused before any image is processed"""
+    import main
+    monkeypatch.setattr(main, "BATCH_MAX_IMAGES", 1)
+    files = [("files", (f"{i}.jpg", create_test_image(), "image/jpeg")) for i in range(2)]
+    assert client.post("/detect/batch", files=files).status_code == 413
+
+def test_live_detection_websocket():
+    """Test that live frames are answered with tracked detections and bad frames with errors"""
+    with client.websocket_connect("/ws/detect") as websocket:
+        websocket.send_bytes(create_test_image().getvalue())
+        message = websocket.receive_json()
+        assert message["type"] == "detections"
+        assert message["frame"] == 1
+        assert message["counts"] == {}
+        assert message["boxes"] == []
+        
+        websocket.send_bytes(b"definitely not a picture")
+        message = websocket.receive_json()
+        assert message["type"] == "error"
+        assert message["frame"] == 2
+        assert message["status"] == 415
+
+def test_live_detection_survives_truncated_frame():
+    """Test that a frame that cannot be decoded is answered with an error and the session continues"""
+    with client.websocket_connect("/ws/detect") as websocket:
+        websocket.send_bytes(create_test_image().getvalue()[:600])
+        message = websocket.receive_json()
+        assert message["type"] == "error"
+        assert message["frame"] == 1
+        assert message["status"] == 400
+        
+        websocket.send_bytes(create_test_image().getvalue())
+        message = websocket.receive_json()
+        assert message["type"] == "detections"
+        assert message["frame"] == 2
+
+def test_metrics_endpoint():
+    """Test that stage latencies and cache statistics are exported in Prometheus format"""
+    files = {"file": ("test.jpg", create_test_image(), "image/jpeg")}
+    client.post("/detect", files=files)
+    
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'pipeline_stage_seconds_count{stage="upload_read"}' in body
+    assert 'pipeline_stage_seconds_count{stage="decode"}' in body
+    assert 'pipeline_stage_seconds_count{stage="encode"}' in body
+    assert 'cache_hit_rate{cache="detection"}' in body
+    assert 'http_request_seconds_count{method="POST",route="/detect",status="200"}' in body
+    assert "inference_queue_depth" in body
+
 if __name__ == "__main__":
     pytest.main([__file__]) 
\ No newline at end of file
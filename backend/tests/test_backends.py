@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+import supervision as sv
+
+from backends import backend_name, load_model, match_detections
+
+
+def create_detections(boxes, class_ids, confidences):
+    """Create detections from plain lists"""
+    return sv.Detections(
+        xyxy=np.array(boxes, dtype=np.float32),
+        confidence=np.array(confidences, dtype=np.float32),
+        class_id=np.array(class_ids)
+    )
+
+def test_backend_name():
+    """Test backend names used in detection versions"""
+    assert backend_name("torch", True) == "torch"
+    assert backend_name("onnx", False) == "onnx"
+    assert backend_name("openvino", True) == "openvino-int8"
+
+def test_load_model_rejects_unknown_backend():
+    """Test that a misconfigured backend fails loudly"""
+    with pytest.raises(ValueError):
+        load_model("yolov8n.pt", "tensorrt")
+
+def test_match_detections_pairs_boxes_by_class_and_iou():
+    """Test one-to-one matching of reference and exported model boxes"""
+    expected = create_detections([[0, 0, 10, 10], [20, 20, 40, 40], [50, 50, 60, 60]], [0, 1, 2], [0.9, 0.8, 0.7])
+    actual = create_detections([[21, 21, 40, 40], [0, 0, 10, 11], [50, 50, 60, 60]], [1, 0, 3], [0.75, 0.85, 0.7])
+
+    matches = match_detections(expected, actual)
+    assert len(matches) == 2
+    assert [diff for _, diff in sorted(matches)] == pytest.approx([0.05, 0.05])
+    assert all(iou > 0.8 for iou, _ in matches)
+
+def test_match_detections_empty():
+    """Test matching when either model found nothing"""
+    detections = create_detections([[0, 0, 10, 10]], [0], [0.9])
+    assert match_detections(sv.Detections.empty(), detections) == []
+    assert match_detections(detections, sv.Detections.empty()) == []
@@ -0,0 +1,52 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from benchmarks import summarize
+from benchmarks.compare import compare
+from benchmarks.corpus import build_corpus
+from benchmarks.fake_azure import create_app
+
+
+def test_summarize_reports_nearest_rank_percentiles():
+    """Test that percentiles are observed samples, in milliseconds"""
+    summary = summarize([i / 1000 for i in range(1, 101)])
+    assert summary["count"] == 100
+    assert summary["p50_ms"] == 50
+    assert summary["p95_ms"] == 95
+    assert summary["p99_ms"] == 99
+    assert summary["max_ms"] == 100
+    assert summarize([]) == {"count": 0}
+
+
+def test_corpus_is_deterministic():
+    """Test that the synthetic corpus is byte-identical between builds"""
+    first = build_corpus([(64, 48), (128, 96)])
+    assert [name for name, _ in first] == ["64x48", "128x96"]
+    assert first == build_corpus([(64, 48), (128, 96)])
+
+
+def test_compare_flags_slower_latency_and_lower_throughput():
+    """Test that regressions are detected in both directions beyond the threshold"""
+    baseline = {"results": {"detect": {"latency": {"p50_ms": 100, "p95_ms": 200}, "throughput_rps": 10}}}
+    candidate = {"results": {"detect": {"latency": {"p50_ms": 105, "p95_ms": 250}, "throughput_rps": 8}}}
+    rows = {row["metric"]: row for row in compare(baseline, candidate, threshold=0.1)}
+    assert not rows["detect.latency.p50_ms"]["regression"]
+    assert rows["detect.latency.p95_ms"]["regression"]
+    assert rows["detect.throughput_rps"]["regression"]
+
+
+def test_fake_azure_answers_and_streams():
+    """Test that the fake Azure server speaks the chat-completions format"""
+    client = TestClient(create_app(latency=0, token_delay=0, tokens=5))
+    url = "/openai/deployments/fake/chat/completions?api-version=2024-12-01-preview"
+
+    response = client.post(url, json={"messages": []})
+    assert response.status_code == 200
+    assert len(response.json()["choices"][0]["message"]["content"].split()) == 5
+
+    response = client.post(url, json={"messages": [], "stream": True})
+    events = [line[len("data: "):] for line in response.text.splitlines() if line.startswith("data: ")]
+    assert events[-1] == "[DONE]"
+    content = "".join(json.loads(event)["choices"][0]["delta"].get("content", "") for event in events[:-1])
+    assert len(content.split()) == 5
@@ -0,0 +1,92 @@
+import time
+
+from cache import AnswerCache, DetectionCache, DiskCacheBackend, MemoryCacheBackend, content_hash
+
+
+def test_memory_cache_evicts_least_recently_used():
+    """Test that the memory backend stays under its size cap in LRU order"""
+    cache = MemoryCacheBackend(ttl=60, max_bytes=10)
+    cache.set("a", b"1234")
+    cache.set("b", b"1234")
+    assert cache.get("a") == b"1234"
+
+    cache.set("c", b"1234")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1234"
+    assert cache.get("c") == b"1234"
+    assert cache.size_bytes() == 8
+
+
+def test_memory_cache_expires_entries():
+    """Test that entries are dropped after their TTL"""
+    cache = MemoryCacheBackend(ttl=0, max_bytes=100)
+    cache.set("a", b"value")
+    time.sleep(0.01)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_disk_cache_survives_restart(tmp_path):
+    """Test that the disk backend keeps entries across instances"""
+    cache = DiskCacheBackend(str(tmp_path), ttl=60, max_bytes=100)
+    cache.set("a", b"value")
+
+    reopened = DiskCacheBackend(str(tmp_path), ttl=60, max_bytes=100)
+    assert reopened.get("a") == b"value"
+    assert reopened.size_bytes() == 5
+
+
+def test_disk_cache_enforces_size_cap(tmp_path):
+    """Test that the disk backend evicts old entries once over its cap"""
+    cache = DiskCacheBackend(str(tmp_path), ttl=60, max_bytes=10)
+    cache.set("a", b"123456")
+    time.sleep(0.01)
+    cache.set("b", b"123456")
+    assert cache.get("a") is None
+    assert cache.get("b") == b"123456"
+    assert len(cache) == 1
+
+
+def test_detection_cache_keys_and_stats():
+    """Test that keys depend on content and version, and hits are counted"""
+    cache = DetectionCache(MemoryCacheBackend(ttl=60, max_bytes=1024))
+    key = DetectionCache.make_key(content_hash(b"image"), "v1")
+    assert key == DetectionCache.make_key(content_hash(b"image"), "v1")
+    assert key != DetectionCache.make_key(content_hash(b"image"), "v2")
+    assert key != DetectionCache.make_key(content_hash(b"other"), "v1")
+
+    assert cache.get(key) is None
+    cache.set(key, {"detected_items": {"Hammer": 2}})
+    assert cache.get(key) == {"detected_items": {"Hammer": 2}}
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+
+def test_answer_cache_key_normalizes_question():
+    """Test that trivially different phrasings of a question share a key"""
+    items = {"Hammer": 1, "Drill": 2}
+    key = AnswerCache.make_key("abc", "What will this cost?", items, "1")
+    assert key == AnswerCache.make_key("abc", "  what will   this COST ", {"Drill": 2, "Hammer": 1}, "1")
+    assert key != AnswerCache.make_key("abc", "What will this cost?", {"Hammer": 1}, "1")
+    assert key != AnswerCache.make_key("abc", "What will this cost?", items, "2")
+    assert key != AnswerCache.make_key("def", "What will this cost?", items, "1")
+
+
+def test_answer_cache_key_follows_prices():
+    """Test that a catalog price change gives the same question a new key"""
+    items = {"Hammer": 1}
+    old = AnswerCache.make_key("abc", "What will this cost?", items, "1", costs=[{"Hammer": 10.0}, 10.0])
+    assert old == AnswerCache.make_key("abc", "What will this cost?", items, "1", costs=[{"Hammer": 10.0}, 10.0])
+    assert old != AnswerCache.make_key("abc", "What will this cost?", items, "1", costs=[{"Hammer": 12.5}, 12.5])
+
+
+def test_answer_cache_bypass():
+    """Test that bypassed lookups skip the cache and are counted"""
+    cache = AnswerCache(MemoryCacheBackend(ttl=60, max_bytes=1024))
+    cache.set("key", {"answer": "42"})
+    assert cache.get("key", bypass=True) is None
+    assert cache.get("key") == {"answer": "42"}
+    assert cache.stats()["bypassed"] == 1
@@ -0,0 +1,89 @@
+import json
+import os
+import sqlite3
+import time
+
+from catalog import Catalog, load_snapshot
+from utils import calculate_costs
+
+
+def write_json_catalog(path, items):
+    with open(path, "w") as f:
+        json.dump(items, f)
+
+def test_lookup_is_case_insensitive_and_resolves_aliases(tmp_path):
+    """Test that items are found by any casing of their name or alias"""
+    path = tmp_path / "items.json"
+    write_json_catalog(path, [
+        {"object": "Hard Hat", "unit_cost": 20, "supplier": "https://example.com/hat", "aliases": ["helmet"]},
+        {"object": "Drill", "unit_cost": 80, "supplier": "https://example.com/drill"},
+    ])
+    snapshot = load_snapshot(str(path))
+
+    assert snapshot.lookup("hard hat")["object"] == "Hard Hat"
+    assert snapshot.lookup("HELMET")["object"] == "Hard Hat"
+    assert snapshot.lookup("drill")["unit_cost"] == 80.0
+    assert snapshot.lookup("saw") is None
+
+def test_duplicate_items_are_dropped(tmp_path):
+    """Test that a repeated item name keeps only its first entry"""
+    path = tmp_path / "items.json"
+    write_json_catalog(path, [
+        {"object": "Spray Foam", "unit_cost": 5, "supplier": "a"},
+        {"object": "spray foam", "unit_cost": 9, "supplier": "b"},
+    ])
+    snapshot = load_snapshot(str(path))
+    assert len(snapshot) == 1
+    assert snapshot.lookup("Spray Foam")["supplier"] == "a"
+
+def test_csv_and_sqlite_catalogs(tmp_path):
+    """Test loading catalogs from CSV and SQLite files"""
+    csv_path = tmp_path / "items.csv"
+    csv_path.write_text(
+        "object,category,unit_cost,supplier,aliases\n"
+        "Nails,Fasteners,3.5,https://example.com/nails,nail|brads\n"
+    )
+    assert load_snapshot(str(csv_path)).lookup("brads")["unit_cost"] == 3.5
+
+    db_path = tmp_path / "items.db"
+    connection = sqlite3.connect(db_path)
+    connection.execute("CREATE TABLE construction_items (object, category, unit_cost, supplier, aliases)")
+    connection.execute("INSERT INTO construction_items VALUES ('Saw', 'Tools', 25, 'https://example.com/saw', 'handsaw')")
+    connection.commit()
+    connection.close()
+    assert load_snapshot(str(db_path)).lookup("handsaw")["object"] == "Saw"
+
+def test_catalog_hot_reloads_on_change(tmp_path):
+    """Test that a changed file swaps in a new snapshot and a broken one is ignored"""
+    path = tmp_path / "items.json"
+    write_json_catalog(path, [{"object": "Drill", "unit_cost": 80, "supplier": "https://example.com/drill"}])
+    catalog = Catalog(str(path), reload_interval=0)
+    first = catalog.snapshot()
+
+    write_json_catalog(path, [{"object": "Drill", "unit_cost": 95, "supplier": "https://example.com/drill"}])
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 1_000_000_000))
+    second = catalog.snapshot()
+    assert second.version != first.version
+    assert second.lookup("drill")["unit_cost"] == 95.0
+    assert first.lookup("drill")["unit_cost"] == 80.0
+
+    path.write_text("{not json")
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 2_000_000_000))
+    assert catalog.snapshot() is second
+
+def test_calculate_costs_uses_catalog(tmp_path):
+    """Test cost calculation against catalog names and aliases"""
+    path = tmp_path / "items.json"
+    write_json_catalog(path, [
+        {"object": "Hard Hat", "unit_cost": 20, "supplier": "https://example.com/hat", "aliases": ["helmet"]},
+        {"object": "person", "unit_cost": 0, "supplier": ""},
+    ])
+    cost_breakdown, total_cost = calculate_costs({"helmet": 3, "person": 2}, load_snapshot(str(path)))
+    assert total_cost == 60.0
+    assert cost_breakdown == [{
+        "object": "Hard Hat",
+        "quantity": 3,
+        "unit_cost": 20.0,
+        "total_cost": 60.0,
+        "supplier": "https://example.com/hat"
+    }]
@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from coalesce import SingleFlight
+
+
+def test_concurrent_calls_share_one_computation():
+    """Test that callers arriving while a computation runs get its result without repeating it"""
+    async def scenario():
+        flights = SingleFlight()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"detected_items": {"Hammer": 1}}
+
+        results = await asyncio.gather(*[flights.do("image", compute) for _ in range(5)])
+        assert len(calls) == 1
+        assert all(result is results[0] for result in results)
+
+        # Finished keys run again (later calls are served by the caches instead)
+        await flights.do("image", compute)
+        assert len(calls) == 2
+        assert flights.stats()["coalesced"] == 4
+
+    asyncio.run(scenario())
+
+def test_errors_reach_every_caller():
+    """Test that a failed computation fails all of its callers and frees the key"""
+    async def scenario():
+        flights = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("corrupt image")
+
+        results = await asyncio.gather(*[flights.do("image", fail) for _ in range(3)], return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert flights.stats()["in_flight"] == 0
+
+        with pytest.raises(ValueError):
+            await flights.do("image", fail)
+
+    asyncio.run(scenario())
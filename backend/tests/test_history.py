@@ -0,0 +1,80 @@
+import pytest
+
+from history import HistoryStore, decode_cursor, encode_cursor
+
+
+def analysis(items):
+    """A minimal analysis result as produced by the detection pipeline"""
+    return {
+        "detected_items": items,
+        "cost_breakdown": [
+            {"object": name, "quantity": count, "unit_cost": 10.0, "total_cost": 10.0 * count, "supplier": ""}
+            for name, count in items.items()
+        ],
+        "total_cost": 10.0 * sum(items.values()),
+        "original_size": [640, 480],
+    }
+
+def test_records_are_written_in_batches(tmp_path):
+    """Test that queued records are written together and read back with their details"""
+    store = HistoryStore(str(tmp_path / "history.db"), batch_size=50, flush_ms=100)
+    for index in range(20):
+        store.record_detection("site-a", f"hash{index}", analysis({"Door": 2}), boxes=[])
+    store.record_answer("site-a", "hash0", analysis({"Door": 2}), "What will this cost?", "About $20")
+    store.flush()
+
+    stats = store.stats()
+    assert stats["written"] == 21
+    assert stats["batches"] < 21
+
+    records, _ = store.query(kind="answer")
+    assert [record["question"] for record in records] == ["What will this cost?"]
+    detail = store.get(records[0]["id"])
+    assert detail["answer"] == "About $20"
+    assert detail["cost_breakdown"][0]["object"] == "Door"
+    store.close()
+
+def test_keyset_pagination_visits_every_record_once(tmp_path):
+    """Test that following next_cursor walks all records newest first without repeats"""
+    store = HistoryStore(str(tmp_path / "history.db"))
+    for index in range(25):
+        store.record_detection(None, f"hash{index}", analysis({"Window": 1}))
+    store.flush()
+
+    seen, cursor = [], None
+    while True:
+        records, cursor = store.query(limit=10, cursor=cursor)
+        seen.extend(record["id"] for record in records)
+        if cursor is None:
+            break
+    assert len(seen) == 25
+    assert seen == sorted(seen, reverse=True)
+    store.close()
+
+def test_query_filters_by_project_and_item(tmp_path):
+    """Test that project and item filters select matching records (items case-insensitively)"""
+    store = HistoryStore(str(tmp_path / "history.db"))
+    store.record_detection("site-a", "hash1", analysis({"Door": 1, "Window": 3}))
+    store.record_detection("site-b", "hash2", analysis({"Door": 2}))
+    store.record_detection("site-a", "hash3", analysis({"Toilet": 1}))
+    store.flush()
+
+    assert [record["image_hash"] for record in store.query(project="site-a")[0]] == ["hash3", "hash1"]
+    assert [record["image_hash"] for record in store.query(item="door")[0]] == ["hash2", "hash1"]
+    assert [record["image_hash"] for record in store.query(project="site-b", item="Door")[0]] == ["hash2"]
+    store.close()
+
+def test_invalid_cursor_is_rejected():
+    """Test that cursors round-trip and malformed cursors raise ValueError"""
+    assert decode_cursor(encode_cursor(1700000000.25, 42)) == (1700000000.25, 42)
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+def test_disabled_store_discards_records():
+    """Test that a store without a path accepts and discards records"""
+    store = HistoryStore(None)
+    store.record_detection("site-a", "hash1", analysis({"Door": 1}))
+    store.flush()
+    store.close()
+    assert store.stats()["enabled"] is False
+    assert store.stats()["written"] == 0
@@ -0,0 +1,46 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from image_encoding import adaptive_quality, encode_image, negotiate_format, output_size
+
+
+def test_format_follows_accept_header():
+    """Test that WebP is chosen only when the client lists it at least as high as JPEG"""
+    assert negotiate_format(None) == "jpeg"
+    assert negotiate_format("*/*") == "jpeg"
+    assert negotiate_format("image/avif,image/webp,*/*;q=0.8") == "webp"
+    assert negotiate_format("application/json, image/webp") == "webp"
+    assert negotiate_format("image/jpeg, image/webp;q=0.5") == "jpeg"
+    assert negotiate_format("image/webp;q=0") == "jpeg"
+
+def test_quality_drops_with_pixel_count():
+    """Test that quality is kept up to 1 megapixel and lowered, to a floor, beyond"""
+    assert adaptive_quality((1000, 1000), quality=85, min_quality=65) == 85
+    assert adaptive_quality((2000, 1000), quality=85, min_quality=65) == 75
+    assert adaptive_quality((4000, 3000), quality=85, min_quality=65) == 65
+    assert adaptive_quality((4000, 3000), quality=85, min_quality=85) == 85
+
+def test_output_size_fits_max_side():
+    """Test that the longest side is capped with the aspect ratio kept"""
+    assert output_size((4000, 3000), 2048) == (2048, 1536)
+    assert output_size((800, 600), 2048) == (800, 600)
+    assert output_size((4000, 3000), 0) == (4000, 3000)
+
+@pytest.mark.parametrize("encoder", ["pil", "opencv"])
+def test_encode_image_from_array(encoder):
+    """Test that RGB arrays encode to JPEG and WebP with their colors and a capped size"""
+    pixels = np.zeros((300, 400, 3), dtype=np.uint8)
+    pixels[..., 0] = 255
+
+    jpeg = Image.open(io.BytesIO(encode_image(pixels, "jpeg", max_side=100, encoder=encoder)))
+    assert jpeg.format == "JPEG"
+    assert jpeg.size == (100, 75)
+    red, green, blue = jpeg.convert("RGB").getpixel((50, 37))
+    assert red > 240 and green < 15 and blue < 15
+
+    webp = Image.open(io.BytesIO(encode_image(Image.fromarray(pixels), "webp", encoder=encoder)))
+    assert webp.format == "WEBP"
+    assert webp.size == (400, 300)
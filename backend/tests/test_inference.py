@@ -0,0 +1,158 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from inference import BatchScheduler, InferencePool, InferenceQueueFull, InferenceWorker, SHARED_MEMORY_INITIAL_BYTES
+
+
+def test_replica_checked_out_by_one_call_at_a_time():
+    """Test that a replica is never used by two calls concurrently"""
+    in_use = set()
+    overlaps = []
+    lock = threading.Lock()
+
+    def work(replica, value):
+        with lock:
+            if replica in in_use:
+                overlaps.append(replica)
+            in_use.add(replica)
+        time.sleep(0.01)
+        with lock:
+            in_use.discard(replica)
+        return value * 2
+
+    async def run():
+        pool = InferencePool(["a", "b"], max_queue=10)
+        try:
+            return await asyncio.gather(*(pool.submit(work, i) for i in range(8)))
+        finally:
+            pool.shutdown()
+
+    results = asyncio.run(run())
+    assert results == [i * 2 for i in range(8)]
+    assert overlaps == []
+
+
+def test_queue_full_rejects_with_retry_after():
+    """Test that submissions beyond replicas + queue are rejected"""
+    release = threading.Event()
+
+    def block(replica):
+        release.wait(5)
+        return replica
+
+    async def run():
+        pool = InferencePool(["a"], max_queue=1, retry_after=7)
+        try:
+            first = asyncio.ensure_future(pool.submit(block))
+            second = asyncio.ensure_future(pool.submit(block))
+            await asyncio.sleep(0.05)
+            assert pool.stats()["queued"] == 1
+
+            with pytest.raises(InferenceQueueFull) as exc_info:
+                await pool.submit(block)
+            assert exc_info.value.retry_after == 7
+
+            release.set()
+            return await asyncio.gather(first, second)
+        finally:
+            pool.shutdown()
+
+    assert asyncio.run(run()) == ["a", "a"]
+
+
+def test_pool_requires_replicas():
+    """Test that an empty pool is rejected"""
+    with pytest.raises(ValueError):
+        InferencePool([])
+
+
+def test_batch_scheduler_groups_concurrent_requests():
+    """Test that concurrent submissions share one batch and get their own results"""
+    batches = []
+
+    def batch_fn(replica, items):
+        batches.append(list(items))
+        return [item * 10 for item in items]
+
+    async def run():
+        pool = InferencePool(["a"])
+        scheduler = BatchScheduler(pool, batch_fn, max_batch_size=4, max_wait_ms=50)
+        try:
+            results = await asyncio.gather(*(scheduler.submit(i) for i in range(6)))
+            return results, scheduler.stats()
+        finally:
+            pool.shutdown()
+
+    results, stats = asyncio.run(run())
+    assert results == [i * 10 for i in range(6)]
+    assert [len(batch) for batch in batches] == [4, 2]
+    assert stats["batches"] == 2
+    assert stats["items"] == 6
+    assert stats["batch_size_histogram"] == {2: 1, 4: 1}
+    assert stats["max_wait_ms_seen"] >= 0
+
+
+def test_batch_scheduler_propagates_errors():
+    """Test that a failed batch raises in every caller"""
+    def batch_fn(replica, items):
+        raise RuntimeError("boom")
+
+    async def run():
+        pool = InferencePool(["a"])
+        scheduler = BatchScheduler(pool, batch_fn, max_batch_size=2, max_wait_ms=10)
+        try:
+            return await asyncio.gather(scheduler.submit(1), scheduler.submit(2), return_exceptions=True)
+        finally:
+            pool.shutdown()
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_batch_scheduler_queue_full_rejects_with_retry_after():
+    """Test that submissions beyond the scheduler queue bound are rejected individually"""
+    def batch_fn(replica, items):
+        return [item * 10 for item in items]
+
+    async def run():
+        pool = InferencePool(["a"], retry_after=3)
+        scheduler = BatchScheduler(pool, batch_fn, max_batch_size=1, max_wait_ms=0, max_queue=2)
+        try:
+            # All four are queued before the collector first runs
+            results = await asyncio.gather(*(scheduler.submit(i) for i in range(4)), return_exceptions=True)
+            return results, scheduler.stats()
+        finally:
+            pool.shutdown()
+
+    results, stats = asyncio.run(run())
+    assert results[:2] == [0, 10]
+    assert all(isinstance(r, InferenceQueueFull) and r.retry_after == 3 for r in results[2:])
+    assert stats["items"] == 2
+    assert stats["queued"] == 0
+    assert stats["max_queue"] == 2
+
+
+def test_inference_worker_predicts_through_shared_memory():
+    """Test that a worker process returns compact detections for each image"""
+    worker = InferenceWorker("yolov8n.yaml")
+    try:
+        worker.wait_ready()
+        assert len(worker.names) == 80
+
+        images = [np.zeros((480, 640, 3), dtype=np.uint8), np.zeros((640, 480, 3), dtype=np.uint8)]
+        results = worker.predict(images, conf=0.25)
+        assert len(results) == 2
+        xyxy, confidence, class_id = results[0]
+        assert xyxy.shape[1] == 4
+        assert len(confidence) == len(class_id) == len(xyxy)
+
+        # A batch larger than the segment grows it
+        large = [np.zeros((2048, 2048, 3), dtype=np.uint8)] * 2
+        assert len(worker.predict(large)) == 2
+        assert worker._segment.size > SHARED_MEMORY_INITIAL_BYTES
+    finally:
+        worker.close()
@@ -0,0 +1,104 @@
+import asyncio
+import io
+import zipfile
+
+import numpy as np
+import pytest
+from fastapi import UploadFile
+from PIL import Image
+
+from intake import (
+    UploadRejected, check_image_header, is_zip_archive, list_zip_images, read_image_upload, read_zip_image, sniff_image
+)
+
+
+def encode_image(image_format, size=(120, 80), **params):
+    """Encode a random image in the given format"""
+    image = Image.fromarray(np.random.randint(0, 255, (size[1], size[0], 3), dtype=np.uint8))
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **params)
+    return buffer.getvalue()
+
+@pytest.mark.parametrize("image_format, params", [
+    ("JPEG", {}),
+    ("JPEG", {"progressive": True}),
+    ("PNG", {}),
+    ("GIF", {}),
+    ("BMP", {}),
+    ("WEBP", {}),
+    ("WEBP", {"lossless": True}),
+])
+def test_sniff_image_reads_format_and_size(image_format, params):
+    """Test that the header sniffer finds the format and dimensions"""
+    data = encode_image(image_format, **params)
+    assert sniff_image(data[:1024]) == (image_format, (120, 80))
+
+def test_sniff_image_skips_large_jpeg_metadata():
+    """Test that the JPEG frame header is found after a large EXIF segment"""
+    exif = Image.Exif()
+    exif[0x010E] = "x" * 60000
+    data = encode_image("JPEG", exif=exif.tobytes())
+    assert sniff_image(data[:1024]) is None
+    assert sniff_image(data[:70000]) == ("JPEG", (120, 80))
+
+def test_sniff_image_rejects_non_images():
+    """Test that unknown content is rejected from its first bytes"""
+    with pytest.raises(UploadRejected) as exc_info:
+        sniff_image(b"%PDF-1.7 not an image")
+    assert exc_info.value.status_code == 415
+
+def test_check_image_header_rejects_decompression_bomb():
+    """Test that images over the pixel budget are rejected from the header alone"""
+    data = encode_image("PNG", size=(100, 100))
+    assert check_image_header(data[:64], max_pixels=10000) == ("PNG", (100, 100))
+    with pytest.raises(UploadRejected) as exc_info:
+        check_image_header(data[:64], max_pixels=9999)
+    assert exc_info.value.status_code == 413
+
+def test_read_image_upload_enforces_byte_cap():
+    """Test that reading stops once the upload passes the byte cap"""
+    data = encode_image("BMP", size=(200, 200))
+
+    async def read(max_bytes):
+        return await read_image_upload(UploadFile(io.BytesIO(data)), max_bytes=max_bytes)
+
+    assert asyncio.run(read(len(data))) == data
+    with pytest.raises(UploadRejected) as exc_info:
+        asyncio.run(read(len(data) - 1))
+    assert exc_info.value.status_code == 413
+
+def test_read_image_upload_rejects_truncated_header():
+    """Test that a file too short to hold its dimensions is rejected"""
+    with pytest.raises(UploadRejected) as exc_info:
+        asyncio.run(read_image_upload(UploadFile(io.BytesIO(b"\x89PNG\r\n\x1a\n"))))
+    assert exc_info.value.status_code == 400
+
+def test_zip_images_listed_and_checked():
+    """Test that zip entries skip metadata files and get the same checks as uploads"""
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("photos/", b"")
+        zf.writestr("photos/one.png", encode_image("PNG"))
+        zf.writestr("photos/.DS_Store", b"metadata")
+        zf.writestr("__MACOSX/photos/._one.png", b"metadata")
+        zf.writestr("big.bmp", encode_image("BMP", size=(400, 300)))
+        zf.writestr("notes.txt", b"not an image at all")
+    assert is_zip_archive(archive.getvalue()[:4])
+
+    archive.seek(0)
+    zf, entries = list_zip_images(archive)
+    assert [entry.filename for entry in entries] == ["photos/one.png", "big.bmp", "notes.txt"]
+    assert read_zip_image(zf, entries[0]) == zf.read("photos/one.png")
+
+    with pytest.raises(UploadRejected) as error:
+        read_zip_image(zf, entries[1], max_bytes=100 * 1024)
+    assert error.value.status_code == 413
+    with pytest.raises(UploadRejected) as error:
+        read_zip_image(zf, entries[2])
+    assert error.value.status_code == 415
+
+def test_corrupt_zip_rejected():
+    """Test that a damaged archive is refused"""
+    with pytest.raises(UploadRejected) as error:
+        list_zip_images(io.BytesIO(b"PK\x03\x04" + b"\x00" * 100))
+    assert error.value.status_code == 400
@@ -0,0 +1,47 @@
+import asyncio
+
+import numpy as np
+import supervision as sv
+
+from live import ItemTracker, LatestFrame
+
+
+def frame_detections(offset: float) -> sv.Detections:
+    """Two items, shifted slightly as if the camera moved"""
+    return sv.Detections(
+        xyxy=np.array([[10, 10, 60, 60], [100, 100, 180, 160]], dtype=np.float32) + offset,
+        confidence=np.array([0.9, 0.8], dtype=np.float32),
+        class_id=np.array([0, 1])
+    )
+
+def test_latest_frame_drops_stale_frames():
+    """Test that only the newest waiting frame is handed out"""
+    async def scenario():
+        frames = LatestFrame()
+        for data in (b"1", b"2", b"3"):
+            frames.put(data)
+        assert await frames.get() == (3, b"3")
+        assert frames.dropped == 2
+
+        frames.put(b"4")
+        frames.close()
+        assert await frames.get() == (4, b"4")
+        assert await frames.get() is None
+
+    asyncio.run(scenario())
+
+def test_item_tracker_counts_items_once():
+    """Test that items tracked across frames are counted once and reported as new once"""
+    tracker = ItemTracker(["Hammer", "Drill"])
+    new_per_frame = []
+    for frame in range(5):
+        tracked, new_items = tracker.update(frame_detections(frame * 2))
+        new_per_frame.append(new_items)
+        assert len(tracked) == 2
+
+    assert sorted(item["object"] for item in new_per_frame[0]) == ["Drill", "Hammer"]
+    assert all(not new_items for new_items in new_per_frame[1:])
+    assert tracker.counts() == {"Hammer": 1, "Drill": 1}
+
+    tracker.reset()
+    assert tracker.counts() == {}
@@ -0,0 +1,58 @@
+from PIL import Image
+
+from llm_input import (
+    build_context, choose_detail, encode_vision_image, estimate_request_tokens, image_tokens, summarize_costs,
+    vision_size
+)
+
+
+def cost_line(name: str, quantity: int, unit_cost: float) -> dict:
+    return {
+        "object": name, "quantity": quantity, "unit_cost": unit_cost,
+        "total_cost": round(quantity * unit_cost, 2), "supplier": f"https://example.com/{name.lower()}"
+    }
+
+def test_token_estimate_counts_image_and_completion():
+    """Test that estimates include image tiles and the completion allowance"""
+    assert image_tokens((512, 512)) == 85 + 170
+    # Scaled to 768 px on the shortest side: 1365x768 is 3x2 tiles
+    assert image_tokens((4000, 2250)) == 85 + 170 * 6
+    assert image_tokens((4000, 2250), "low") == 85
+    assert estimate_request_tokens(["x" * 400], (512, 512), 1000) == 100 + 10 + 255 + 1000
+
+def test_vision_size_matches_what_the_model_sees():
+    """Test that images are downscaled to the vision size and snapped to fewer tiles when nearly free"""
+    assert vision_size((4000, 3000), "high") == (1024, 768)
+    assert vision_size((800, 600), "low") == (512, 384)
+    # 1100x700 is 3x2 tiles; 7% smaller it fits 2x2
+    width, height = vision_size((1100, 700), "high")
+    assert width <= 1024 and height <= 1024 and width / height > 1.5
+    assert image_tokens((width, height)) == 85 + 170 * 4
+
+    assert choose_detail((400, 300)) == "low"
+    assert choose_detail((1024, 768)) == "high"
+
+def test_encode_vision_image_downscales():
+    """Test that the encoded image has the vision size and the chosen detail"""
+    image = Image.new("RGB", (4000, 3000), "gray")
+    data, size, detail = encode_vision_image(image)
+    assert size == (1024, 768)
+    assert detail == "high"
+    assert len(data) < 100_000
+
+def test_context_stays_within_budget():
+    """Test that many cost lines are folded so the prompt stays within budget and totals add up"""
+    detected = {f"Item{i}": i + 1 for i in range(300)}
+    costs = [cost_line(f"Item{i}", i + 1, 10.0) for i in range(300)]
+    objects, cost_text = build_context(detected, costs, budget=500)
+
+    assert len(objects + cost_text) // 4 <= 520
+    assert objects.startswith("Item299 (300)")
+    assert cost_text.splitlines()[0].startswith("- Item299: 300 x $10.0")
+    folded = cost_text.splitlines()[-1]
+    shown = sum(float(line.split("= $")[1].split()[0]) for line in cost_text.splitlines())
+    assert "smaller items" in folded
+    assert round(shown, 2) == round(sum(item["total_cost"] for item in costs), 2)
+
+    few = [cost_line("Hammer", 2, 15.0)]
+    assert summarize_costs(few, budget=500) == "- Hammer: 2 x $15.0 = $30.0 (Supplier: https://example.com/hammer)"
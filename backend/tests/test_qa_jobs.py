@@ -0,0 +1,89 @@
+import asyncio
+
+import httpx
+import openai
+
+from qa_jobs import QAJobQueue, RateLimiter, TokenBucket, retry_delay
+
+
+def rate_limit_error(retry_after_ms: str) -> openai.RateLimitError:
+    """A 429 as raised by the OpenAI client"""
+    request = httpx.Request("POST", "https://example.openai.azure.com/openai/deployments/gpt/chat/completions")
+    response = httpx.Response(429, headers={"retry-after-ms": retry_after_ms}, request=request)
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+def test_token_bucket_waits_for_refill():
+    """Test that a drained bucket reports the time until enough tokens are back"""
+    bucket = TokenBucket(600)
+    assert bucket.wait_time(600) == 0
+    bucket.take(600)
+    assert 0.9 < bucket.wait_time(10) <= 1.0
+    # Requests larger than the bucket wait for a full bucket instead of forever
+    assert bucket.wait_time(10_000) <= 60
+
+def test_retry_delay_honours_retry_after():
+    """Test that 429s are retried no sooner than Retry-After and client errors are not retried"""
+    assert retry_delay(rate_limit_error("3000"), attempt=1) >= 3.0
+    assert retry_delay(ValueError("bad request"), attempt=1) is None
+
+def test_jobs_run_by_priority_and_retry_rate_limits():
+    """Test that queued jobs start by priority and a 429 is retried after its Retry-After"""
+    async def scenario():
+        queue = QAJobQueue(RateLimiter(60, 1_000_000), concurrency=1)
+        order = []
+        failures = [rate_limit_error("50")]
+
+        def job(name):
+            async def run():
+                order.append(name)
+                if name == "flaky" and failures:
+                    raise failures.pop()
+                await asyncio.sleep(0.01)
+                return name
+            return run
+
+        first = queue.submit(job("first"), 100)
+        await asyncio.sleep(0)
+        low = queue.submit(job("low"), 100, "low")
+        flaky = queue.submit(job("flaky"), 100, "normal")
+        high = queue.submit(job("high"), 100, "high")
+        assert queue.position(low) == 2
+
+        for submitted in (first, low, flaky, high):
+            await queue.wait(submitted, timeout=5)
+        await queue.close()
+
+        # The 429 holds back every job, so the retry and the low priority job become due together
+        assert order[:3] == ["first", "high", "flaky"]
+        assert sorted(order[3:]) == ["flaky", "low"]
+        assert flaky.status == "succeeded" and flaky.attempts == 2 and flaky.answer == "flaky"
+        assert queue.stats()["rate_limited"] == 1
+
+    asyncio.run(scenario())
+
+def test_duplicate_jobs_share_one_call():
+    """Test that jobs submitted with the key of an unfinished job join it"""
+    async def scenario():
+        queue = QAJobQueue(RateLimiter(60, 1_000_000))
+        calls = []
+
+        async def run():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        first = queue.submit(run, 100, key="image:question")
+        second = queue.submit(run, 100, "high", key="image:question")
+        assert second is first
+        await queue.wait(first, timeout=5)
+
+        assert queue.join("image:question") is None
+        third = queue.submit(run, 100, key="image:question")
+        await queue.wait(third, timeout=5)
+        await queue.close()
+
+        assert third is not first
+        assert len(calls) == 2
+        assert queue.stats()["coalesced"] == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,41 @@
+import base64
+import json
+from datetime import datetime
+
+import numpy as np
+
+from responses import dump_json, dump_msgpack, load_msgpack, render_response, wants_msgpack
+
+
+def test_accept_negotiation_prefers_json_on_ties():
+    """Test that MessagePack is chosen only when the client ranks it above JSON"""
+    assert not wants_msgpack(None)
+    assert not wants_msgpack("*/*")
+    assert wants_msgpack("application/msgpack")
+    assert wants_msgpack("application/x-msgpack, application/json;q=0.5")
+    assert not wants_msgpack("application/msgpack;q=0.5, application/json")
+    assert not wants_msgpack("application/msgpack, */*")
+
+def test_binary_fields_are_base64_in_json_and_raw_in_msgpack():
+    """Test that bytes are base64-encoded for JSON and kept as bytes in MessagePack"""
+    payload = {
+        "annotated_image": b"\xff\xd8jpeg",
+        "confidence": np.float32(0.5),
+        "timestamp": datetime(2024, 1, 2, 3, 4, 5, 678),
+    }
+    decoded = json.loads(dump_json(payload))
+    assert base64.b64decode(decoded["annotated_image"]) == b"\xff\xd8jpeg"
+    assert decoded["confidence"] == 0.5
+    assert decoded["timestamp"] == "2024-01-02T03:04:05.000678"
+
+    unpacked = load_msgpack(dump_msgpack(payload))
+    assert unpacked["annotated_image"] == b"\xff\xd8jpeg"
+    assert unpacked["timestamp"] == decoded["timestamp"]
+
+def test_render_response_sets_content_type_and_vary():
+    """Test that the negotiated format sets the content type and varies on Accept"""
+    response = render_response({"success": True}, "application/msgpack", headers={"Idempotent-Replayed": "true"})
+    assert response.media_type == "application/msgpack"
+    assert response.headers["vary"] == "Accept"
+    assert response.headers["idempotent-replayed"] == "true"
+    assert render_response({"success": True}, None).media_type == "application/json"
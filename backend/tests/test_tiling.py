@@ -0,0 +1,49 @@
+import numpy as np
+import supervision as sv
+
+from tiling import merge_tile_detections, should_tile, slice_image, tile_origins
+
+
+def test_tile_origins_cover_the_axis_with_overlap():
+    """Test that tiles start at 0, end at the edge and overlap by at least the configured share"""
+    origins = tile_origins(2000, tile=640, overlap=0.2)
+    assert origins[0] == 0
+    assert origins[-1] == 2000 - 640
+    assert all(b - a <= 640 * 0.8 for a, b in zip(origins, origins[1:]))
+    assert tile_origins(500, tile=640) == [0]
+
+def test_slice_image_offsets_match_tiles():
+    """Test that every tile holds the pixels at its offset"""
+    image = np.random.randint(0, 255, (1000, 1500, 3), dtype=np.uint8)
+    tiles = slice_image(image, tile=640, overlap=0.25)
+    assert len(tiles) == 2 * 3
+    for tile, (x, y) in tiles:
+        assert tile.shape == (640, 640, 3)
+        assert np.array_equal(tile, image[y:y + 640, x:x + 640])
+
+def test_merge_joins_items_cut_by_tile_edges():
+    """Test that both halves of an item cut by a tile edge become one box, and other classes are kept"""
+    left = sv.Detections(
+        xyxy=np.array([[600, 100, 640, 140], [10, 10, 20, 20]], dtype=np.float32),
+        confidence=np.array([0.9, 0.6], dtype=np.float32),
+        class_id=np.array([1, 2])
+    )
+    right = sv.Detections(
+        xyxy=np.array([[100, 100, 150, 140], [90, 102, 118, 138]], dtype=np.float32),
+        confidence=np.array([0.8, 0.7], dtype=np.float32),
+        class_id=np.array([1, 3])
+    )
+    merged = merge_tile_detections([left, right], [(0, 0), (512, 0)], threshold=0.5)
+    boxes = {int(class_id): xyxy.tolist() for xyxy, class_id in zip(merged.xyxy, merged.class_id)}
+    assert len(merged) == 3
+    assert boxes[1] == [600, 100, 662, 140]
+    assert boxes[3] == [602, 102, 630, 138]
+    assert len(merge_tile_detections([sv.Detections.empty()], [(0, 0)])) == 0
+
+def test_should_tile_modes():
+    """Test that an explicit choice wins and auto mode tiles only large images"""
+    assert should_tile((8000, 6000), requested=False, mode="on") is False
+    assert should_tile((640, 480), requested=True, mode="off") is True
+    assert should_tile((8000, 6000), mode="auto")
+    assert not should_tile((1280, 960), mode="auto")
+    assert not should_tile((8000, 6000), mode="off")
@@ -0,0 +1,44 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from utils import decode_image, scale_boxes
+
+
+def create_jpeg(width, height, orientation=None, mode="RGB"):
+    """Create JPEG bytes, optionally with an EXIF orientation tag"""
+    image = Image.fromarray(np.random.randint(0, 255, (height, width, 3), dtype=np.uint8)).convert(mode)
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", exif=exif.tobytes())
+    return buffer.getvalue()
+
+def test_decode_image_downscales_large_jpeg():
+    """Test that large images are decoded close to the target size"""
+    image, original_size = decode_image(create_jpeg(4000, 3000), max_size=1000)
+    assert image.size == (1000, 750)
+    assert image.mode == "RGB"
+    assert original_size == (4000, 3000)
+
+def test_decode_image_applies_exif_orientation():
+    """Test that rotated photos come out upright with the original size swapped"""
+    image, original_size = decode_image(create_jpeg(400, 200, orientation=6), max_size=1000)
+    assert image.size == (200, 400)
+    assert original_size == (200, 400)
+
+def test_decode_image_converts_mode_once():
+    """Test that grayscale uploads are converted to RGB"""
+    image, _ = decode_image(create_jpeg(100, 80, mode="L"), max_size=1000)
+    assert image.mode == "RGB"
+    assert image.size == (100, 80)
+
+def test_scale_boxes_maps_to_original_size():
+    """Test mapping boxes from the decoded size back to the original size"""
+    boxes = {"xyxy": [[10, 20, 30, 40]], "confidence": [0.9], "class_id": [1]}
+    scaled = scale_boxes(boxes, (100, 50), (400, 100))
+    assert scaled["xyxy"] == [[40, 40, 120, 80]]
+    assert scaled["class_id"] == [1]
+    assert scale_boxes(boxes, (100, 50), (100, 50)) is boxes
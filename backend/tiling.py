@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import io
+import logging
+import os
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from utils import IMAGE_DECODE_MAX_SIZE, decode_image
+
+if TYPE_CHECKING:
+    import supervision as sv
+
+logger = logging.getLogger(__name__)
+
+# Tiled inference configuration: off, on or auto (tile large images only)
+TILED_INFERENCE = os.getenv("TILED_INFERENCE", "off").lower()
+TILE_SIZE = int(os.getenv("TILE_SIZE", "640"))
+TILE_OVERLAP = float(os.getenv("TILE_OVERLAP", "0.2"))
+# In auto mode, images whose longest side is at least this many pixels are tiled
+TILE_AUTO_MIN_SIDE = int(os.getenv("TILE_AUTO_MIN_SIDE", "2048"))
+# Tiled images are decoded up to this size instead of IMAGE_DECODE_MAX_SIZE; bounds memory and tile count
+TILE_DECODE_MAX_SIZE = int(os.getenv("TILE_DECODE_MAX_SIZE", "4096"))
+# Boxes of one class whose intersection covers this share of the smaller box are merged
+TILE_MERGE_THRESHOLD = float(os.getenv("TILE_MERGE_THRESHOLD", "0.5"))
+# Also run the whole image once, so items larger than a tile are found in one piece
+TILE_FULL_PASS = os.getenv("TILE_FULL_PASS", "true").lower() in ("1", "true", "yes")
+
+
+def tiling_mode(requested: Optional[bool] = None) -> str:
+    """
+    Get the tiling mode for a request: its explicit choice, or the configured mode
+    """
+    if requested is not None:
+        return "on" if requested else "off"
+    return TILED_INFERENCE
+
+
+def tiling_version(mode: str) -> str:
+    """
+    Describe a tiling mode and the settings that change its results, for cache keys
+    """
+    if mode == "off":
+        return "off"
+    return f"{mode}/{TILE_SIZE}/{TILE_OVERLAP}/{TILE_AUTO_MIN_SIDE}/{TILE_DECODE_MAX_SIZE}/{TILE_MERGE_THRESHOLD}/{TILE_FULL_PASS}"
+
+
+def should_tile(size: Tuple[int, int], requested: Optional[bool] = None, mode: str = TILED_INFERENCE) -> bool:
+    """
+    Decide whether to tile an image of the given original size.
+
+    An explicit per-request choice wins; otherwise the configured mode decides,
+    and auto mode tiles images large enough that small items would vanish when
+    the whole image is scaled down to the model input.
+    """
+    if requested is not None:
+        return requested
+    if mode == "auto":
+        return max(size) >= TILE_AUTO_MIN_SIDE
+    return mode == "on"
+
+
+def decode_for_detection(image_data: bytes, tiled: Optional[bool] = None) -> Tuple[Image.Image, Tuple[int, int]]:
+    """
+    Decode an upload at the resolution its detection mode needs.
+
+    Tiled images keep up to TILE_DECODE_MAX_SIZE pixels, others are reduced to
+    IMAGE_DECODE_MAX_SIZE. Returns the image and the original size.
+    """
+    # Reads the header only; the pixels are decoded once below
+    with Image.open(io.BytesIO(image_data)) as probe:
+        size = probe.size
+    max_size = TILE_DECODE_MAX_SIZE if should_tile(size, tiled) else IMAGE_DECODE_MAX_SIZE
+    return decode_image(image_data, max_size)
+
+
+def tile_origins(length: int, tile: int = TILE_SIZE, overlap: float = TILE_OVERLAP) -> List[int]:
+    """
+    Get tile start positions along one axis, evenly spread so the last tile ends at the edge
+    """
+    if length <= tile:
+        return [0]
+    stride = max(1, int(tile * (1 - overlap)))
+    count = -(-(length - tile) // stride) + 1
+    return [round(i * (length - tile) / (count - 1)) for i in range(count)]
+
+
+def slice_image(image: np.ndarray, tile: int = TILE_SIZE, overlap: float = TILE_OVERLAP) -> List[Tuple[np.ndarray, Tuple[int, int]]]:
+    """
+    Slice an image into overlapping tiles; returns each tile with its (x, y) offset
+    """
+    height, width = image.shape[:2]
+    return [
+        (np.ascontiguousarray(image[y:y + tile, x:x + tile]), (x, y))
+        for y in tile_origins(height, tile, overlap)
+        for x in tile_origins(width, tile, overlap)
+    ]
+
+
+def image_tiles(image: np.ndarray) -> List[Tuple[np.ndarray, Tuple[int, int]]]:
+    """
+    Get the tiles to run for an image, plus the whole image if TILE_FULL_PASS is set
+    """
+    tiles = slice_image(image)
+    if TILE_FULL_PASS and len(tiles) > 1:
+        tiles.append((image, (0, 0)))
+    return tiles
+
+
+def merge_tile_detections(
+    detections: List[sv.Detections], offsets: List[Tuple[int, int]], threshold: float = TILE_MERGE_THRESHOLD
+) -> sv.Detections:
+    """
+    Move per-tile detections into image coordinates and merge duplicates across tiles.
+
+    Greedy non-maximum merging per class, highest confidence first: a box
+    absorbs every remaining box whose intersection covers at least threshold
+    of the smaller one, growing to their union. Halves of an item cut by a
+    tile edge are thereby joined into one box rather than counted twice, which
+    plain IoU suppression would miss.
+    """
+    import supervision as sv
+
+    xyxy, confidence, class_id = [], [], []
+    for tile_detections, (x, y) in zip(detections, offsets):
+        if len(tile_detections) == 0:
+            continue
+        xyxy.append(tile_detections.xyxy + np.array([x, y, x, y], dtype=np.float32))
+        confidence.append(tile_detections.confidence)
+        class_id.append(tile_detections.class_id)
+    if not xyxy:
+        return sv.Detections.empty()
+
+    xyxy = np.concatenate(xyxy)
+    confidence = np.concatenate(confidence)
+    class_id = np.concatenate(class_id)
+    areas = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+
+    merged_xyxy, merged_confidence, merged_class_id = [], [], []
+    remaining = np.argsort(-confidence)
+    while len(remaining):
+        best, rest = remaining[0], remaining[1:]
+        same_class = rest[class_id[rest] == class_id[best]]
+
+        top_left = np.maximum(xyxy[best, :2], xyxy[same_class, :2])
+        bottom_right = np.minimum(xyxy[best, 2:], xyxy[same_class, 2:])
+        intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=1)
+        smaller = np.maximum(np.minimum(areas[best], areas[same_class]), 1e-6)
+        absorbed = same_class[intersection / smaller >= threshold]
+
+        group = np.concatenate([[best], absorbed])
+        merged_xyxy.append(np.concatenate([xyxy[group, :2].min(axis=0), xyxy[group, 2:].max(axis=0)]))
+        merged_confidence.append(confidence[best])
+        merged_class_id.append(class_id[best])
+        remaining = rest[~np.isin(rest, absorbed)]
+
+    return sv.Detections(
+        xyxy=np.array(merged_xyxy, dtype=np.float32),
+        confidence=np.array(merged_confidence, dtype=np.float32),
+        class_id=np.array(merged_class_id, dtype=int)
+    )
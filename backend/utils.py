@@ -1,21 +1,39 @@
+from __future__ import annotations
+
 import base64
 import io
 import logging
-from PIL import Image
+import os
+from PIL import Image, ImageOps
 import numpy as np
-from typing import Dict, List, Tuple, Optional
-import cv2
+from typing import TYPE_CHECKING, Dict, List, Tuple, Optional
+
+from catalog import CatalogSnapshot
+
+if TYPE_CHECKING:
+    import supervision as sv
 
 logger = logging.getLogger(__name__)
 
+# Longest side of decoded uploads; YOLO resizes to 640 anyway
+IMAGE_DECODE_MAX_SIZE = int(os.getenv("IMAGE_DECODE_MAX_SIZE", "1024"))
+
+EXIF_ORIENTATION = 0x0112
+
+def image_to_jpeg(image: Image.Image, quality: int = 85) -> bytes:
+    """
+    Encode PIL image as JPEG bytes
+    """
+    buffered = io.BytesIO()
+    image.save(buffered, format="JPEG", quality=quality)
+    return buffered.getvalue()
+
 def image_to_base64(image: Image.Image) -> str:
     """
     Convert PIL image to base64 string
     """
     try:
-        buffered = io.BytesIO()
-        image.save(buffered, format="JPEG", quality=85)
-        img_str = base64.b64encode(buffered.getvalue()).decode()
+        img_str = base64.b64encode(image_to_jpeg(image)).decode()
         return img_str
     except Exception as e:
         logger.error(f"Error converting image to base64: {e}")
@@ -33,6 +51,42 @@ def base64_to_image(base64_string: str) -> Image.Image:
         logger.error(f"Error converting base64 to image: {e}")
         raise
 
+def detections_to_boxes(detections: sv.Detections) -> Dict[str, list]:
+    """
+    Convert detections to a JSON-serializable dict of boxes
+    """
+    return {
+        "xyxy": detections.xyxy.tolist(),
+        "confidence": detections.confidence.tolist() if detections.confidence is not None else [],
+        "class_id": detections.class_id.tolist() if detections.class_id is not None else []
+    }
+
+def boxes_to_detections(boxes: Dict[str, list]) -> sv.Detections:
+    """
+    Convert a dict of boxes back to detections
+    """
+    import supervision as sv
+    if not boxes["xyxy"]:
+        return sv.Detections.empty()
+    return sv.Detections(
+        xyxy=np.array(boxes["xyxy"], dtype=np.float32),
+        confidence=np.array(boxes["confidence"], dtype=np.float32),
+        class_id=np.array(boxes["class_id"], dtype=int)
+    )
+
+def format_boxes(boxes: Dict[str, list], class_names: List[str]) -> List[Dict]:
+    """
+    Convert a dict of boxes into one entry per detection with its class name
+    """
+    return [
+        {
+            "object": class_names[class_id] if class_id < len(class_names) else str(class_id),
+            "confidence": round(confidence, 4),
+            "xyxy": [round(coordinate, 1) for coordinate in xyxy]
+        }
+        for xyxy, confidence, class_id in zip(boxes["xyxy"], boxes["confidence"], boxes["class_id"])
+    ]
+
 def resize_image(image: Image.Image, max_size: int = 1024) -> Image.Image:
     """
     Resize image while maintaining aspect ratio
@@ -55,6 +109,43 @@ def resize_image(image: Image.Image, max_size: int = 1024) -> Image.Image:
         logger.error(f"Error resizing image: {e}")
         return image
 
+def decode_image(image_data: bytes, max_size: int = IMAGE_DECODE_MAX_SIZE) -> Tuple[Image.Image, Tuple[int, int]]:
+    """
+    Decode an uploaded image at reduced resolution.
+    
+    JPEGs are decoded directly at 1/2, 1/4 or 1/8 scale where possible, EXIF
+    orientation is applied and the result is converted to RGB once and
+    downscaled so its longest side is at most max_size. Returns the image and
+    the original (oriented) size so boxes can be mapped back when needed.
+    """
+    image = Image.open(io.BytesIO(image_data))
+    width, height = image.size
+    if image.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8):
+        original_size = (height, width)
+    else:
+        original_size = (width, height)
+    
+    # Ask the decoder for the smallest scale that keeps the longest side >= max_size
+    longest = max(width, height)
+    if longest > max_size:
+        image.draft("RGB", (-(-width * max_size // longest), -(-height * max_size // longest)))
+    
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    
+    return resize_image(image, max_size), original_size
+
+def scale_boxes(boxes: Dict[str, list], from_size: Tuple[int, int], to_size: Tuple[int, int]) -> Dict[str, list]:
+    """
+    Map box coordinates from one image size to another
+    """
+    if tuple(from_size) == tuple(to_size) or not boxes["xyxy"]:
+        return boxes
+    
+    scale = np.array([to_size[0] / from_size[0], to_size[1] / from_size[1]] * 2)
+    return {**boxes, "xyxy": (np.array(boxes["xyxy"]) * scale).tolist()}
+
 def validate_image_file(file_content: bytes, max_size_mb: int = 10) -> bool:
     """
     Validate uploaded image file
@@ -72,7 +163,7 @@ def validate_image_file(file_content: bytes, max_size_mb: int = 10) -> bool:
         logger.error(f"Image validation failed: {e}")
         return False
 
-def calculate_costs(detected_items: Dict[str, int], construction_items: List[Dict]) -> Tuple[List[Dict], float]:
+def calculate_costs(detected_items: Dict[str, int], catalog: CatalogSnapshot) -> Tuple[List[Dict], float]:
     """
     Calculate cost breakdown for detected items
     """
@@ -81,14 +172,10 @@ def calculate_costs(detected_items: Dict[str, int], construction_items: List[Dic
     
     try:
         for item_name, quantity in detected_items.items():
-            # Find matching item in database
-            matching_items = [
-                item for item in construction_items 
-                if item["object"].lower() == item_name.lower()
-            ]
+            # Find matching item (by name or alias) in the catalog
+            item = catalog.lookup(item_name)
             
-            if matching_items:
-                item = matching_items[0]
+            if item:
                 if item["unit_cost"] > 0 and item["supplier"]:
                     cost = item["unit_cost"] * quantity
                     total_cost += cost
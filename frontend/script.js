@@ -452,7 +452,7 @@ async function askQuestion() {
         formData.append('file', file);
         formData.append('question', question);
         
-        const apiResponse = await fetch(`${API_BASE_URL}/qa`, {
+        const apiResponse = await fetch(`${API_BASE_URL}/qa/stream`, {
             method: 'POST',
             body: formData
         });
@@ -461,13 +461,20 @@ async function askQuestion() {
             throw new Error(`HTTP error! status: ${apiResponse.status}`);
         }
         
-        const data = await apiResponse.json();
-        
-        if (data.success) {
-            displayAnswer(data.answer);
-        } else {
-            throw new Error(data.error || 'Failed to get answer');
-        }
+        // Render the answer as tokens arrive
+        let answer = '';
+        await readEventStream(apiResponse, (event, data) => {
+            if (event === 'error') {
+                throw new Error(data.error || 'Failed to get answer');
+            }
+            if (data.delta) {
+                if (!answer) {
+                    hideQALoading();
+                }
+                answer += data.delta;
+                displayAnswer(answer);
+            }
+        });
         
     } catch (error) {
         console.error('Error asking question:', error);
@@ -477,6 +484,33 @@ async function askQuestion() {
     }
 }
 
+// Read a Server-Sent Events response, calling onEvent(event, data) for each event
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let event = 'message';
+            let data = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                if (line.startsWith('data: ')) data += line.slice(6);
+            });
+            onEvent(event, data ? JSON.parse(data) : {});
+        }
+    }
+}
+
 // UI functions
 function showLoading() {
     document.getElementById('resultsSection').style.display = 'block';